@@ -10,23 +10,73 @@ class Config:
         self.missing = [key for key in self.keys if not os.getenv(key)]
         if self.missing:
             raise ValueError(f"❌ Отсутствуют переменные в .env: {', '.join(self.missing)}")
+        if os.getenv("BOT_MODE", "polling").lower() == "webhook":
+            self.missing = [key for key in ("WEBHOOK_URL", "WEBHOOK_SECRET") if not os.getenv(key)]
+            if self.missing:
+                raise ValueError(f"❌ BOT_MODE=webhook требует переменные: {', '.join(self.missing)}")
     def get_config(self):
         raw_admins = os.getenv("ADMIN_IDS", "")
         admin_ids = {int(x) for x in raw_admins.split(",") if x.strip().isdigit()}
         raw_groups = os.getenv("ALLOWED_GROUP_IDS", "")
         allowed_group_ids = {int(x) for x in raw_groups.split(",") if x.strip().lstrip("-").isdigit()}
+        # Свой telegram-bot-api в режиме --local: файлы до 2000 МБ вместо 50
+        local_api = bool(os.getenv("TELEGRAM_API_URL")) and os.getenv("TELEGRAM_API_LOCAL", "true").lower() in ("1", "true", "yes")
 
         return {
             "BOT_TOKEN": os.getenv("TOKEN"),
             "API_KEY_JWT": os.getenv("API_KEY_JWT"),
             "HOST": os.getenv("HOST", "0.0.0.0"),
             "PORT": int(os.getenv("PORT", 8000)),
+            "METRICS_PORT": int(os.getenv("METRICS_PORT", 0)),  # /metrics бота и воркера; 0 — выключено
             "ADMIN_IDS": admin_ids,
+            "BOT_MODE": os.getenv("BOT_MODE", "polling").lower(),  # polling | webhook
+            "WEBHOOK_URL": os.getenv("WEBHOOK_URL"),  # публичный https-адрес HTTP API
+            "WEBHOOK_PATH": os.getenv("WEBHOOK_PATH", "/telegram/webhook"),
+            "WEBHOOK_SECRET": os.getenv("WEBHOOK_SECRET"),
             "DOWNLOAD_DIR": os.getenv("DOWNLOAD_DIR", "/app/downloads"),
+            "DOWNLOAD_WORKERS": int(os.getenv("DOWNLOAD_WORKERS", 4)),
+            "DOWNLOAD_QUEUE_SIZE": int(os.getenv("DOWNLOAD_QUEUE_SIZE", 100)),
+            "DOWNLOAD_STREAMING": os.getenv("DOWNLOAD_STREAMING", "false").lower() in ("1", "true", "yes"),
+            "STAGING_MEMORY_DIR": os.getenv("STAGING_MEMORY_DIR", "/dev/shm/hidden_protocol"),
+            "STAGING_MEMORY_MB": int(os.getenv("STAGING_MEMORY_MB", 0)),  # 0 — выключено
+            "STAGING_MAX_FILE_MB": int(os.getenv("STAGING_MAX_FILE_MB", 15)),
+            "DOWNLOAD_MAX_MB": int(os.getenv("DOWNLOAD_MAX_MB", 2000 if local_api else 50)),  # 0 — без выбора формата по размеру
+            "DOWNLOAD_FASTSTART": os.getenv("DOWNLOAD_FASTSTART", "true").lower() in ("1", "true", "yes"),
+            "DOWNLOAD_EXECUTOR": os.getenv("DOWNLOAD_EXECUTOR", "thread").lower(),  # thread | process
+            "DOWNLOAD_RETRIES": int(os.getenv("DOWNLOAD_RETRIES", 2)),  # повторы после таймаута, сетевой ошибки, 429, 5xx
+            "DOWNLOAD_RETRY_BASE": float(os.getenv("DOWNLOAD_RETRY_BASE", 1.0)),  # первая пауза, с; дальше ×2 с джиттером
+            "DOWNLOAD_CIRCUIT_FAILURES": int(os.getenv("DOWNLOAD_CIRCUIT_FAILURES", 5)),  # сбоев подряд до размыкания
+            "DOWNLOAD_CIRCUIT_COOLDOWN": float(os.getenv("DOWNLOAD_CIRCUIT_COOLDOWN", 30)),  # с до пробной загрузки
             "TOPIC_CHAT_ID": int(os.getenv("TOPIC_CHAT_ID")) if os.getenv("TOPIC_CHAT_ID") else None,
             "TOPIC_THREAD_ID": int(os.getenv("TOPIC_THREAD_ID")) if os.getenv("TOPIC_THREAD_ID") else None,
             "LOG_LEVEL": os.getenv("LOG_LEVEL", "INFO"),
+            "LOG_FORMAT": os.getenv("LOG_FORMAT", "text").lower(),  # text | json
+            "LOG_BACKUP_DAYS": int(os.getenv("LOG_BACKUP_DAYS", 14)),
+            "TRACE_EXPORT_FILE": os.getenv("TRACE_EXPORT_FILE"),  # OTLP/JSON, трасса на строку
+            "TRACE_OTLP_ENDPOINT": os.getenv("TRACE_OTLP_ENDPOINT"),  # например http://otel-collector:4318/v1/traces
             "LOG_CHAT_ID": int(os.getenv("LOG_CHAT_ID")) if os.getenv("LOG_CHAT_ID") else None,
             "LOG_THREAD_ID": int(os.getenv("LOG_THREAD_ID")) if os.getenv("LOG_THREAD_ID") else None,
             "ALLOWED_GROUP_IDS": allowed_group_ids,  # set[int]
+            "REDIS_URL": os.getenv("REDIS_URL"),
+            "FILE_ID_CACHE_BACKEND": os.getenv("FILE_ID_CACHE_BACKEND", "memory"),  # memory | sqlite | redis
+            "FILE_ID_CACHE_SIZE": int(os.getenv("FILE_ID_CACHE_SIZE", 1024)),
+            "FILE_ID_CACHE_PATH": os.getenv("FILE_ID_CACHE_PATH", "/app/cache/file_ids.sqlite3"),
+            "FILE_ID_CACHE_TTL": int(os.getenv("FILE_ID_CACHE_TTL")) if os.getenv("FILE_ID_CACHE_TTL") else None,
+            "JOB_QUEUE_BACKEND": os.getenv("JOB_QUEUE_BACKEND", "local"),  # local | redis
+            "JOB_VISIBILITY_TIMEOUT": int(os.getenv("JOB_VISIBILITY_TIMEOUT", 600)),
+            "JOB_MAX_ATTEMPTS": int(os.getenv("JOB_MAX_ATTEMPTS", 3)),
+            "JOB_RETRY_BASE": float(os.getenv("JOB_RETRY_BASE", 10.0)),  # пауза перед 2-й попыткой, с; дальше ×2 с джиттером
+            "JOB_RETRY_MAX": float(os.getenv("JOB_RETRY_MAX", 300.0)),
+            "JOB_RESULT_TTL": int(os.getenv("JOB_RESULT_TTL", 86400)),  # сколько хранить статус выполненного задания
+            "SHORTLINK_CACHE_TTL": int(os.getenv("SHORTLINK_CACHE_TTL", 86400)),
+            # Лимиты отправки в Telegram
+            "TG_RATE_BACKEND": os.getenv("TG_RATE_BACKEND", "local").lower(),  # local | redis (общие с API/воркерами)
+            "TG_RATE_GLOBAL": float(os.getenv("TG_RATE_GLOBAL", 30)),  # сообщений/с на бота
+            "TG_RATE_GROUP_PER_MIN": float(os.getenv("TG_RATE_GROUP_PER_MIN", 20)),  # в одну группу/канал
+            "TG_RATE_PRIVATE": float(os.getenv("TG_RATE_PRIVATE", 1)),  # сообщений/с в один ЛС
+            "BROADCAST_MAX_ITEMS": int(os.getenv("BROADCAST_MAX_ITEMS", 1000)),
+            # Свой сервер Bot API вместо api.telegram.org, например http://telegram-bot-api:8081
+            "TELEGRAM_API_URL": os.getenv("TELEGRAM_API_URL"),
+            "TELEGRAM_API_LOCAL": local_api,  # сервер с --local: видео отдаём путём к файлу
+            "TELEGRAM_API_FILES_DIR": os.getenv("TELEGRAM_API_FILES_DIR"),  # DOWNLOAD_DIR, как его видит сервер
         }
\ No newline at end of file
@@ -1,18 +1,57 @@
 from __future__ import annotations
-from typing import Annotated
+import asyncio
+import json
+import secrets
+import time
+from typing import Annotated, Set
 
-from aiogram import Bot
 from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
-from fastapi import Depends, FastAPI, Header, HTTPException, status
+from aiogram.types import Update
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from app.config import Config
+from app.services.broadcast import Broadcaster
+from app.services.job_queue import LocalJobStore, RedisJobQueue, job_view, send_callback
 from app.utils.logger import setup_logger
+from app.utils.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, JOBS_SUBMITTED, REGISTRY
+from app.utils.rate_limit import install_rate_limiter
+from app.utils.telegram_api import LocalFiles, create_bot
+from app.utils.tracing import new_trace_id
+from app.utils.urls import first_url, is_allowed_url
 
 
 cfg = Config().get_config()
-log = setup_logger(cfg.get("LOG_LEVEL", "INFO"))
-bot = Bot(token=cfg["BOT_TOKEN"])
+log = setup_logger(cfg.get("LOG_LEVEL", "INFO"), cfg["LOG_FORMAT"], cfg["LOG_BACKUP_DAYS"])
+
+# BOT_MODE=webhook: бот живёт в этом же процессе, API и апдейты делят один Bot и его сессию
+hidden_protocol = None
+if cfg["BOT_MODE"] == "webhook":
+    from app.main import RunHiddenProtocol
+
+    hidden_protocol = RunHiddenProtocol()
+    bot = hidden_protocol.bot
+    rate_limiter = hidden_protocol.rate_limiter
+    job_queue = hidden_protocol.job_queue
+else:
+    bot = create_bot(cfg)
+    # С TG_RATE_BACKEND=redis API и бот в соседнем процессе делят лимиты Telegram
+    rate_limiter = install_rate_limiter(bot, cfg)
+    # JOB_QUEUE_BACKEND=redis: задания /jobs качают те же воркеры, что и ссылки из бота
+    job_queue = RedisJobQueue.from_config(cfg)
+
+# Без Redis задания /jobs выполняются здесь же; конвейер загрузки создаётся при первом задании
+local_jobs = LocalJobStore() if job_queue is None else None
+_local_video = None
+_job_tasks: Set[asyncio.Task] = set()
+
+# /send-messages: рассылки с учётом лимитов Telegram
+broadcaster = Broadcaster(bot)
+
+# Апдейты обрабатываются в фоне; держим ссылки, чтобы задачи не собрал GC
+_update_tasks: Set[asyncio.Task] = set()
+
 app = FastAPI(title="Hidden Protocol Bot API", version="1.0.0")
 
 
@@ -46,20 +85,36 @@ class SendMessageResponse(BaseModel):
     message_id: int
 
 
-@app.get("/health", response_model=dict)
-async def healthcheck() -> dict:
-    """Простейший эндпоинт для проверки живости API."""
+class SendMessagesRequest(BaseModel):
+    """Пачка сообщений для рассылки."""
 
-    return {"message": "ok"}
+    messages: Annotated[list[SendMessageRequest], Field(min_length=1, description="Сообщения: чат, тред, текст")]
+    stream: Annotated[bool, Field(default=False, description="Отдавать результаты по мере отправки (NDJSON)")] = False
 
 
-@app.post("/send-message", response_model=SendMessageResponse)
-async def send_message(
-    payload: SendMessageRequest, _authorized: None = Depends(verify_token)
-) -> SendMessageResponse:
-    """Отправляем текстовое сообщение через бота в чат или тред."""
+class SendMessageResult(BaseModel):
+    """Результат отправки одного сообщения из пачки."""
+
+    index: int
+    ok: bool
+    chat_id: int | str
+    thread_id: int | None = None
+    message_id: int | None = None
+    error: str | None = None
+    attempts: int
+
+
+class SendMessagesResponse(BaseModel):
+    """Итог рассылки: результаты в порядке запроса."""
+
+    sent: int
+    failed: int
+    results: list[SendMessageResult]
+
+
+def _send_kwargs(payload: SendMessageRequest) -> dict:
+    """Аргументы bot.send_message из запроса."""
 
-    # Собираем аргументы для метода бота send_message
     send_kwargs = dict(
         chat_id=payload.chat_id,
         text=payload.text,
@@ -69,9 +124,118 @@ async def send_message(
         send_kwargs["parse_mode"] = payload.parse_mode
     if payload.thread_id is not None:
         send_kwargs["message_thread_id"] = payload.thread_id
+    return send_kwargs
+
+
+class CreateJobRequest(BaseModel):
+    """Задание: скачать видео по ссылке и отправить в чат."""
+
+    url: Annotated[str, Field(min_length=1, max_length=2048, description="Ссылка TikTok или Instagram Reel")]
+    chat_id: Annotated[int | str, Field(description="ID или username чата Telegram")]
+    thread_id: Annotated[int | None, Field(default=None, description="ID треда для форумов")] = None
+    caption: Annotated[str | None, Field(default=None, max_length=1024, description="Подпись к видео")] = None
+    disable_notification: Annotated[bool, Field(default=True, description="Не уведомлять получателя")] = True
+    callback_url: Annotated[str | None, Field(default=None, description="Куда POST-нуть статус по завершении")] = None
+
+
+class JobResponse(BaseModel):
+    """Статус задания."""
+
+    id: str
+    status: str  # queued | running | done | failed
+    origin: str  # bot | api
+    url: str | None = None
+    chat_id: int | str | None = None
+    thread_id: int | None = None
+    message_id: int | None = None
+    error: str | None = None
+    reason: str | None = None
+    attempts: int = 0
+    created_at: float | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+    timings: dict[str, float] = {}
+
+
+def _video_router():
+    """VideoRouter для заданий без Redis: в webhook — бота, иначе свой (yt-dlp грузим только по нужде)."""
+
+    global _local_video
+    if hidden_protocol is not None:
+        return hidden_protocol.video
+    if _local_video is None:
+        from app.services.download_video import DownloadVideo
+        from app.services.file_id_cache import FileIdCache
+        from app.utils.urls import ShortLinkResolver
+        from handlers.video import VideoRouter
+
+        _local_video = VideoRouter(
+            downloader=DownloadVideo.from_config(cfg),
+            file_ids=FileIdCache.from_config(cfg),
+            resolver=ShortLinkResolver(ttl=cfg["SHORTLINK_CACHE_TTL"]),
+            local_files=LocalFiles.from_config(cfg),
+        )
+    return _local_video
+
+
+async def _run_local_job(job_id: str, job: dict) -> None:
+    """Выполняет задание в процессе API; ошибки — в статус, не в ответ клиенту."""
+
+    local_jobs.update(job_id, status="running", started_at=time.time(), attempts=1)
+    try:
+        result = await _video_router().deliver(bot, job)
+    except Exception as exc:
+        log.exception("HTTP API: job %s crashed: %s", job_id, exc)
+        result = {"ok": False, "error": str(exc), "reason": "other", "timings": {}}
+    local_jobs.update(
+        job_id, status="done" if result["ok"] else "failed", finished_at=time.time(), result=result
+    )
+    if job.get("callback_url"):
+        await send_callback(job["callback_url"], job_view(job_id, await local_jobs.get(job_id)))
+
+
+@app.middleware("http")
+async def _observe_latency(request: Request, call_next):
+    """Время ответа по шаблону пути (не по сырому URL, чтобы не плодить серии)."""
+
+    t0 = time.monotonic()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.monotonic() - t0,
+            method=request.method,
+            path=getattr(route, "path", "unmatched"),
+            status=status_code,
+        )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Метрики процесса в формате Prometheus (в режиме webhook — вместе с ботом)."""
+
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/health", response_model=dict)
+async def healthcheck() -> dict:
+    """Простейший эндпоинт для проверки живости API."""
+
+    return {"message": "ok"}
+
+
+@app.post("/send-message", response_model=SendMessageResponse)
+async def send_message(
+    payload: SendMessageRequest, _authorized: None = Depends(verify_token)
+) -> SendMessageResponse:
+    """Отправляем текстовое сообщение через бота в чат или тред."""
 
     try:
-        message = await bot.send_message(**send_kwargs)
+        message = await bot.send_message(**_send_kwargs(payload))
     except TelegramBadRequest as exc:  # Неверные параметры чата/треда/формата
         log.warning("HTTP API: bad request for chat %s: %s", payload.chat_id, exc)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
@@ -93,10 +257,155 @@ async def send_message(
     )
 
 
+@app.post("/send-messages", response_model=SendMessagesResponse)
+async def send_messages(
+    payload: SendMessagesRequest,
+    request: Request,
+    _authorized: None = Depends(verify_token),
+):
+    """
+    Рассылка пачки сообщений за один запрос: параллельно, в пределах лимитов Telegram,
+    с повтором после retry_after. С stream=true (или Accept: application/x-ndjson)
+    результаты идут строками NDJSON по мере отправки.
+    """
+
+    if len(payload.messages) > cfg["BROADCAST_MAX_ITEMS"]:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Не больше {cfg['BROADCAST_MAX_ITEMS']} сообщений за запрос",
+        )
+
+    items = [_send_kwargs(m) for m in payload.messages]
+    log.info("HTTP API: broadcast start messages=%s", len(items))
+
+    if payload.stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        async def lines():
+            async for r in broadcaster.send_all(items):
+                yield json.dumps(SendMessageResult(**r).model_dump(), ensure_ascii=False) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    results = [SendMessageResult(**r) for r in await broadcaster.send(items)]
+    sent = sum(r.ok for r in results)
+    log.info("HTTP API: broadcast done sent=%s failed=%s", sent, len(results) - sent)
+    return SendMessagesResponse(sent=sent, failed=len(results) - sent, results=results)
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+    payload: CreateJobRequest, _authorized: None = Depends(verify_token)
+) -> JobResponse:
+    """
+    Ставим загрузку видео в работу и сразу отвечаем id задания. Дальше — GET /jobs/{id}
+    или callback_url. Выполняет тот же конвейер, что и ссылки из чатов.
+    """
+
+    url = first_url(payload.url)
+    if not url or not is_allowed_url(url):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Поддерживаются TikTok и Instagram Reels")
+
+    send_kwargs = {
+        "chat_id": payload.chat_id,
+        "caption": payload.caption if payload.caption is not None else f"🌐 Ссылка: {url}",
+        "disable_notification": payload.disable_notification,
+    }
+    if payload.thread_id is not None:
+        send_kwargs["message_thread_id"] = payload.thread_id
+    job = {
+        "url": url,
+        "chat_id": payload.chat_id,
+        "chat_type": "api",
+        "user_id": None,
+        "message_id": None,  # исходного сообщения нет: удалять нечего, об ошибке — в статусе
+        "reply_thread_id": None,
+        "send_kwargs": send_kwargs,
+        "trace_id": new_trace_id(),
+        "origin": "api",
+        "callback_url": payload.callback_url,
+    }
+
+    if job_queue is not None:
+        job_id = await job_queue.enqueue(job)
+        record = await job_queue.get(job_id)
+    else:
+        job_id = local_jobs.create(job)
+        task = asyncio.create_task(_run_local_job(job_id, job))
+        _job_tasks.add(task)
+        task.add_done_callback(_job_tasks.discard)
+        record = await local_jobs.get(job_id)
+    JOBS_SUBMITTED.inc(origin="api")
+    log.info("HTTP API: job %s queued url=%s chat=%s", job_id, url, payload.chat_id)
+    return JobResponse(**job_view(job_id, record))
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, _authorized: None = Depends(verify_token)) -> JobResponse:
+    """Статус задания — из API или (при JOB_QUEUE_BACKEND=redis) поставленного ботом."""
+
+    store = job_queue if job_queue is not None else local_jobs
+    record = await store.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return JobResponse(**job_view(job_id, record))
+
+
+@app.get("/jobs", response_model=dict)
+async def jobs_stats(_authorized: None = Depends(verify_token)) -> dict:
+    """Загрузка конвейера: очередь Redis (общая с ботом) или задания этого процесса."""
+
+    if job_queue is not None:
+        return {"backend": "redis", **await job_queue.stats()}
+    return {"backend": "local", **await local_jobs.stats()}
+
+
+@app.post(cfg["WEBHOOK_PATH"], include_in_schema=False)
+async def telegram_webhook(
+    request: Request,
+    secret: Annotated[str | None, Header(alias="X-Telegram-Bot-Api-Secret-Token")] = None,
+) -> dict:
+    """Принимаем апдейт от Telegram и отдаём его диспетчеру бота."""
+
+    if hidden_protocol is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest(secret or "", cfg["WEBHOOK_SECRET"]):
+        log.warning("HTTP API: webhook with invalid secret token")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    # Отвечаем Telegram сразу: загрузка видео может идти минуты, а он ждёт ответ ~60 с
+    task = asyncio.create_task(hidden_protocol.dp.feed_update(bot, update))
+    _update_tasks.add(task)
+    task.add_done_callback(_update_tasks.discard)
+    return {"ok": True}
+
+
+@app.on_event("startup")
+async def _startup() -> None:
+    """В режиме webhook поднимаем бота вместе с API."""
+
+    if hidden_protocol is not None:
+        await hidden_protocol.startup()
+        await hidden_protocol.set_webhook()
+
+
 @app.on_event("shutdown")
 async def _shutdown() -> None:
     """Закрываем сессию бота при завершении работы API."""
 
+    if hidden_protocol is not None:
+        # Webhook не удаляем: на него могут отвечать другие реплики
+        for task in list(_update_tasks):
+            task.cancel()
+        await hidden_protocol.shutdown()
+    else:
+        await rate_limiter.close()
+        if job_queue is not None:
+            await job_queue.close()
+    for task in list(_job_tasks):
+        task.cancel()
+    if _local_video is not None:
+        await _local_video.downloader.close()
+        await _local_video.resolver.close()
     await bot.session.close()
 
 
@@ -1,22 +1,36 @@
 import asyncio
-import logging
-from aiogram import Bot, Dispatcher
+import contextlib
+from typing import Optional
+
+from aiogram import Dispatcher
 
 from app.config import Config
 from handlers.coreHandlersCommand import CoreHandlers
 from handlers.joinHandlers import router_join
 from handlers.video import VideoRouter
 from app.services.download_video import DownloadVideo
-from app.utils.logger import setup_logger, NotifyOrErrorFilter
-from app.utils.tg_log_handler import TelegramLogHandler
+from app.services.file_id_cache import FileIdCache
+from app.services.job_queue import RedisJobQueue
+from app.utils.logger import setup_logger
+from app.utils.metrics import start_metrics_server, stop_metrics_server
+from app.utils.rate_limit import install_rate_limiter
+from app.utils.telegram_api import LocalFiles, create_bot
+from app.utils.tg_log_handler import install_telegram_log_handler
+from app.utils.tracing import tracer
+from app.utils.urls import ShortLinkResolver
 
 
 class RunHiddenProtocol:
     def __init__(self):
         self.cfg = Config().get_config()
-        self.log = setup_logger(self.cfg.get("LOG_LEVEL", "INFO"))
+        self.log = setup_logger(self.cfg.get("LOG_LEVEL", "INFO"), self.cfg["LOG_FORMAT"], self.cfg["LOG_BACKUP_DAYS"])
+
+        tracer.configure(self.cfg, service_name="hidden-protocol-bot")
 
-        self.bot = Bot(token=self.cfg["BOT_TOKEN"])
+        # api.telegram.org или свой telegram-bot-api (TELEGRAM_API_URL)
+        self.bot = create_bot(self.cfg)
+        # Все запросы бота (видео, приветствия, логи, API в webhook) — через общие лимиты Telegram
+        self.rate_limiter = install_rate_limiter(self.bot, self.cfg)
         self.dp = Dispatcher()
 
         # Команды
@@ -26,40 +40,79 @@ class RunHiddenProtocol:
         self.dp.include_router(router_join)
 
         # Видео с ограничениями: только ЛС и ALLOWED_GROUP_IDS
-        downloader = DownloadVideo(download_dir=self.cfg.get("DOWNLOAD_DIR", "./downloads"))
-        video = VideoRouter(
-            downloader=downloader,
+        self.downloader = DownloadVideo.from_config(self.cfg)
+        self.resolver = ShortLinkResolver(ttl=self.cfg["SHORTLINK_CACHE_TTL"])
+        # JOB_QUEUE_BACKEND=redis: бот только ставит задания, качают воркеры (app/worker.py)
+        self.job_queue = RedisJobQueue.from_config(self.cfg)
+        self.video = VideoRouter(
+            downloader=self.downloader,
             allowed_group_ids=self.cfg["ALLOWED_GROUP_IDS"],                 # <-- важно
             topic_chat_id=self.cfg.get("TOPIC_CHAT_ID"),
             topic_thread_id=self.cfg.get("TOPIC_THREAD_ID"),
+            file_ids=FileIdCache.from_config(self.cfg),
+            resolver=self.resolver,
+            job_queue=self.job_queue,
+            local_files=LocalFiles.from_config(self.cfg),
+        )
+        self.dp.include_router(self.video.router)
+        self._warm_up: Optional[asyncio.Task] = None
+
+    async def startup(self) -> None:
+        """Общий старт для polling и webhook: логи в Telegram и прогрев yt-dlp."""
+        install_telegram_log_handler(self.bot, self.cfg, asyncio.get_running_loop())
+
+        if self.job_queue is None:
+            # Прогрев (импорт yt-dlp, YoutubeDL в каждом воркере) идёт фоном: getUpdates
+            # не ждёт его, а первая ссылка встанет в пул следом за задачами прогрева
+            self._warm_up = asyncio.create_task(self.downloader.warm_up())
+
+    async def shutdown(self) -> None:
+        if self._warm_up is not None and not self._warm_up.done():
+            self._warm_up.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._warm_up
+        await self.downloader.close()
+        await self.resolver.close()
+        await tracer.close()
+        await self.rate_limiter.close()
+        if self.job_queue is not None:
+            await self.job_queue.close()
+        self.log.info("Bot stopped.")
+
+    async def set_webhook(self) -> None:
+        """Регистрирует webhook (BOT_MODE=webhook). Повторный вызов с других реплик безопасен."""
+        url = self.cfg["WEBHOOK_URL"].rstrip("/") + self.cfg["WEBHOOK_PATH"]
+        await self.bot.set_webhook(
+            url,
+            secret_token=self.cfg["WEBHOOK_SECRET"],
+            allowed_updates=self.dp.resolve_used_update_types(),
         )
-        self.dp.include_router(video.router)
+        self.log.info("✅Bot webhook set url=%s", url, extra={"notify": True})
 
     async def run_bot(self):
-        loop = asyncio.get_running_loop()
-
-        # Логи в Telegram: уведомления (extra["notify"]=True) и ошибки (ERROR+)
-        if self.cfg.get("LOG_CHAT_ID"):
-            tg = TelegramLogHandler(
-                bot=self.bot,
-                chat_id=int(self.cfg["LOG_CHAT_ID"]),
-                thread_id=self.cfg.get("LOG_THREAD_ID"),
-                loop=loop,
-                level=logging.INFO,
-                disable_notification=True,
-            )
-            tg.addFilter(NotifyOrErrorFilter())
-            logging.getLogger("hidden_protocol").addHandler(tg)
+        await self.startup()
+        # В polling нет FastAPI — /metrics на отдельном порту
+        metrics = await start_metrics_server(self.cfg["HOST"], self.cfg["METRICS_PORT"])
 
         self.log.info("✅Bot starting…", extra={"notify": True})
         try:
+            # Webhook мог остаться от BOT_MODE=webhook — с ним getUpdates не работает
+            await self.bot.delete_webhook()
             await self.dp.start_polling(self.bot)
         except Exception:
             self.log.exception("Polling crashed")
             raise
         finally:
-            self.log.info("Bot stopped.")
+            await stop_metrics_server(metrics)
+            await self.shutdown()
 
 
 if __name__ == "__main__":
-    asyncio.run(RunHiddenProtocol().run_bot())
+    cfg = Config().get_config()
+    if cfg["BOT_MODE"] == "webhook":
+        # Бот и HTTP API в одном процессе: апдейты приходят в FastAPI
+        import uvicorn
+
+        uvicorn.run("app.http_api:app", host=cfg["HOST"], port=cfg["PORT"], reload=False)
+    else:
+        asyncio.run(RunHiddenProtocol().run_bot())
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramServerError
+
+from app.utils.metrics import BROADCAST_MESSAGES
+from app.utils.rate_limit import Priority, send_priority
+
+log = logging.getLogger("hidden_protocol.broadcast")
+
+
+class Broadcaster:
+    """
+    Рассылка пачки сообщений: параллельно, но в темпе, который выдерживает Telegram.
+    Лимиты и повтор после retry_after — в RateLimitMiddleware сессии бота (рассылка
+    уступает видео и ответам пользователям); сетевые сбои и 5xx повторяем здесь с паузой.
+    Результаты отдаются по мере готовности.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        max_retries: int = 3,
+    ):
+        self.bot = bot
+        self.max_retries = max_retries
+
+    async def _send_one(self, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = item["chat_id"]
+        result: Dict[str, Any] = {"index": index, "chat_id": chat_id, "thread_id": item.get("message_thread_id")}
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                # Темп задаёт лимитер сессии: задачи без своего семафора просто ждут слота
+                with send_priority(Priority.BULK):
+                    message = await self.bot.send_message(**item)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                error = e
+                await asyncio.sleep(min(2 ** attempt, 10))
+            except TelegramAPIError as e:
+                # Неверный чат, бот заблокирован, 429 сверх повторов middleware — сдаёмся
+                return self._failed(result, e, attempt)
+            else:
+                BROADCAST_MESSAGES.inc(result="ok")
+                return dict(result, ok=True, message_id=message.message_id, attempts=attempt)
+
+            if attempt > self.max_retries:
+                return self._failed(result, error, attempt)
+            BROADCAST_MESSAGES.inc(result="retry")
+
+    @staticmethod
+    def _failed(result: Dict[str, Any], error: Exception, attempts: int) -> Dict[str, Any]:
+        BROADCAST_MESSAGES.inc(result="error")
+        log.warning("broadcast_fail chat=%s attempts=%s err=%s", result["chat_id"], attempts, error)
+        return dict(result, ok=False, error=str(error), attempts=attempts)
+
+    async def send_all(self, items: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """items — аргументы bot.send_message; отдаёт результаты в порядке завершения."""
+        tasks = [asyncio.ensure_future(self._send_one(i, item)) for i, item in enumerate(items)]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            # Клиент ушёл посреди потока — неотправленное не досылаем
+            for task in tasks:
+                task.cancel()
+
+    async def send(self, items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """То же, но списком в порядке items."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        async for r in self.send_all(items):
+            results[r["index"]] = r
+        return results
@@ -0,0 +1,160 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+log = logging.getLogger("hidden_protocol.scheduler")
+
+
+class DownloadQueueFull(RuntimeError):
+    """Очередь загрузок заполнена — новую задачу не принимаем."""
+
+
+class _Job:
+    __slots__ = ("fn", "future", "chat_id", "user_id", "enqueued_at")
+
+    def __init__(self, fn: Callable[[], Any], future: asyncio.Future, chat_id, user_id):
+        self.fn = fn
+        self.future = future
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+
+
+class DownloadScheduler:
+    """
+    Пул загрузок с ограниченной очередью и честной очерёдностью.
+    Задачи раскладываются по чатам, внутри чата — по пользователям;
+    воркеры берут задачи по кругу: чат за чатом, пользователь за пользователем.
+    Так один человек с 20 ссылками не занимает все воркеры.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 100,
+        executor: Optional[Executor] = None,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="download"
+        )
+        # chat_id → user_id → задачи
+        self._chats: "OrderedDict[Any, OrderedDict[Any, Deque[_Job]]]" = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._available: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+
+        # Статистика ожидания в очереди
+        self._waited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_started(self) -> None:
+        if self._tasks:
+            return
+        self._available = asyncio.Semaphore(0)
+        self._tasks = [
+            asyncio.ensure_future(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def submit(self, fn: Callable[..., Any], *args, chat_id=None, user_id=None) -> Any:
+        """Ставит fn(*args) в очередь и ждёт результат из пула."""
+        self._ensure_started()
+        if self._queued >= self.max_queue:
+            log.warning(
+                "download_queue_full chat=%s user=%s queued=%s running=%s",
+                chat_id,
+                user_id,
+                self._queued,
+                self._running,
+            )
+            raise DownloadQueueFull(f"download queue is full ({self._queued})")
+
+        job = _Job(
+            functools.partial(fn, *args),
+            asyncio.get_running_loop().create_future(),
+            chat_id,
+            user_id,
+        )
+        users = self._chats.setdefault(chat_id, OrderedDict())
+        users.setdefault(user_id, deque()).append(job)
+        self._queued += 1
+        self._available.release()
+        return await job.future
+
+    def _next_job(self) -> Optional[_Job]:
+        while self._chats:
+            chat_id, users = self._chats.popitem(last=False)
+            user_id, jobs = users.popitem(last=False)
+            job = jobs.popleft()
+            # Оставшихся ставим в конец круга
+            if jobs:
+                users[user_id] = jobs
+            if users:
+                self._chats[chat_id] = users
+            self._queued -= 1
+            if not job.future.done():  # отменённые пропускаем
+                return job
+        return None
+
+    async def _worker(self, idx: int) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._available.acquire()
+            job = self._next_job()
+            if job is None:
+                continue
+
+            wait = time.monotonic() - job.enqueued_at
+            self._waited += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._running += 1
+            log.info(
+                "download_queue: start worker=%s chat=%s user=%s wait=%.2fs queued=%s running=%s",
+                idx,
+                job.chat_id,
+                job.user_id,
+                wait,
+                self._queued,
+                self._running,
+            )
+            try:
+                result = await loop.run_in_executor(self.executor, job.fn)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._running -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущее состояние очереди (для логов и метрик)."""
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": self._queued,
+            "max_queue": self.max_queue,
+            "chats_waiting": len(self._chats),
+            "wait_avg_sec": (self._wait_total / self._waited) if self._waited else 0.0,
+            "wait_max_sec": self._wait_max,
+        }
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,599 @@
 import asyncio
 import contextlib
+import itertools
+import multiprocessing
+import os
 import pathlib
+import shutil
+import socket
+import struct
+import subprocess
+import threading
 import time
-from typing import Callable, Optional, Dict, Any
-import yt_dlp
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, Dict, Any, List, Tuple
+import aiohttp
+from app.services.download_scheduler import DownloadQueueFull, DownloadScheduler
+from app.services.stream_upload import StreamInputFile
+from app.services.upstream_health import (
+    PERMANENT_REASONS,
+    TRANSIENT_REASONS,
+    DownloadFailed,
+    PlatformUnavailable,
+    UpstreamHealth,
+    backoff,
+    classify,
+)
 from app.utils.logger import setup_logger
+from app.utils.tracing import current_span, span
+from app.utils.metrics import (
+    DOWNLOAD_BYTES,
+    DOWNLOAD_FAILURES,
+    DOWNLOAD_INFLIGHT,
+    DOWNLOAD_QUEUE,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_SECONDS,
+)
+from app.utils.urls import normalize_url, url_platform, video_key
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+
+# Поля события прогресса, которые пересылаем из процесса-воркера
+_PROGRESS_FIELDS = (
+    "status",
+    "filename",
+    "downloaded_bytes",
+    "total_bytes",
+    "total_bytes_estimate",
+    "speed",
+    "eta",
+    "elapsed",
+    "fragment_index",
+    "fragment_count",
+)
+
+
+# --- Долгоживущие YoutubeDL: по одному на поток/процесс воркера ---
+
+_ydl_local = threading.local()
+_ydl_all: List["yt_dlp.YoutubeDL"] = []  # все созданные в этом процессе (для close)
+_ydl_lock = threading.Lock()
+
+
+def _ydl_extractors() -> list:
+    """Только TikTok и Instagram: не грузим и не перебираем ~1800 остальных экстракторов."""
+    from yt_dlp.extractor.instagram import InstagramIE
+    from yt_dlp.extractor.tiktok import TikTokIE, TikTokVMIE
+
+    return [TikTokIE, TikTokVMIE, InstagramIE]
+
+
+# Меняются от задачи к задаче и не требуют нового экземпляра; size_budget (лимит
+# на файл, байт), faststart (перенос moov в начало) и staging (tmpfs под маленький файл:
+# {"dir", "max_bytes"}) — наши ключи, в YoutubeDL не передаются
+_PER_JOB_OPTS = ("progress_hooks", "paths", "size_budget", "faststart", "staging")
+
+
+def _opts_signature(opts: Dict[str, Any]) -> str:
+    return repr(sorted((k, v) for k, v in opts.items() if k not in _PER_JOB_OPTS))
+
+
+def _get_ydl(opts: Dict[str, Any]) -> Tuple["yt_dlp.YoutubeDL", float]:
+    """
+    YoutubeDL текущего потока. Между задачами живут экстракторы, cookie jar
+    и HTTP-сессия (keep-alive до CDN). Возвращает (ydl, время создания, 0 — если переиспользован).
+    """
+    sig = _opts_signature(opts)
+    ydl = getattr(_ydl_local, "ydl", None)
+    if ydl is not None and _ydl_local.sig == sig:
+        return ydl, 0.0
+
+    t0 = time.monotonic()
+    if ydl is not None:
+        with contextlib.suppress(Exception):
+            ydl.close()
+    params = {k: v for k, v in opts.items() if k not in _PER_JOB_OPTS}
+    # yt-dlp (~0.2 с импорта) грузим при первой загрузке или в прогреве, а не при старте бота
+    import yt_dlp
+
+    ydl = yt_dlp.YoutubeDL(params, auto_init=False)
+    for ie in _ydl_extractors():
+        ydl.add_info_extractor(ie())
+    ydl._request_director  # noqa: B018 — поднимаем HTTP-обработчики заранее
+    setup = time.monotonic() - t0
+
+    _ydl_local.ydl, _ydl_local.sig = ydl, sig
+    # Сколько стоит холодный старт — столько экономит каждый повторный запрос
+    _ydl_local.cold_setup_sec = setup
+    with _ydl_lock:
+        _ydl_all.append(ydl)
+    return ydl, setup
+
+
+def _warm_ydl(opts: Dict[str, Any]) -> float:
+    """Создаёт YoutubeDL воркера заранее (0 — в этом потоке/процессе он уже есть)."""
+    _, setup = _get_ydl(opts)
+    return setup
+
+
+def _close_ydls() -> None:
+    with _ydl_lock:
+        ydls, _ydl_all[:] = list(_ydl_all), []
+    for ydl in ydls:
+        with contextlib.suppress(Exception):
+            ydl.close()
+
+
+class VideoTooLarge(Exception):
+    """Ни один вариант видео не влезает в лимит на файл — качать нечего."""
+
+
+_MB = 1024 * 1024
+_ffmpeg_exe: Optional[str] = None  # "" — ffmpeg нет
+
+
+def _ffmpeg(ydl: "yt_dlp.YoutubeDL") -> Optional[str]:
+    """Путь к ffmpeg с учётом ffmpeg_location из опций; None — нет. Проверяем один раз на процесс."""
+    global _ffmpeg_exe
+    if _ffmpeg_exe is None:
+        from yt_dlp.postprocessor import FFmpegPostProcessor
+
+        pp = FFmpegPostProcessor(ydl)
+        _ffmpeg_exe = pp.executable if pp.available else ""
+    return _ffmpeg_exe or None
+
+
+def _can_merge(ydl: "yt_dlp.YoutubeDL") -> bool:
+    """Есть ли ffmpeg для склейки видео+аудио."""
+    return _ffmpeg(ydl) is not None
+
+
+def _estimate_size(fmt: dict, duration: Optional[float]) -> Optional[float]:
+    """Размер формата в байтах: точный, приблизительный или битрейт × длительность."""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return float(size)
+    tbr = fmt.get("tbr") or (fmt.get("vbr") or 0) + (fmt.get("abr") or 0)
+    if tbr and duration:
+        return tbr * 1000 / 8 * duration
+    return None
+
+
+def _select_format(info: dict, budget: int, can_merge: bool) -> Optional[dict]:
+    """
+    Лучший вариант в пределах budget байт по метаданным экстракции:
+    {"format": спецификация для yt-dlp, "size": оценка | None, "merge": bool, "height": int}.
+    При равном разрешении готовый mp4 с видео и звуком лучше склейки (не нужен ffmpeg),
+    H.264 лучше прочих (его везде проигрывает Telegram). Форматы с известным размером
+    надёжнее неизвестных. Если всё известное больше budget — VideoTooLarge до загрузки.
+    """
+    duration = info.get("duration")
+    formats = [f for f in info.get("formats") or [] if f.get("format_id") and f.get("protocol") != "mhtml"]
+    muxed = [f for f in formats if f.get("vcodec") != "none" and f.get("acodec") != "none"]
+    video = [f for f in formats if f.get("vcodec") != "none" and f.get("acodec") == "none"]
+    audio = [f for f in formats if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")]
+
+    candidates = [
+        {"format": f["format_id"], "size": _estimate_size(f, duration), "merge": False, "fmt": f} for f in muxed
+    ]
+    if can_merge and audio:
+        # К каждому видео — лучший звук, с которым пара ещё влезает (или самый лёгкий)
+        audio.sort(key=lambda a: a.get("abr") or a.get("tbr") or 0, reverse=True)
+        for v in video:
+            v_size = _estimate_size(v, duration)
+            pair = None
+            for a in audio:
+                a_size = _estimate_size(a, duration)
+                size = v_size + a_size if v_size is not None and a_size is not None else None
+                pair = (a, size)
+                if size is not None and size <= budget:
+                    break
+            a, size = pair
+            candidates.append({"format": f"{v['format_id']}+{a['format_id']}", "size": size, "merge": True, "fmt": v})
+
+    if not candidates:
+        # Нечего сравнивать (нет кодеков в метаданных, нет ffmpeg) — решит format из опций
+        return None
+    fitting = [c for c in candidates if c["size"] is None or c["size"] <= budget]
+    if not fitting:
+        smallest = min(c["size"] for c in candidates)
+        raise VideoTooLarge(f"самый лёгкий вариант ≈{smallest / _MB:.1f} МБ, лимит {budget / _MB:.0f} МБ")
+
+    def rank(c: dict) -> tuple:
+        f = c["fmt"]
+        return (
+            c["size"] is not None,
+            f.get("height") or 0,
+            not c["merge"],
+            f.get("ext") == "mp4",
+            (f.get("vcodec") or "").startswith(("avc", "h264")),
+            f.get("tbr") or 0,
+        )
+
+    best = max(fitting, key=rank)
+    return {"format": best["format"], "size": best["size"], "merge": best["merge"], "height": best["fmt"].get("height")}
+
+
+def _probe_and_select(ydl: "yt_dlp.YoutubeDL", url: str, budget: int) -> Tuple[dict, Optional[dict]]:
+    """
+    Экстракция без загрузки и выбор формата под budget (0 — без выбора, как решит format из опций).
+    Возвращает (info, выбор); под выбранный формат info обрабатывает _process_with_format.
+    """
+    info = ydl.extract_info(url, download=False)
+    if not budget or not info.get("formats"):
+        return info, None
+    return info, _select_format(info, budget, _can_merge(ydl))
+
+
+def _process_with_format(ydl: "yt_dlp.YoutubeDL", info: dict, fmt: Optional[str], download: bool) -> dict:
+    """Повторная обработка тех же метаданных с форматом fmt — без новой экстракции (как --load-info-json)."""
+    # Селектор собирается из params["format"] в конструкторе — подменяем на время задачи
+    saved = ydl.format_selector
+    if fmt:
+        ydl.format_selector = ydl.build_format_selector(fmt)
+    try:
+        return ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=download)
+    finally:
+        ydl.format_selector = saved
+
+
+def _moov_after_mdat(path: str) -> bool:
+    """
+    Индекс mp4 (moov) лежит после данных (mdat): клиент не начнёт играть,
+    пока не скачает файл целиком. Смотрим только заголовки боксов верхнего уровня.
+    """
+    try:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, kind = struct.unpack(">I4s", header)
+                if kind == b"moov":
+                    return False
+                if kind == b"mdat":
+                    return True
+                if size == 1:
+                    # 64-битный размер сразу после заголовка
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size >= 8:
+                    f.seek(size - 8, os.SEEK_CUR)
+                else:
+                    return False
+    except (OSError, struct.error):
+        return False
+
+
+def _faststart(ffmpeg: str, path: str) -> bool:
+    """Переносит moov в начало копированием потоков (-c copy, без перекодирования). True — файл переписан."""
+    if not path.lower().endswith((".mp4", ".m4v", ".mov")) or not _moov_after_mdat(path):
+        return False
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.faststart{ext}"
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-y", "-i", path,
+           "-map", "0", "-c", "copy", "-movflags", "+faststart", tmp]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, timeout=120)
+        os.replace(tmp, path)
+    except (OSError, subprocess.SubprocessError):
+        # Не вышло — отправим как есть: играть начнут позже, но видео дойдёт
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        return False
+    return True
+
+
+_THUMB_SIDE = 320  # требования Telegram к превью: JPEG, сторона до 320 px, до 200 КБ
+_THUMB_MAX_BYTES = 200 * 1024
+
+
+def _thumbnail(ydl: "yt_dlp.YoutubeDL", info: dict) -> Optional[bytes]:
+    """
+    Превью для send_video из метаданных yt-dlp. Если картинка не JPEG или великовата,
+    ужимаем ffmpeg; без ffmpeg годится только готовый JPEG до 200 КБ. Ошибки не критичны — None.
+    """
+    thumbs = [t for t in info.get("thumbnails") or [] if t.get("url")]
+    if not thumbs and info.get("thumbnail"):
+        thumbs = [{"url": info["thumbnail"]}]
+    if not thumbs:
+        return None
+    # yt-dlp сортирует превью по возрастанию предпочтения
+    small = [t for t in thumbs if 0 < (t.get("width") or 0) <= _THUMB_SIDE and (t.get("height") or 0) <= _THUMB_SIDE]
+    thumb = (small or thumbs)[-1]
+    try:
+        with ydl.urlopen(thumb["url"]) as resp:
+            data = resp.read(4 * _MB + 1)
+    except Exception:
+        return None
+    if len(data) > 4 * _MB:
+        return None
+
+    is_jpeg = data[:2] == b"\xff\xd8"
+    if is_jpeg and len(data) <= _THUMB_MAX_BYTES and (small or not _ffmpeg(ydl)):
+        return data
+    ffmpeg = _ffmpeg(ydl)
+    if not ffmpeg:
+        return None
+    scale = f"scale='min({_THUMB_SIDE},iw)':'min({_THUMB_SIDE},ih)':force_original_aspect_ratio=decrease"
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+           "-vf", scale, "-frames:v", "1", "-q:v", "5", "-f", "image2", "-c:v", "mjpeg", "pipe:1"]
+    try:
+        out = subprocess.run(cmd, input=data, check=True, capture_output=True, timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out if out and len(out) <= _THUMB_MAX_BYTES else None
+
+
+def _media_meta(info: dict) -> Dict[str, Optional[int]]:
+    """Длительность и размеры кадра для send_video: клиент сразу рисует плеер нужного размера."""
+    meta = {}
+    for key in ("duration", "width", "height"):
+        value = info.get(key)
+        meta[key] = int(round(value)) if value else None
+    return meta
+
+
+def _stage_spans(t0: float, marks: Dict[str, float], end: float) -> List[Tuple[str, float, float]]:
+    """Этапы yt-dlp по отметкам хуков: (имя, сдвиг от t0, длительность)."""
+    fetch_start = marks.get("fetch_start", end)
+    fetch_end = marks.get("fetch_end", fetch_start)
+    stages = [("extract", 0.0, fetch_start - t0)]
+    if "fetch_start" in marks:
+        stages.append(("fetch", fetch_start - t0, fetch_end - fetch_start))
+    if "pp_start" in marks:
+        pp_end = marks.get("pp_end", end)
+        stages.append(("postprocess", marks["pp_start"] - t0, pp_end - marks["pp_start"]))
+    return stages
+
+
+def _use_staging(ydl: "yt_dlp.YoutubeDL", staging: Optional[dict], info: dict, choice: Optional[dict]) -> bool:
+    """
+    Пишет в tmpfs, только если оценка размера известна и влезает в резерв памяти;
+    без оценки или крупнее — на диск (paths задачи), чтобы не раздувать /dev/shm.
+    """
+    if not staging:
+        return False
+    size = (choice and choice["size"]) or info.get("filesize") or info.get("filesize_approx")
+    if not size or size > staging["max_bytes"]:
+        return False
+    ydl.params["paths"] = dict(ydl.params["paths"], home=staging["dir"])
+    return True
+
+
+def _run_ydl(url: str, opts: Dict[str, Any], info: Optional[dict] = None) -> dict:
+    """
+    Сам запуск yt-dlp. Выполняется в потоке или в процессе пула.
+    info — метаданные из _probe_ydl: тогда без второй экстракции, только выбор формата и загрузка.
+    """
+    t0 = time.monotonic()
+    started_ns = time.time_ns()
+    ydl, setup = _get_ydl(opts)
+    marks: Dict[str, float] = {}
+
+    def stage_hook(d: dict):
+        # Первое событие прогресса — экстракция закончилась, пошли байты
+        now = time.monotonic()
+        marks.setdefault("fetch_start", now)
+        if d.get("status") == "finished":
+            marks["fetch_end"] = now
+
+    def pp_hook(d: dict):
+        # Склейка ffmpeg и прочие постпроцессоры
+        now = time.monotonic()
+        if d.get("status") == "started":
+            marks.setdefault("pp_start", now)
+        elif d.get("status") == "finished":
+            marks["pp_end"] = now
+
+    # Хуки и папка загрузки (память или диск) — свои у каждой задачи
+    ydl._progress_hooks = list(opts.get("progress_hooks") or []) + [stage_hook]
+    ydl._postprocessor_hooks = [pp_hook]
+    ydl.params["paths"] = dict(opts.get("paths") or {})
+    budget = opts.get("size_budget") or 0
+    staging = opts.get("staging")
+    try:
+        if info is not None:
+            # Страница уже разобрана в probe_stream (поток не вышел) — как --load-info-json
+            choice = _select_format(info, budget, _can_merge(ydl)) if budget and info.get("formats") else None
+            _use_staging(ydl, staging, info, choice)
+            info = _process_with_format(ydl, info, choice and choice["format"], download=True)
+        elif budget or staging:
+            # Сначала метаданные: формат под лимит, слишком большое отсекаем до первого байта,
+            # и по оценке размера решаем, писать ли в tmpfs
+            info, choice = _probe_and_select(ydl, url, budget)
+            _use_staging(ydl, staging, info, choice)
+            info = _process_with_format(ydl, info, choice and choice["format"], download=True)
+        else:
+            info, choice = ydl.extract_info(url, download=True), None
+        filepath = ydl.prepare_filename(info)
+    finally:
+        ydl._progress_hooks = []
+        ydl._postprocessor_hooks = []
+    end = time.monotonic()
+
+    filesize = info.get("filesize") or info.get("filesize_approx")
+    with contextlib.suppress(OSError):
+        filesize = os.path.getsize(filepath)
+    if budget and filesize and filesize > budget:
+        # Оценка по битрейту промахнулась — отправить всё равно не выйдет
+        with contextlib.suppress(OSError):
+            os.remove(filepath)
+        raise VideoTooLarge(f"файл {filesize / _MB:.1f} МБ больше лимита {budget / _MB:.0f} МБ")
+
+    # Подготовка к отправке: moov в начало (играть можно до конца загрузки) и превью
+    ffmpeg = _ffmpeg(ydl) if opts.get("faststart") else None
+    faststart = _faststart(ffmpeg, filepath) if ffmpeg else False
+    thumbnail = _thumbnail(ydl, info)
+    stages = _stage_spans(t0, marks, end)
+    stages.append(("finalize", end - t0, time.monotonic() - end))
+
+    return {
+        "filepath": filepath,
+        "title": info.get("title"),
+        "ext": info.get("ext"),
+        "filesize": filesize,
+        "format": choice["format"] if choice else info.get("format_id"),
+        # Время считаем с момента, когда воркер взял задачу (без ожидания в очереди)
+        "duration_sec": time.monotonic() - t0,
+        "platform": (info.get("extractor_key") or "").lower() or None,
+        "id": info.get("id"),
+        # Экономия на переиспользовании YoutubeDL (0 — если экземпляр создавался сейчас)
+        "ydl_saved_sec": 0.0 if setup else getattr(_ydl_local, "cold_setup_sec", 0.0),
+        # Для трассировки: когда воркер начал и сколько заняли этапы
+        "started_ns": started_ns,
+        "stages": stages,
+        "faststart": faststart,
+        "thumbnail": thumbnail,
+        **_media_meta(info),
+    }
+
+
+def _probe_ydl(url: str, opts: Dict[str, Any]) -> dict:
+    """
+    Только метаданные, без загрузки. Если выбранный формат — один файл по http(s)
+    (без склейки видео+аудио), возвращает прямую ссылку на CDN и заголовки к ней.
+    """
+    ydl, _ = _get_ydl(opts)
+    ydl.params["paths"] = dict(opts.get("paths") or {})
+    info, choice = _probe_and_select(ydl, url, opts.get("size_budget") or 0)
+    # Для загрузки, если поток не выйдет: cookies CDN лежат в info["formats"][…]["cookies"]
+    extracted = ydl.sanitize_info(info, remove_private_keys=True)
+    if choice and choice["format"] != info.get("format_id"):
+        info = _process_with_format(ydl, info, choice["format"], download=False)
+    res = {
+        "streamable": False,
+        "info": extracted,
+        "title": info.get("title"),
+        "ext": info.get("ext"),
+        "filesize": info.get("filesize") or info.get("filesize_approx") or (choice and choice["size"]),
+        "platform": (info.get("extractor_key") or "").lower() or None,
+        "id": info.get("id"),
+        **_media_meta(info),
+    }
+    if info.get("requested_formats") or info.get("protocol") not in ("http", "https") or not info.get("url"):
+        return res
+
+    headers = dict(info.get("http_headers") or {})
+    # Часть CDN (TikTok) отдаёт видео только с cookies, полученными при экстракции
+    cookie = ydl.cookiejar.get_cookie_header(info["url"])
+    if cookie:
+        headers["Cookie"] = cookie
+    res.update(
+        streamable=True,
+        # moov в конце файла с CDN не исправить; превью хотя бы сразу
+        thumbnail=_thumbnail(ydl, info),
+        stream_url=info["url"],
+        http_headers=headers,
+        filename=os.path.basename(ydl.prepare_filename(info)),
+    )
+    return res
+
+
+# --- Режим процессов (DOWNLOAD_EXECUTOR=process) ---
+
+_worker_progress_queue = None  # в процессе-воркере: очередь событий к родителю
+
+
+def _init_process_worker(queue) -> None:
+    global _worker_progress_queue
+    _worker_progress_queue = queue
+
+
+def _run_ydl_in_process(url: str, opts: Dict[str, Any], token: int, info: Optional[dict] = None) -> dict:
+    queue = _worker_progress_queue
+    last_sent = 0.0
+
+    def hook(d: dict):
+        nonlocal last_sent
+        now = time.monotonic()
+        # "downloading" приходит на каждый чанк — шлём не чаще раза в 0.5 с
+        if d.get("status") == "downloading" and now - last_sent < 0.5:
+            return
+        last_sent = now
+        with contextlib.suppress(Exception):
+            queue.put_nowait((token, {k: d.get(k) for k in _PROGRESS_FIELDS}))
+
+    opts = dict(opts, progress_hooks=[hook])
+    return _call_picklable(_run_ydl, url, opts, info)
+
+
+def _probe_ydl_in_process(url: str, opts: Dict[str, Any]) -> dict:
+    return _call_picklable(_probe_ydl, url, opts)
+
+
+def _call_picklable(fn: Callable[..., dict], *args) -> dict:
+    try:
+        return fn(*args)
+    except (VideoTooLarge, DownloadFailed):
+        raise
+    except Exception as e:
+        # Исключения yt-dlp держат traceback в exc_info и не пиклятся: категорию
+        # определяем здесь, пока цепочка причин цела, и отдаём вместе с текстом
+        raise DownloadFailed(classify(e), f"{type(e).__name__}: {e}") from None
+
+
+class _ProgressRelay:
+    """Принимает события прогресса из процессов-воркеров и вызывает хуки в родителе."""
+
+    def __init__(self, ctx):
+        self.queue = ctx.Queue()
+        self._hooks: Dict[int, Callable[[dict], None]] = {}
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, name="ytdlp-progress", daemon=True).start()
+
+    def register(self, hook: Callable[[dict], None]) -> int:
+        with self._lock:
+            token = next(self._tokens)
+            self._hooks[token] = hook
+        return token
+
+    def unregister(self, token: int) -> None:
+        with self._lock:
+            self._hooks.pop(token, None)
+
+    def _loop(self) -> None:
+        while True:
+            token, event = self.queue.get()
+            with self._lock:
+                hook = self._hooks.get(token)
+            if hook:
+                with contextlib.suppress(Exception):
+                    hook(event)
+
+
+_relay: Optional[_ProgressRelay] = None
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _progress_relay() -> _ProgressRelay:
+    global _relay
+    if _relay is None:
+        _relay = _ProgressRelay(_MP_CONTEXT)
+    return _relay
+
+
+def create_process_executor(workers: int) -> ProcessPoolExecutor:
+    """Пул процессов для DownloadScheduler в режиме DOWNLOAD_EXECUTOR=process."""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=_MP_CONTEXT,
+        initializer=_init_process_worker,
+        initargs=(_progress_relay().queue,),
+    )
+
+
+class _Flight:
+    """Одна общая загрузка и число потребителей, которые ещё держат файл."""
+
+    __slots__ = ("task", "refs")
+
+    def __init__(self, task: "asyncio.Task[dict]"):
+        self.task = task
+        self.refs = 0
 
 
 class DownloadVideo:
@@ -12,16 +601,190 @@ class DownloadVideo:
         self,
         download_dir: str = "./downloads",
         ydl_opts: Optional[Dict[str, Any]] = None,
+        scheduler: Optional[DownloadScheduler] = None,
+        streaming: bool = False,
+        memory_dir: Optional[str] = None,
+        memory_max_file: int = 15 * 1024 * 1024,
+        memory_budget: int = 0,
+        size_budget: int = 50 * 1024 * 1024,
+        faststart: bool = True,
+        retries: int = 2,
+        retry_base: float = 1.0,
+        retry_max: float = 10.0,
+        health: Optional[UpstreamHealth] = None,
+        private_dirs: bool = False,
     ):
+        # Папки общие для бота, воркеров и HTTP API (том для telegram-bot-api), а single-flight
+        # и счётчики потребителей у каждого процесса свои: одинаковые имена файлов из двух
+        # процессов удаляли бы друг у друга. private_dirs — своя подпапка <host>-<pid>, удаляется в close
+        self._private = f"{socket.gethostname()}-{os.getpid()}" if private_dirs else None
         self.dir = pathlib.Path(download_dir)
+        if self._private:
+            self.dir = self.dir / self._private
         self.dir.mkdir(parents=True, exist_ok=True)
         self.ydl_opts = ydl_opts or {}
+        # Все загрузки (бот, HTTP API) идут через один ограниченный пул
+        self.scheduler = scheduler or DownloadScheduler()
+        # thread — yt-dlp в потоках; process — в процессах (не делит GIL с event loop)
+        self.mode = "process" if isinstance(self.scheduler.executor, ProcessPoolExecutor) else "thread"
         self.log = setup_logger()  # использует общий конфиг логгера
+        # Загрузки в процессе и ещё не отпущенные файлы: ключ видео → _Flight
+        self._inflight: Dict[str, _Flight] = {}
+        # Потоковая отправка: один файл с CDN сразу в Telegram, без DOWNLOAD_DIR
+        self.streaming = streaming
+        self._http: Optional[aiohttp.ClientSession] = None
+        # Staging в памяти: файлы до memory_max_file качаются в tmpfs (memory_dir) и отдаются
+        # байтами; всего в памяти не больше memory_budget, остальное — на диск в self.dir
+        self.memory_dir = pathlib.Path(memory_dir) if memory_dir and memory_budget > 0 else None
+        if self.memory_dir and self._private:
+            self.memory_dir = self.memory_dir / self._private
+        if self.memory_dir:
+            self.memory_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_max_file = memory_max_file
+        self.memory_budget = memory_budget
+        self._staged = 0  # байт в памяти и зарезервировано под текущие загрузки
+        # Лимит на файл: формат выбирается по метаданным до загрузки, 0 — без выбора
+        self.size_budget = size_budget
+        # Перенос moov в начало ffmpeg-ом без перекодирования (если moov в конце и ffmpeg есть)
+        self.faststart = faststart
+        # Временные сбои платформы повторяем с паузой; подряд идущие — размыкают её автомат
+        self.retries = max(0, retries)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.health = health or UpstreamHealth()
+
+        DOWNLOAD_QUEUE.set_function(lambda: self.scheduler.stats()["queued"], state="queued")
+        DOWNLOAD_QUEUE.set_function(lambda: self.scheduler.stats()["running"], state="running")
+        DOWNLOAD_INFLIGHT.set_function(lambda: len(self._inflight))
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "DownloadVideo":
+        workers = cfg["DOWNLOAD_WORKERS"]
+        scheduler = DownloadScheduler(
+            workers=workers,
+            max_queue=cfg["DOWNLOAD_QUEUE_SIZE"],
+            executor=create_process_executor(workers) if cfg["DOWNLOAD_EXECUTOR"] == "process" else None,
+        )
+        return cls(
+            download_dir=cfg.get("DOWNLOAD_DIR", "./downloads"),
+            scheduler=scheduler,
+            streaming=cfg["DOWNLOAD_STREAMING"],
+            memory_dir=cfg["STAGING_MEMORY_DIR"],
+            memory_max_file=cfg["STAGING_MAX_FILE_MB"] * 1024 * 1024,
+            memory_budget=cfg["STAGING_MEMORY_MB"] * 1024 * 1024,
+            size_budget=cfg["DOWNLOAD_MAX_MB"] * 1024 * 1024,
+            faststart=cfg["DOWNLOAD_FASTSTART"],
+            retries=cfg["DOWNLOAD_RETRIES"],
+            retry_base=cfg["DOWNLOAD_RETRY_BASE"],
+            health=UpstreamHealth(
+                threshold=cfg["DOWNLOAD_CIRCUIT_FAILURES"],
+                cooldown=cfg["DOWNLOAD_CIRCUIT_COOLDOWN"],
+            ),
+            private_dirs=True,
+        )
+
+    @staticmethod
+    def _flight_key(url: str) -> str:
+        key = video_key(url)
+        return f"{key[0]}:{key[1]}" if key else normalize_url(url)
 
     async def download(
         self,
         url: str,
         on_progress: Optional[Callable[[dict], None]] = None,
+        *,
+        chat_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        info: Optional[dict] = None,
+    ) -> dict:
+        """
+        Single-flight: параллельные вызовы для одного видео ждут одну загрузку
+        и получают один и тот же файл. Каждый успешный вызов обязан вернуть
+        результат через release(res) — файл удаляется после последнего.
+        on_progress получает события только того вызова, что начал загрузку.
+        chat_id/user_id — владелец задачи для честной очереди планировщика.
+        info — probe["info"] из probe_stream: загрузка без повторной экстракции.
+
+        Результат — как у _download, плюс "key" (ключ single-flight).
+        """
+        key = self._flight_key(url)
+        with span("download", key=key) as sp:
+            flight = self._inflight.get(key)
+            if flight is None:
+                # Задача наследует контекст: этапы yt-dlp лягут под этот span
+                flight = _Flight(asyncio.ensure_future(
+                    self._download(url, on_progress, chat_id=chat_id, user_id=user_id, info=info)
+                ))
+                self._inflight[key] = flight
+                flight.task.add_done_callback(lambda _t, k=key, f=flight: self._on_flight_done(k, f))
+            else:
+                self.log.info("yt-dlp: join url=%s key=%s consumers=%s", url, key, flight.refs + 1)
+                if sp is not None:
+                    sp.set(joined=True)
+
+            flight.refs += 1
+            try:
+                res = await asyncio.shield(flight.task)
+            except BaseException:
+                self._unref(key, flight)
+                raise
+        return dict(res, key=key)
+
+    def release(self, res: dict) -> None:
+        """Потребитель закончил работу с файлом (отправил или упал)."""
+        key = res.get("key")
+        flight = self._inflight.get(key) if key else None
+        if flight is not None:
+            self._unref(key, flight)
+
+    def _unref(self, key: str, flight: _Flight) -> None:
+        flight.refs -= 1
+        if flight.refs <= 0 and flight.task.done():
+            self._drop(key, flight)
+
+    def _on_flight_done(self, key: str, flight: _Flight) -> None:
+        task = flight.task
+        if task.cancelled() or task.exception() is not None:
+            # Неудачную загрузку не держим: следующий вызов попробует заново
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+            return
+        if flight.refs <= 0:
+            # Все ожидающие отменились раньше, чем файл был готов
+            self._drop(key, flight)
+
+    def _drop(self, key: str, flight: _Flight) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if flight.task.cancelled() or flight.task.exception() is not None:
+            return
+
+        res = flight.task.result()
+        if res.get("data") is not None:
+            self._staged -= res["staged_bytes"]
+            self.log.debug("memory_release key=%s bytes=%s staged=%s", key, res["staged_bytes"], self._staged)
+            return
+
+        filepath = res["filepath"]
+        # Другой ключ (например, короткая ссылка) мог скачать тот же файл
+        if any(
+            f.task.done() and not f.task.cancelled() and f.task.exception() is None
+            and f.task.result()["filepath"] == filepath
+            for f in self._inflight.values()
+        ):
+            return
+        with contextlib.suppress(Exception):
+            os.remove(filepath)
+            self.log.debug("file_cleanup path=%s", filepath)
+
+    async def _download(
+        self,
+        url: str,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        *,
+        chat_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        info: Optional[dict] = None,
     ) -> dict:
         """
         Возвращает:
@@ -30,106 +793,344 @@ class DownloadVideo:
             "title": str | None,
             "ext": str | None,
             "filesize": int | None,
-            "duration_sec": float
+            "duration_sec": float,
+            "platform": str | None,   # "tiktok" / "instagram" (extractor_key)
+            "format": str | None,     # format_id, для склейки — "видео+аудио"
+            "duration": int | None,   # длительность видео, с
+            "width": int | None,
+            "height": int | None,
+            "thumbnail": bytes | None,  # JPEG-превью для send_video
+            "faststart": bool,        # moov перенесён в начало файла
+            "id": str | None,         # ID видео на платформе
+            "data": bytes | None,     # есть, если файл остался в памяти (filepath тогда уже удалён)
+            "staged_bytes": int,      # сколько байт держим в бюджете памяти
           }
         """
-        t0 = time.monotonic()
         url_short = url if len(url) <= 128 else url[:125] + "..."
+        last_log = 0.0
+
+        def hook(d: dict):
+            nonlocal last_log
+            # Пользовательский колбэк
+            if on_progress:
+                with contextlib.suppress(Exception):
+                    on_progress(d)
+
+            now = time.monotonic()
+            status = d.get("status")
+
+            if status == "downloading":
+                # Троттлим логи, чтобы не засорять
+                if now - last_log >= 1.5:
+                    downloaded = d.get("downloaded_bytes") or 0
+                    total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
+                    speed = d.get("speed") or 0.0  # байт/с
+                    eta = d.get("eta")  # сек
+                    pct = (downloaded / total * 100.0) if total else 0.0
+                    self.log.info(
+                        "yt-dlp: downloading url=%s progress=%.1f%% bytes=%s/%s speed=%.1fkB/s eta=%ss",
+                        url_short,
+                        pct,
+                        downloaded,
+                        total or "unknown",
+                        speed / 1024.0,
+                        eta if eta is not None else "unknown",
+                    )
+                    last_log = now
 
-        def _run() -> dict:
-            last_log = 0.0
-
-            def hook(d: dict):
-                nonlocal last_log
-                # Пользовательский колбэк
-                if on_progress:
-                    with contextlib.suppress(Exception):
-                        on_progress(d)
-
-                now = time.monotonic()
-                status = d.get("status")
-
-                if status == "downloading":
-                    # Троттлим логи, чтобы не засорять
-                    if now - last_log >= 1.5:
-                        downloaded = d.get("downloaded_bytes") or 0
-                        total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
-                        speed = d.get("speed") or 0.0  # байт/с
-                        eta = d.get("eta")  # сек
-                        pct = (downloaded / total * 100.0) if total else 0.0
-                        self.log.info(
-                            "yt-dlp: downloading url=%s progress=%.1f%% bytes=%s/%s speed=%.1fkB/s eta=%ss",
-                            url_short,
-                            pct,
-                            downloaded,
-                            total or "unknown",
-                            speed / 1024.0,
-                            eta if eta is not None else "unknown",
-                        )
-                        last_log = now
-
-                elif status == "finished":
-                    filename = d.get("filename")
-                    elapsed = d.get("elapsed")
-                    self.log.info("yt-dlp: finished url=%s file=%s elapsed=%ss", url_short, filename, elapsed)
-
-                elif status == "error":
-                    self.log.error("yt-dlp: error url=%s detail=%s", url_short, d)
-
-            # Базовые опции
-            opts = dict(self.ydl_opts)
-            opts.setdefault("noplaylist", True)
-            opts.setdefault("restrictfilenames", True)
-            opts.setdefault("format", "mp4/bestvideo+bestaudio/best")
-            opts.setdefault("merge_output_format", "mp4")
-            opts.setdefault("quiet", True)
-            opts.setdefault("no_warnings", True)
-
-            # Шаблон имени
-            outtmpl = opts.get("outtmpl") or "%(title).200s-%(id)s.%(ext)s"
-            opts["outtmpl"] = str(self.dir / outtmpl)
-
-            # Прогресс-хуки
-            hooks = list(opts.get("progress_hooks") or [])
-            hooks.append(hook)
-            opts["progress_hooks"] = hooks
-
-            self.log.info("yt-dlp: start url=%s outdir=%s", url_short, self.dir)
-
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                filepath = ydl.prepare_filename(info)
-                filesize = info.get("filesize") or info.get("filesize_approx")
-                title = info.get("title")
-                ext = info.get("ext")
-
-            t1 = time.monotonic()
-            dur = t1 - t0
-            if filesize:
-                kb = filesize / 1024.0
-                avg_kb_s = kb / dur if dur > 0 else 0.0
-                self.log.info(
-                    "yt-dlp: done url=%s file=%s size=%.1fKB duration=%.2fs avg=%.1fKB/s",
-                    url_short,
-                    filepath,
-                    kb,
-                    dur,
-                    avg_kb_s,
+            elif status == "finished":
+                filename = d.get("filename")
+                elapsed = d.get("elapsed")
+                self.log.info("yt-dlp: finished url=%s file=%s elapsed=%ss", url_short, filename, elapsed)
+
+            elif status == "error":
+                self.log.error("yt-dlp: error url=%s detail=%s", url_short, d)
+
+        # Резервируем место в памяти заранее; в tmpfs воркер пишет, только если оценка
+        # размера по метаданным влезает в резерв, иначе — сразу на диск
+        reserved = 0
+        opts = self._build_opts()
+        if self.memory_dir and self._staged + self.memory_max_file <= self.memory_budget:
+            reserved = self.memory_max_file
+            self._staged += reserved
+            opts["staging"] = {"dir": str(self.memory_dir), "max_bytes": self.memory_max_file}
+        self.log.info("yt-dlp: start url=%s staging=%s mode=%s", url_short, bool(reserved), self.mode)
+
+        if self.mode == "thread":
+            opts["progress_hooks"] = list(opts.get("progress_hooks") or []) + [hook]
+
+        async def attempt() -> dict:
+            nonlocal info
+            # Готовые метаданные — только первой попытке: после сбоя ссылки CDN могли протухнуть
+            job_info, info = info, None
+            if self.mode == "thread":
+                return await self.scheduler.submit(_run_ydl, url, opts, job_info, chat_id=chat_id, user_id=user_id)
+            # В процессе-воркере остаются только yt-dlp и сериализуемые данные:
+            # события прогресса приходят через очередь, результат — словарём
+            relay = _progress_relay()
+            token = relay.register(hook)
+            try:
+                return await self.scheduler.submit(
+                    _run_ydl_in_process, url, opts, token, job_info, chat_id=chat_id, user_id=user_id
                 )
-            else:
-                self.log.info("yt-dlp: done url=%s file=%s duration=%.2fs", url_short, filepath, dur)
+            finally:
+                relay.unregister(token)
+
+        submit_ns = time.time_ns()
+        try:
+            res = await self._guarded(url, attempt)
+        except BaseException as e:
+            self._staged -= reserved
+            if isinstance(e, VideoTooLarge):
+                self.log.warning("yt-dlp: rejected url=%s reason=%s", url_short, e)
+            elif isinstance(e, PlatformUnavailable):
+                self.log.warning("yt-dlp: skipped url=%s reason=%s", url_short, e)
+            elif isinstance(e, Exception):
+                DOWNLOAD_FAILURES.inc()
+                self.log.exception("yt-dlp: failed url=%s error=%s", url_short, e)
+            raise
+
+        parent = current_span()
+        if parent is not None:
+            # Этапы мерил воркер (поток или процесс) — вешаем их в дерево по факту
+            parent.set(platform=res["platform"], mode=self.mode)
+            parent.add_child("queue_wait", submit_ns, max(0, res["started_ns"] - submit_ns) / 1e9)
+            for name, offset, dur in res["stages"]:
+                parent.add_child(name, res["started_ns"] + int(offset * 1e9), dur)
+
+        res["data"] = None
+        res["staged_bytes"] = 0
+        if reserved and not pathlib.Path(res["filepath"]).resolve().is_relative_to(self.memory_dir.resolve()):
+            # Оценки не было или она больше резерва — файл уже на диске
+            self._staged -= reserved
+            reserved = 0
+        if reserved:
+            with span("stage"):
+                res = await self._stage(res, reserved)
 
-            return {
-                "filepath": filepath,
-                "title": title,
-                "ext": ext,
-                "filesize": filesize,
-                "duration_sec": dur,
-            }
+        filepath = res["filepath"]
+        filesize = res["filesize"]
+        dur = res["duration_sec"]
+        saved = res.get("ydl_saved_sec") or 0.0
+        DOWNLOAD_SECONDS.observe(dur, platform=res["platform"], mode=self.mode)
+        DOWNLOAD_BYTES.inc(filesize or 0, platform=res["platform"])
+        if filesize:
+            kb = filesize / 1024.0
+            avg_kb_s = kb / dur if dur > 0 else 0.0
+            self.log.info(
+                "yt-dlp: done url=%s file=%s size=%.1fKB duration=%.2fs avg=%.1fKB/s ydl_saved=%.3fs",
+                url_short,
+                filepath,
+                kb,
+                dur,
+                avg_kb_s,
+                saved,
+            )
+        else:
+            self.log.info(
+                "yt-dlp: done url=%s file=%s duration=%.2fs ydl_saved=%.3fs", url_short, filepath, dur, saved
+            )
 
+        return res
+
+    async def _guarded(self, url: str, attempt: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Запуск attempt с учётом здоровья платформы. Автомат разомкнут — сразу PlatformUnavailable,
+        воркер не занимаем. Временный сбой (таймаут, сеть, 429, 5xx) повторяем с паузой, пока
+        есть попытки и автомат замкнут. Ошибки загрузки выходят как DownloadFailed с категорией.
+        """
+        platform = url_platform(url)
+        breaker = self.health.breaker(platform)
+        tries = 0
+        while True:
+            if not breaker.allow():
+                raise PlatformUnavailable(platform, breaker.retry_in())
+            tries += 1
+            try:
+                res = await attempt()
+            except VideoTooLarge:
+                # Метаданные получены — платформа жива
+                breaker.record_success()
+                raise
+            except DownloadQueueFull:
+                breaker.release()
+                raise
+            except Exception as e:
+                reason = classify(e)
+                if reason in TRANSIENT_REASONS:
+                    breaker.record_failure()
+                elif reason in PERMANENT_REASONS:
+                    breaker.record_success()
+                else:
+                    breaker.release()
+                if reason not in TRANSIENT_REASONS or tries > self.retries or breaker.state != "closed":
+                    if isinstance(e, DownloadFailed):
+                        e.platform = e.platform or platform
+                        raise
+                    raise DownloadFailed(reason, str(e), platform) from e
+                delay = backoff(tries, self.retry_base, self.retry_max)
+                DOWNLOAD_RETRIES.inc(platform=platform, reason=reason)
+                self.log.warning(
+                    "yt-dlp: retry url=%s attempt=%s reason=%s in=%.1fs err=%s",
+                    url if len(url) <= 128 else url[:125] + "...",
+                    tries + 1,
+                    reason,
+                    delay,
+                    e,
+                )
+                await asyncio.sleep(delay)
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+                return res
+
+    async def _stage(self, res: dict, reserved: int) -> dict:
+        """Файл в tmpfs: маленький читаем в память, большой переносим на диск."""
+        src = res["filepath"]
         loop = asyncio.get_running_loop()
         try:
-            return await loop.run_in_executor(None, _run)
+            size = os.path.getsize(src)
+            if size > self.memory_max_file:
+                dst = str(self.dir / os.path.basename(src))
+                await loop.run_in_executor(None, shutil.move, src, dst)
+                self._staged -= reserved
+                self.log.info("yt-dlp: spill file=%s size=%s staged=%s", dst, size, self._staged)
+                return dict(res, filepath=dst)
+
+            data = await loop.run_in_executor(None, pathlib.Path(src).read_bytes)
+        except BaseException:
+            self._staged -= reserved
+            with contextlib.suppress(Exception):
+                os.remove(src)
+            raise
+
+        with contextlib.suppress(Exception):
+            os.remove(src)
+        self._staged += size - reserved
+        self.log.debug("yt-dlp: staged in memory file=%s size=%s staged=%s", src, size, self._staged)
+        return dict(res, data=data, staged_bytes=size)
+
+    def _build_opts(self) -> Dict[str, Any]:
+        # Базовые опции
+        opts = dict(self.ydl_opts)
+        opts.setdefault("noplaylist", True)
+        opts.setdefault("restrictfilenames", True)
+        opts.setdefault("format", "mp4/bestvideo+bestaudio/best")
+        opts.setdefault("merge_output_format", "mp4")
+        opts.setdefault("quiet", True)
+        opts.setdefault("no_warnings", True)
+        if "format" not in self.ydl_opts:
+            # Явный format в ydl_opts — выбор за вызывающим
+            opts.setdefault("size_budget", self.size_budget)
+        opts.setdefault("faststart", self.faststart)
+
+        # Шаблон имени
+        opts.setdefault("outtmpl", "%(title).200s-%(id)s.%(ext)s")
+        # Папка задаётся отдельно от шаблона: экземпляр YoutubeDL тот же для памяти и диска
+        opts["paths"] = dict(opts.get("paths") or {}, home=str(self.dir))
+
+        if self.mode == "process" and opts.pop("progress_hooks", None):
+            # Функции не передать в другой процесс
+            self.log.warning("yt-dlp: progress_hooks from ydl_opts are ignored in process mode")
+        return opts
+
+    async def probe_stream(
+        self,
+        url: str,
+        *,
+        chat_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+    ) -> dict:
+        """
+        Экстракция без загрузки (через тот же пул и очередь). Результат — как у _download,
+        только без filepath/duration_sec, плюс "streamable" и "info" (метаданные для
+        download(info=…), если поток не выйдет); для потоковых форматов —
+        "stream_url", "http_headers", "filename", "thumbnail".
+        """
+        url_short = url if len(url) <= 128 else url[:125] + "..."
+        opts = self._build_opts()
+        opts.pop("progress_hooks", None)
+        fn = _probe_ydl_in_process if self.mode == "process" else _probe_ydl
+        t0 = time.monotonic()
+        try:
+            with span("probe"):
+                res = await self._guarded(
+                    url, lambda: self.scheduler.submit(fn, url, opts, chat_id=chat_id, user_id=user_id)
+                )
+        except PlatformUnavailable as e:
+            self.log.warning("yt-dlp: probe skipped url=%s reason=%s", url_short, e)
+            raise
         except Exception as e:
-            self.log.exception("yt-dlp: failed url=%s error=%s", url_short, e)
+            self.log.exception("yt-dlp: probe failed url=%s error=%s", url_short, e)
             raise
+        self.log.info(
+            "yt-dlp: probe url=%s streamable=%s size=%s took=%.2fs",
+            url_short,
+            res["streamable"],
+            res["filesize"] or "unknown",
+            time.monotonic() - t0,
+        )
+        return res
+
+    def open_stream(self, probe: dict) -> StreamInputFile:
+        """InputFile для send_video, читающий видео прямо с CDN по результату probe_stream."""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30),
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+            )
+        return StreamInputFile(
+            probe["stream_url"],
+            session=self._http,
+            headers=probe["http_headers"],
+            filename=probe["filename"],
+        )
+
+    async def warm_up(self) -> None:
+        """
+        Заранее создаёт YoutubeDL в воркерах, чтобы первые ссылки не платили
+        за инициализацию. Ошибки прогрева не критичны.
+        Прогрев идёт параллельно с приёмом ссылок, поэтому воркеров не держим: задачи
+        короткие и ничего не ждут; поток, которому не досталась ни одна, создаст
+        YoutubeDL на первой загрузке (а импорт yt-dlp к тому времени уже сделан).
+        """
+        if not (self.ydl_opts.get("ffmpeg_location") or shutil.which("ffmpeg")):
+            # Всё это молча пропускается по одному на каждую загрузку — говорим один раз при старте
+            self.log.warning(
+                "ffmpeg_missing: format merge, faststart and thumbnails are disabled", extra={"notify": True}
+            )
+        loop = asyncio.get_running_loop()
+        workers = self.scheduler.workers
+        opts = self._build_opts()
+        opts.pop("progress_hooks", None)
+        t0 = time.monotonic()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self.scheduler.executor, _warm_ydl, opts) for _ in range(workers)),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        # 0 — поток уже был прогрет другой задачей
+        setups = [r for r in results if not isinstance(r, BaseException) and r > 0]
+        if errors:
+            self.log.warning("yt-dlp: warm_up failed errors=%s first=%s", len(errors), errors[0])
+        self.log.info(
+            "yt-dlp: warm_up instances=%s setup_max=%.3fs took=%.2fs mode=%s",
+            len(setups),
+            max(setups, default=0.0),
+            time.monotonic() - t0,
+            self.mode,
+        )
+
+    async def close(self) -> None:
+        await self.scheduler.close()
+        if self.mode == "thread":
+            _close_ydls()
+        if self._http is not None:
+            await self._http.close()
+        if self._private:
+            # Остатки этого процесса (файлы, которые никто уже не отправит)
+            for d in (self.dir, self.memory_dir):
+                if d is not None:
+                    shutil.rmtree(d, ignore_errors=True)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import pathlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+log = logging.getLogger("hidden_protocol.cache")
+
+VideoKey = Tuple[str, str]  # (platform, video_id)
+
+
+def _key_str(key: VideoKey) -> str:
+    platform, video_id = key
+    return f"{platform}:{video_id}"
+
+
+class SQLiteFileIdStore:
+    """Хранилище file_id в локальном SQLite (переживает рестарт бота)."""
+
+    def __init__(self, path: str):
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            " key TEXT PRIMARY KEY,"
+            " file_id TEXT NOT NULL,"
+            " updated_at REAL DEFAULT (strftime('%s','now')))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT file_id FROM file_ids WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, file_id: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO file_ids (key, file_id) VALUES (?, ?)",
+                (key, file_id),
+            )
+            self._db.commit()
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+            self._db.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._get, key)
+
+    async def set(self, key: str, file_id: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self._set, key, file_id)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self._delete, key)
+
+
+class RedisFileIdStore:
+    """Хранилище file_id в Redis (общее для нескольких процессов/реплик)."""
+
+    def __init__(self, url: str, prefix: str = "hp:file_id:", ttl: Optional[int] = None):
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self._ttl = ttl
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._redis.get(self._prefix + key)
+
+    async def set(self, key: str, file_id: str) -> None:
+        await self._redis.set(self._prefix + key, file_id, ex=self._ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self._prefix + key)
+
+
+class FileIdCache:
+    """
+    Кэш (platform, video_id) → Telegram file_id.
+    Первый уровень — LRU в памяти, второй (опционально) — SQLite или Redis.
+    Ошибки второго уровня не мешают работе: логируем и идём дальше.
+    """
+
+    def __init__(self, max_size: int = 1024, store=None):
+        self.max_size = max_size
+        self.store = store
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "FileIdCache":
+        backend = (cfg.get("FILE_ID_CACHE_BACKEND") or "memory").lower()
+        store = None
+        if backend == "sqlite":
+            store = SQLiteFileIdStore(cfg["FILE_ID_CACHE_PATH"])
+        elif backend == "redis":
+            if not cfg.get("REDIS_URL"):
+                raise ValueError("❌ FILE_ID_CACHE_BACKEND=redis требует REDIS_URL")
+            store = RedisFileIdStore(cfg["REDIS_URL"], ttl=cfg.get("FILE_ID_CACHE_TTL"))
+        elif backend != "memory":
+            raise ValueError(f"❌ Неизвестный FILE_ID_CACHE_BACKEND: {backend}")
+        return cls(max_size=cfg.get("FILE_ID_CACHE_SIZE", 1024), store=store)
+
+    def _remember(self, key: str, file_id: str) -> None:
+        self._lru[key] = file_id
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    async def get(self, key: VideoKey) -> Optional[str]:
+        k = _key_str(key)
+        file_id = self._lru.get(k)
+        if file_id is not None:
+            self._lru.move_to_end(k)
+            return file_id
+
+        if self.store is None:
+            return None
+        try:
+            file_id = await self.store.get(k)
+        except Exception as e:
+            log.warning("file_id_cache_get_fail key=%s err=%s", k, e)
+            return None
+        if file_id:
+            self._remember(k, file_id)
+        return file_id
+
+    async def set(self, key: VideoKey, file_id: str) -> None:
+        k = _key_str(key)
+        self._remember(k, file_id)
+        if self.store is not None:
+            try:
+                await self.store.set(k, file_id)
+            except Exception as e:
+                log.warning("file_id_cache_set_fail key=%s err=%s", k, e)
+
+    async def delete(self, key: VideoKey) -> None:
+        k = _key_str(key)
+        self._lru.pop(k, None)
+        if self.store is not None:
+            try:
+                await self.store.delete(k)
+            except Exception as e:
+                log.warning("file_id_cache_delete_fail key=%s err=%s", k, e)
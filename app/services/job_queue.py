@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from app.services.upstream_health import backoff
+
+log = logging.getLogger("hidden_protocol.jobs")
+
+# Статусы задания: queued → running → done | failed (в т.ч. после исчерпания попыток)
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+class RedisJobQueue:
+    """
+    Очередь заданий на загрузку в Redis: бот кладёт, воркеры (python -m app.worker) забирают.
+
+    Ключи (prefix = "hp:jobs"):
+      {prefix}:ready       — список id, ждущих воркера
+      {prefix}:processing  — список id, взятых в работу
+      {prefix}:leases      — zset id → дедлайн аренды (visibility timeout)
+      {prefix}:job:{id}    — hash: payload (JSON), attempts, status, created_at/started_at/finished_at,
+                             result (JSON); после завершения живёт ещё result_ttl секунд
+      {prefix}:delayed     — zset id → время, раньше которого повтор не брать (nack с паузой)
+      {prefix}:dead        — список id, исчерпавших попытки
+
+    Взятие атомарно (BRPOPLPUSH ready → processing). Если воркер упал и не продлил
+    аренду, задание возвращается в ready при следующем reserve любого воркера.
+    Неудачная попытка ждёт в delayed с растущей паузой (retry_base × 2ⁿ, до retry_max):
+    пока платформа лежит, попытки не сгорают за миллисекунды.
+    Клиент можно передать готовым (например, fakeredis.aioredis.FakeRedis).
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        prefix: str = "hp:jobs",
+        visibility_timeout: int = 600,
+        max_attempts: int = 3,
+        result_ttl: int = 86400,
+        retry_base: float = 10.0,
+        retry_max: float = 300.0,
+        client=None,
+    ):
+        if client is None:
+            import redis.asyncio as aioredis
+
+            client = aioredis.Redis.from_url(url, decode_responses=True)
+        self._redis = client
+        self.prefix = prefix
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.result_ttl = result_ttl
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._ready = f"{prefix}:ready"
+        self._processing = f"{prefix}:processing"
+        self._leases = f"{prefix}:leases"
+        self._dead = f"{prefix}:dead"
+        self._delayed = f"{prefix}:delayed"
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> Optional["RedisJobQueue"]:
+        """None — очередь не нужна (JOB_QUEUE_BACKEND=local, загрузки в процессе бота)."""
+        backend = (cfg.get("JOB_QUEUE_BACKEND") or "local").lower()
+        if backend == "local":
+            return None
+        if backend != "redis":
+            raise ValueError(f"❌ Неизвестный JOB_QUEUE_BACKEND: {backend}")
+        if not cfg.get("REDIS_URL"):
+            raise ValueError("❌ JOB_QUEUE_BACKEND=redis требует REDIS_URL")
+        return cls(
+            cfg["REDIS_URL"],
+            visibility_timeout=cfg.get("JOB_VISIBILITY_TIMEOUT", 600),
+            max_attempts=cfg.get("JOB_MAX_ATTEMPTS", 3),
+            result_ttl=cfg.get("JOB_RESULT_TTL", 86400),
+            retry_base=cfg.get("JOB_RETRY_BASE", 10.0),
+            retry_max=cfg.get("JOB_RETRY_MAX", 300.0),
+        )
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                self._job_key(job_id),
+                mapping={"payload": json.dumps(payload), "attempts": 0, "status": "queued", "created_at": time.time()},
+            )
+            pipe.lpush(self._ready, job_id)
+            await pipe.execute()
+        return job_id
+
+    async def reserve(self, timeout: int = 5) -> Optional[Tuple[str, Dict[str, Any], int]]:
+        """Берёт задание в работу: (id, payload, номер попытки) или None по таймауту."""
+        await self.requeue_expired()
+        job_id = await self._redis.brpoplpush(self._ready, self._processing, timeout=timeout)
+        if job_id is None:
+            return None
+
+        await self._redis.zadd(self._leases, {job_id: time.time() + self.visibility_timeout})
+        attempts = await self._redis.hincrby(self._job_key(job_id), "attempts", 1)
+        await self._redis.hset(self._job_key(job_id), mapping={"status": "running", "started_at": time.time()})
+        raw = await self._redis.hget(self._job_key(job_id), "payload")
+        if raw is None:
+            # Задание без тела (удалено вручную) — просто выбрасываем
+            log.warning("job_missing id=%s", job_id)
+            await self.ack(job_id)
+            return None
+        return job_id, json.loads(raw), attempts
+
+    async def extend(self, job_id: str) -> None:
+        """Продлевает аренду: воркер жив и ещё работает над заданием."""
+        await self._redis.zadd(self._leases, {job_id: time.time() + self.visibility_timeout}, xx=True)
+
+    async def ack(self, job_id: str, result: Optional[Dict[str, Any]] = None) -> None:
+        """Задание выполнено (result — итог VideoRouter.deliver); статус хранится result_ttl секунд."""
+        status = "done" if (result or {}).get("ok", True) else "failed"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self._processing, 1, job_id)
+            pipe.zrem(self._leases, job_id)
+            if self.result_ttl:
+                pipe.hset(
+                    self._job_key(job_id),
+                    mapping={"status": status, "finished_at": time.time(), "result": json.dumps(result or {})},
+                )
+                pipe.expire(self._job_key(job_id), self.result_ttl)
+            else:
+                pipe.delete(self._job_key(job_id))
+            await pipe.execute()
+
+    async def nack(self, job_id: str, attempts: int, delay: float = 0.0) -> None:
+        """
+        Задание не удалось: повтор не раньше чем через backoff(attempts) — или delay,
+        если он больше (например, сколько ещё разомкнут автомат платформы); в dead, если попытки кончились.
+        """
+        dead = attempts >= self.max_attempts
+        wait = 0.0 if dead else max(delay, backoff(attempts, self.retry_base, self.retry_max))
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self._processing, 1, job_id)
+            pipe.zrem(self._leases, job_id)
+            if dead:
+                pipe.lpush(self._dead, job_id)
+            else:
+                pipe.zadd(self._delayed, {job_id: time.time() + wait})
+            pipe.hset(self._job_key(job_id), "status", "failed" if dead else "queued")
+            await pipe.execute()
+        log.info("job_nack id=%s attempts=%s -> %s", job_id, attempts, self._dead if dead else f"retry in {wait:.1f}s")
+
+    async def promote_delayed(self) -> int:
+        """Переносит в ready повторы, чья пауза прошла."""
+        moved = 0
+        for job_id in await self._redis.zrangebyscore(self._delayed, "-inf", time.time()):
+            # ZREM вернёт 0, если другой воркер успел раньше — тогда не дублируем
+            if await self._redis.zrem(self._delayed, job_id):
+                await self._redis.lpush(self._ready, job_id)
+                moved += 1
+        return moved
+
+    async def requeue_expired(self) -> int:
+        """
+        Возвращает в ready задания, чья аренда истекла (воркер упал или завис),
+        и повторы из delayed, чья пауза прошла. Повтор, ставший готовым, пока воркер ждёт
+        в BRPOPLPUSH, возьмут при следующем reserve (не позже его timeout).
+        """
+        now = time.time()
+        moved = await self.promote_delayed()
+        for job_id in await self._redis.lrange(self._processing, 0, -1):
+            deadline = await self._redis.zscore(self._leases, job_id)
+            if deadline is None:
+                # Только что взято и аренда ещё не записана — или воркер упал ровно между
+                # BRPOPLPUSH и ZADD. Даём полный срок, дальше сработает обычная проверка.
+                await self._redis.zadd(self._leases, {job_id: now + self.visibility_timeout}, nx=True)
+                continue
+            if deadline > now:
+                continue
+            # LREM вернёт 0, если другой воркер успел раньше — тогда не дублируем
+            if await self._redis.lrem(self._processing, 1, job_id):
+                attempts = int(await self._redis.hget(self._job_key(job_id), "attempts") or 0)
+                # Задание, которое раз за разом роняет воркер, тоже не крутим вечно
+                target = self._dead if attempts >= self.max_attempts else self._ready
+                await self._redis.zrem(self._leases, job_id)
+                await self._redis.lpush(target, job_id)
+                await self._redis.hset(self._job_key(job_id), "status", "failed" if target == self._dead else "queued")
+                moved += 1
+                log.warning("job_requeue id=%s attempts=%s reason=lease_expired -> %s", job_id, attempts, target)
+        return moved
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Запись задания для GET /jobs/{id}: как у LocalJobStore, None — нет или истекла."""
+        raw = await self._redis.hgetall(self._job_key(job_id))
+        if not raw or "payload" not in raw:
+            return None
+        return {
+            "status": raw.get("status", "queued"),
+            "attempts": int(raw.get("attempts") or 0),
+            "payload": json.loads(raw["payload"]),
+            "result": json.loads(raw["result"]) if raw.get("result") else None,
+            **{k: float(raw[k]) for k in ("created_at", "started_at", "finished_at") if raw.get(k)},
+        }
+
+    async def stats(self) -> Dict[str, int]:
+        return {
+            "ready": await self._redis.llen(self._ready),
+            "processing": await self._redis.llen(self._processing),
+            "delayed": await self._redis.zcard(self._delayed),
+            "dead": await self._redis.llen(self._dead),
+        }
+
+    async def close(self) -> None:
+        await self._redis.close()
+
+
+class LocalJobStore:
+    """
+    Статусы заданий HTTP API без Redis (JOB_QUEUE_BACKEND=local): задания выполняются
+    в процессе API, записи — в памяти, последние max_jobs штук.
+    """
+
+    def __init__(self, max_jobs: int = 10000):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def create(self, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {"status": "queued", "attempts": 0, "payload": payload, "result": None, "created_at": time.time()}
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return job_id
+
+    def update(self, job_id: str, **fields) -> None:
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+    async def stats(self) -> Dict[str, int]:
+        counts = {"queued": 0, "running": 0}
+        for job in self._jobs.values():
+            if job["status"] in counts:
+                counts[job["status"]] += 1
+        return counts
+
+
+def job_view(job_id: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Статус задания для клиента: куда, что вышло и сколько заняло каждое звено."""
+    payload = record["payload"]
+    send_kwargs = payload.get("send_kwargs") or {}
+    result = record.get("result") or {}
+    timings = dict(result.get("timings") or {})
+    if record.get("started_at") and record.get("created_at"):
+        timings["queue_wait"] = record["started_at"] - record["created_at"]
+    return {
+        "id": job_id,
+        "status": record["status"],
+        "origin": payload.get("origin", "bot"),
+        "url": payload.get("url"),
+        "chat_id": send_kwargs.get("chat_id"),
+        "thread_id": send_kwargs.get("message_thread_id"),
+        "message_id": result.get("message_id"),
+        "error": result.get("error"),
+        "reason": result.get("reason"),
+        "attempts": record.get("attempts", 0),
+        "created_at": record.get("created_at"),
+        "started_at": record.get("started_at"),
+        "finished_at": record.get("finished_at"),
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+    }
+
+
+async def send_callback(url: str, body: Dict[str, Any], attempts: int = 3) -> bool:
+    """POST статуса на callback_url клиента; пара повторов с паузой, потом сдаёмся."""
+    timeout = aiohttp.ClientTimeout(total=10)
+    for attempt in range(1, attempts + 1):
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.post(url, json=body) as resp:
+                    if resp.status < 300:
+                        return True
+                    log.warning("job_callback_fail id=%s status=%s attempt=%s", body.get("id"), resp.status, attempt)
+        except Exception as e:
+            log.warning("job_callback_fail id=%s err=%s attempt=%s", body.get("id"), e, attempt)
+        if attempt < attempts:
+            await asyncio.sleep(2 ** attempt)
+    return False
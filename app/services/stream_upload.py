@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+import logging
+from typing import AsyncGenerator, Dict, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiogram.types import InputFile
+
+log = logging.getLogger("hidden_protocol.stream")
+
+CHUNK_SIZE = 256 * 1024
+
+
+class StreamInputFile(InputFile):
+    """
+    Видео для send_video, которое читается прямо с CDN.
+    Байты идут через ограниченный буфер (buffer_chunks × chunk_size) в multipart-загрузку
+    Telegram: отправка начинается, пока видео ещё качается, на диск ничего не пишется.
+    Читается один раз: повторное чтение — RuntimeError, а RateLimitMiddleware такие запросы
+    после 429 не повторяет (reusable = False) — вызывающий отправляет заново другим путём.
+    """
+
+    reusable = False
+
+    def __init__(
+        self,
+        url: str,
+        session: aiohttp.ClientSession,
+        headers: Optional[Dict[str, str]] = None,
+        filename: Optional[str] = None,
+        chunk_size: int = CHUNK_SIZE,
+        buffer_chunks: int = 16,
+    ):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.url = url
+        self.session = session
+        self.headers = headers or {}
+        self.buffer_chunks = buffer_chunks
+        self.bytes_read = 0
+        self._consumed = False
+
+    async def _pump(self, queue: "asyncio.Queue") -> None:
+        try:
+            async with self.session.get(self.url, headers=self.headers) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    await queue.put(chunk)
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        if self._consumed:
+            # Половина видео уже ушла в прошлый запрос — второй раз поток с CDN не склеить
+            raise RuntimeError(f"stream already consumed url={self.url[:128]}")
+        self._consumed = True
+        queue: "asyncio.Queue" = asyncio.Queue(maxsize=self.buffer_chunks)
+        pump = asyncio.ensure_future(self._pump(queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    # Обрыв CDN посреди загрузки: Telegram получит неполный файл — роняем запрос целиком
+                    log.warning("stream_read_fail url=%s bytes=%s err=%s", self.url[:128], self.bytes_read, item)
+                    raise item
+                self.bytes_read += len(item)
+                yield item
+        finally:
+            pump.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await pump
@@ -0,0 +1,220 @@
+import logging
+import random
+import re
+import time
+from typing import Dict, Iterator, Optional
+
+from app.utils.metrics import UPSTREAM_CIRCUIT
+
+log = logging.getLogger("hidden_protocol.upstream")
+
+# --- Таксономия ошибок загрузки ---
+# Платформа недоступна: повтор через паузу может помочь, подряд такие сбои открывают автомат
+TRANSIENT_REASONS = frozenset({"timeout", "network", "rate_limited", "upstream", "unavailable"})
+# Платформа ответила, но видео не отдать: повтор не поможет, на здоровье платформы не влияет
+PERMANENT_REASONS = frozenset({"too_large", "restricted", "not_found", "unsupported"})
+
+# Порядок, если в цепочке исключений нашлось несколько признаков: конкретное важнее общего
+_PRIORITY = ("restricted", "not_found", "unsupported", "rate_limited", "upstream", "timeout", "network")
+
+_NETWORK_ERRORS = frozenset({"TransportError", "ClientConnectionError", "NewConnectionError", "NameResolutionError"})
+
+_HTTP_STATUS_RE = re.compile(r"http error (\d{3})")
+_NOT_FOUND_RE = re.compile(r"\b404\b")
+
+# То, что yt-dlp сообщает только текстом (ExtractorError без типа и причины)
+_TEXT_RULES = (
+    ("restricted", ("unavailable for certain audiences", "may be inappropriate", "geo restriction")),
+    ("unsupported", ("unsupported url", "no suitable format", "requested format is not available")),
+    ("rate_limited", ("too many requests", "rate-limit")),
+    ("timeout", ("timed out",)),
+    ("network", (
+        "connection reset", "connection refused", "connection aborted", "network is unreachable",
+        "name or service not known", "temporary failure in name resolution", "remote end closed connection",
+    )),
+)
+
+
+class DownloadFailed(Exception):
+    """
+    Загрузка не удалась. reason — категория из таксономии (timeout, not_found, …),
+    platform — tiktok/instagram, если известна. Пиклится: ходит из процессов пула.
+    """
+
+    def __init__(self, reason: str, message: str, platform: Optional[str] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.platform = platform
+
+    @property
+    def transient(self) -> bool:
+        return self.reason in TRANSIENT_REASONS
+
+    def __reduce__(self):
+        return type(self), (self.reason, str(self), self.platform)
+
+
+class PlatformUnavailable(DownloadFailed):
+    """Автомат платформы разомкнут: задачу отклоняем сразу, не занимая воркер."""
+
+    def __init__(self, platform: Optional[str], retry_in: float):
+        # retry_in == 0 — автомат в half_open и пробная загрузка уже идёт
+        state = f"circuit open for {retry_in:.0f}s" if retry_in > 0 else "recovering, probe in flight"
+        super().__init__("unavailable", f"{platform or 'upstream'} is failing, {state}", platform)
+        self.retry_in = retry_in
+
+    def __reduce__(self):
+        return type(self), (self.platform, self.retry_in)
+
+
+def _chain(e: BaseException) -> Iterator[BaseException]:
+    """Само исключение и его причины: exc_info у DownloadError, cause у ExtractorError, __cause__/__context__."""
+    seen = set()
+    queue = [e]
+    while queue:
+        x = queue.pop(0)
+        if x is None or id(x) in seen:
+            continue
+        seen.add(id(x))
+        yield x
+        exc_info = getattr(x, "exc_info", None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1 and isinstance(exc_info[1], BaseException):
+            queue.append(exc_info[1])
+        cause = getattr(x, "cause", None)
+        if isinstance(cause, BaseException):
+            queue.append(cause)
+        queue += [x.__cause__, x.__context__]
+
+
+def _typed_reason(x: BaseException) -> Optional[str]:
+    # Имена классов, а не isinstance: yt-dlp и urllib3 сюда не импортируем
+    names = {c.__name__ for c in type(x).__mro__}
+    if "GeoRestrictedError" in names:
+        return "restricted"
+    if "UnsupportedError" in names:
+        return "unsupported"
+    status = getattr(x, "status", None) or getattr(x, "code", None)
+    if "HTTPError" in names or "ClientResponseError" in names:
+        if status in (404, 410):
+            return "not_found"
+        if status == 429:
+            return "rate_limited"
+        if isinstance(status, int) and status >= 500:
+            return "upstream"
+    # Сеть раньше таймаута: NewConnectionError и NameResolutionError в urllib3 —
+    # подклассы ConnectTimeoutError, а DNS и отказ в соединении — не таймаут
+    if isinstance(x, ConnectionError) or names & _NETWORK_ERRORS:
+        return "network"
+    if isinstance(x, TimeoutError) or any("Timeout" in n for n in names):
+        return "timeout"
+    return None
+
+
+def _text_reason(text: str) -> Optional[str]:
+    m = _HTTP_STATUS_RE.search(text)
+    if m:
+        status = int(m.group(1))
+        if status in (404, 410):
+            return "not_found"
+        if status == 429:
+            return "rate_limited"
+        if status >= 500:
+            return "upstream"
+    if _NOT_FOUND_RE.search(text):
+        return "not_found"
+    for reason, needles in _TEXT_RULES:
+        if any(n in text for n in needles):
+            return reason
+    return None
+
+
+def classify(e: BaseException) -> str:
+    """
+    Категория ошибки загрузки: restricted | not_found | unsupported | rate_limited | upstream |
+    timeout | network | unavailable | other. Сначала по типам в цепочке причин, текст — запасной путь.
+    """
+    if isinstance(e, DownloadFailed):
+        return e.reason
+    found = set()
+    for x in _chain(e):
+        reason = _typed_reason(x) or _text_reason(str(x).lower())
+        if reason:
+            found.add(reason)
+    return next((r for r in _PRIORITY if r in found), "other")
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Пауза перед попыткой attempt + 1: экспонента с джиттером, чтобы повторы не шли залпом."""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """
+    Автомат одной платформы. closed — пропускает всё; после threshold временных сбоев
+    подряд — open: задачи отклоняются сразу; через cooldown — half_open: проходит одна
+    пробная задача, её успех замыкает автомат, сбой — снова размыкает.
+    """
+
+    _STATE_VALUE = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, platform: str, threshold: int = 5, cooldown: float = 30.0):
+        self.platform = platform
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        UPSTREAM_CIRCUIT.set_function(lambda: self._STATE_VALUE[self.state], platform=platform)
+
+    def retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.cooldown - time.monotonic()) if self.state == "open" else 0.0
+
+    def allow(self) -> bool:
+        """Можно ли запускать задачу. В half_open — только одну, до её исхода."""
+        if self.state == "open":
+            if self.retry_in() > 0:
+                return False
+            self.state, self._probing = "half_open", False
+            log.info("circuit_half_open platform=%s", self.platform)
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        """Платформа ответила (в том числе «видео нет»): счётчик сбоев обнуляется."""
+        if self.state != "closed":
+            log.info("circuit_closed platform=%s", self.platform)
+        self.state, self.failures, self._probing = "closed", 0, False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+            log.warning(
+                "circuit_open platform=%s failures=%s cooldown=%.0fs", self.platform, self.failures, self.cooldown,
+                extra={"notify": True},
+            )
+            self.state, self._opened_at, self._probing = "open", time.monotonic(), False
+
+    def release(self) -> None:
+        """Задача закончилась без вывода о платформе (отмена, своя ошибка) — проба снова свободна."""
+        self._probing = False
+
+
+class UpstreamHealth:
+    """Автоматы по платформам; создаются при первой задаче платформы."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, platform: Optional[str]) -> CircuitBreaker:
+        key = platform or "other"
+        b = self._breakers.get(key)
+        if b is None:
+            b = self._breakers[key] = CircuitBreaker(key, self.threshold, self.cooldown)
+        return b
@@ -1,8 +1,21 @@
+import atexit
+import glob
+import gzip
+import json
 import os
-import time
+import queue
+import shutil
+import threading
 import logging
-from logging.handlers import RotatingFileHandler
-from datetime import datetime, timedelta, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from datetime import datetime, time as dtime, timedelta
+
+# Время в логах и границы суток — по Астане
+TZ_OFFSET = timedelta(hours=5)
+LOG_DIR = "logs"
+
+# Фоновый поток логгера hidden_protocol (создаёт setup_logger)
+_listener: "QueueListener | None" = None
 
 class NotifyOrErrorFilter(logging.Filter):
     """Пропускает записи, если level>=ERROR или record.notify == True."""
@@ -15,7 +28,7 @@ class TZFormatter(logging.Formatter):
     def converter(self, timestamp):
         # Преобразуем timestamp (в секундах) в UTC+5
         utc_time = datetime.utcfromtimestamp(timestamp)
-        return utc_time + timedelta(hours=5)
+        return utc_time + TZ_OFFSET
 
     def formatTime(self, record, datefmt=None):
         dt = self.converter(record.created)
@@ -24,31 +37,125 @@ class TZFormatter(logging.Formatter):
         return dt.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def setup_logger(level: str = "INFO") -> logging.Logger:
-    os.makedirs("logs", exist_ok=True)
+class JSONLinesFormatter(TZFormatter):
+    """Одна запись — одна JSON-строка (LOG_FORMAT=json)."""
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}+05:00",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь почти как есть: очередь в том же процессе, пиклить не нужно.
+    %-подстановка — здесь, как в QueueHandler.prepare: args могут быть изменяемыми
+    объектами, которые вызывающий поменяет раньше, чем до записи дойдёт listener.
+    Traceback и остальное форматирование — в потоке QueueListener.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class DailyRotatingFileHandler(TimedRotatingFileHandler):
+    """
+    Файл logs/bot_log.log, ротация в полночь по UTC+5.
+    Старый день → logs/bot_log_YYYY-MM-DD.log.gz; сжатие и чистка старше backup_days — в фоне.
+    """
+    def __init__(self, filename: str, backup_days: int = 14):
+        midnight_utc = (datetime.min + (timedelta(days=1) - TZ_OFFSET)).time()
+        super().__init__(
+            filename, when="midnight", utc=True, atTime=dtime(midnight_utc.hour, midnight_utc.minute),
+            encoding="utf-8",
+        )
+        # В суффиксе — UTC-начало периода с часами: дату по UTC+5 считает namer
+        self.suffix = "%Y-%m-%d_%H-%M"
+        self.backup_days = backup_days
+        self.namer = self._day_name
+        self.rotator = self._rotate
+
+    def _day_name(self, default_name: str) -> str:
+        stamp = default_name.rsplit(".", 1)[-1]
+        day = (datetime.strptime(stamp, self.suffix) + TZ_OFFSET).strftime("%Y-%m-%d")
+        base, ext = os.path.splitext(self.baseFilename)
+        return f"{base}_{day}{ext}"
+
+    def _rotate(self, source: str, dest: str) -> None:
+        if not os.path.exists(source):
+            return
+        os.replace(source, dest)
+        threading.Thread(target=self._compress, args=(dest,), name="log-gzip", daemon=True).start()
+
+    def _compress(self, path: str) -> None:
+        try:
+            with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+
+            base, ext = os.path.splitext(self.baseFilename)
+            old = sorted(glob.glob(f"{base}_*{ext}.gz"))
+            for stale in old[:-self.backup_days] if self.backup_days > 0 else []:
+                os.remove(stale)
+        except Exception:
+            pass  # сжатие — не повод ронять логирование
+
+
+def setup_logger(level: str = "INFO", fmt_name: str = "text", backup_days: int = 14) -> logging.Logger:
+    """
+    Логгер hidden_protocol. Вызывающий поток (в том числе event loop) только кладёт запись
+    в очередь; форматирование, консоль и файл — в фоновом потоке QueueListener.
+    """
+    os.makedirs(LOG_DIR, exist_ok=True)
     log = logging.getLogger("hidden_protocol")
     if log.handlers:
         return log
 
     log.setLevel(level.upper())
 
-    fmt = TZFormatter(
-        "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
+    if fmt_name.lower() == "json":
+        fmt = JSONLinesFormatter()
+    else:
+        fmt = TZFormatter(
+            "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
 
     # Консольный вывод
     ch = logging.StreamHandler()
     ch.setFormatter(fmt)
     ch.setLevel(level.upper())
-    log.addHandler(ch)
 
-    # Файл с ротацией
-    file_name = datetime.now(timezone.utc).astimezone(timezone(timedelta(hours=5))).strftime("bot_log_%Y-%m-%d.log")
-    fh = RotatingFileHandler(os.path.join("logs", file_name),
-                             maxBytes=2_000_000, backupCount=5, encoding="utf-8")
+    # Файл с ежедневной ротацией
+    fh = DailyRotatingFileHandler(os.path.join(LOG_DIR, "bot_log.log"), backup_days=backup_days)
     fh.setFormatter(fmt)
     fh.setLevel(logging.DEBUG)
-    log.addHandler(fh)
 
-    return log
\ No newline at end of file
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    global _listener
+    _listener = QueueListener(q, ch, fh, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # дописываем хвост очереди при выходе
+    log.addHandler(_DeferredQueueHandler(q))
+
+    return log
+
+
+def add_background_handler(handler: logging.Handler) -> None:
+    """
+    Ещё один handler логгера hidden_protocol — в потоке QueueListener, рядом с консолью и файлом:
+    его emit (traceback, обрезка текста) не занимает поток, который пишет лог.
+    До setup_logger — обычный handler на логгере.
+    """
+    if _listener is None:
+        logging.getLogger("hidden_protocol").addHandler(handler)
+        return
+    # Поток listener каждый раз читает handlers заново; кортеж заменяется целиком
+    _listener.handlers = _listener.handlers + (handler,)
@@ -0,0 +1,239 @@
+import bisect
+import logging
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+log = logging.getLogger("hidden_protocol.metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Секунды: от file_id-повтора (~0.1 с) до долгих загрузок
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()  # пишут и event loop, и потоки загрузок
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield f"{self.name}{_fmt_labels(self.label_names, key)} {_fmt_value(v)}"
+
+
+class Gauge(_Metric):
+    """Значение задаётся set/inc или считается при сборе через set_function (глубина очереди и т.п.)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float], **labels) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                items[key] = fn()
+            except Exception:
+                continue
+        for key, v in items.items():
+            yield f"{self.name}{_fmt_labels(self.label_names, key)} {_fmt_value(v)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values → [счётчики по корзинам..., +Inf], сумма
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[idx] += 1
+            total[0] += value
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(k, list(c), t[0]) for k, (c, t) in self._values.items()]
+        for key, counts, total in items:
+            acc = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                acc += n
+                le = 'le="%s"' % _fmt_value(bound)
+                yield f"{self.name}_bucket{_fmt_labels(self.label_names, key, le)} {acc}"
+            yield f"{self.name}_sum{_fmt_labels(self.label_names, key)} {_fmt_value(total)}"
+            yield f"{self.name}_count{_fmt_labels(self.label_names, key)} {acc}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, doc, labels))
+
+    def gauge(self, name: str, doc: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, doc, labels))
+
+    def histogram(self, name: str, doc: str, labels: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._add(Histogram(name, doc, labels, **kwargs))
+
+    def render(self) -> str:
+        """Text exposition format Prometheus."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Загрузки (DownloadVideo) ---
+DOWNLOAD_SECONDS = REGISTRY.histogram(
+    "hp_download_seconds", "Время загрузки yt-dlp без ожидания в очереди", ("platform", "mode")
+)
+DOWNLOAD_BYTES = REGISTRY.counter("hp_download_bytes_total", "Скачано байт", ("platform",))
+DOWNLOAD_FAILURES = REGISTRY.counter("hp_download_failures_total", "Неудачные загрузки yt-dlp")
+DOWNLOAD_QUEUE = REGISTRY.gauge("hp_download_queue", "Задачи планировщика загрузок", ("state",))
+DOWNLOAD_INFLIGHT = REGISTRY.gauge("hp_downloads_inflight", "Уникальные загрузки в работе (single-flight)")
+DOWNLOAD_RETRIES = REGISTRY.counter(
+    "hp_download_retries_total", "Повторы загрузки после временного сбоя", ("platform", "reason")
+)
+UPSTREAM_CIRCUIT = REGISTRY.gauge(
+    "hp_upstream_circuit_state", "Автомат платформы: 0 — closed, 1 — half_open, 2 — open", ("platform",)
+)
+
+# --- Отправка (VideoRouter) ---
+UPLOAD_SECONDS = REGISTRY.histogram(
+    "hp_upload_seconds", "Время send_video", ("platform", "source")  # source: file | memory | local | stream | file_id | album
+)
+UPLOAD_BYTES = REGISTRY.counter("hp_upload_bytes_total", "Отправлено байт в Telegram", ("source",))
+VIDEO_REQUESTS = REGISTRY.counter("hp_video_requests_total", "Обработанные ссылки", ("result",))
+JOBS_SUBMITTED = REGISTRY.counter("hp_jobs_submitted_total", "Задания на видео по источнику", ("origin",))  # bot | api
+VIDEO_ERRORS = REGISTRY.counter(
+    "hp_video_errors_total", "Ошибки по категориям handle_url", ("reason",)
+)  # queue_full | too_large | restricted | not_found | unsupported | timeout | network | rate_limited | upstream | unavailable | other
+
+# --- Логи в Telegram (TelegramLogHandler) ---
+TG_LOG_MESSAGES = REGISTRY.counter("hp_tg_log_messages_total", "Сообщения лога в Telegram", ("result",))
+TG_LOG_RECORDS_DROPPED = REGISTRY.counter("hp_tg_log_records_dropped_total", "Записи, не влезшие в очередь")
+
+# --- Лимиты Bot API (RateLimitMiddleware) ---
+TG_RATE_WAIT_SECONDS = REGISTRY.histogram(
+    "hp_tg_rate_wait_seconds", "Ожидание слота лимита Telegram перед запросом", ("priority",)
+)
+TG_RETRY_AFTER = REGISTRY.counter("hp_tg_retry_after_total", "Ответы 429 от Telegram", ("method",))
+
+# --- HTTP API ---
+BROADCAST_MESSAGES = REGISTRY.counter(
+    "hp_broadcast_messages_total", "Сообщения рассылок /send-messages", ("result",)
+)  # ok | retry | error
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "hp_http_request_seconds", "Время обработки HTTP-запроса", ("method", "path", "status")
+)
+
+
+async def start_metrics_server(host: str, port: int) -> Optional[web.AppRunner]:
+    """Отдельный /metrics для процессов без FastAPI (бот в polling, воркер). port=0 — выключено."""
+    if not port:
+        return None
+
+    async def handle(_request: web.Request) -> web.Response:
+        return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("metrics: listening on %s:%s/metrics", host, port)
+    return runner
+
+
+async def stop_metrics_server(runner: Optional[web.AppRunner]) -> None:
+    if runner is not None:
+        await runner.cleanup()
@@ -0,0 +1,306 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from enum import IntEnum
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from app.utils.metrics import TG_RATE_WAIT_SECONDS, TG_RETRY_AFTER
+
+log = logging.getLogger("hidden_protocol.ratelimit")
+
+ChatId = Union[int, str]
+
+
+class Priority(IntEnum):
+    """Кто первым получает свободный слот общего лимита (меньше — раньше)."""
+
+    USER = 0  # видео и ответы пользователям
+    BULK = 1  # рассылки /send-messages
+    LOG = 2  # логи в Telegram
+
+
+_priority: "contextvars.ContextVar[Priority]" = contextvars.ContextVar("hp_tg_priority", default=Priority.USER)
+
+
+@contextlib.contextmanager
+def send_priority(priority: Priority) -> Iterator[None]:
+    """with send_priority(Priority.LOG): await bot.send_message(...) — запросы внутри идут с этим приоритетом."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# Сообщения, которые Telegram считает в лимитах чата; остальные методы с chat_id
+# (sendChatAction, deleteMessage, edit*) считаем только в общем лимите
+_MESSAGE_METHODS = {
+    "sendMessage", "sendVideo", "sendPhoto", "sendDocument", "sendAnimation", "sendAudio",
+    "sendVoice", "sendVideoNote", "sendMediaGroup", "sendSticker", "sendLocation", "sendPoll",
+    "copyMessage", "copyMessages", "forwardMessage", "forwardMessages",
+}
+
+
+class LocalBuckets:
+    """
+    Лимиты в памяти процесса. GCRA: на ключ хранится «теоретическое время
+    прихода» (TAT), reserve сдвигает его на cost интервалов и говорит, сколько ждать.
+    Токен берётся сразу, даже в долг, — кто раньше встал в очередь, тот раньше отправит.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+
+    def _get(self, key: str, now: float) -> float:
+        tat = self._tat.pop(key, now)
+        if len(self._tat) >= self.max_keys:
+            self._tat.popitem(last=False)
+        return max(tat, now)
+
+    async def reserve(self, key: str, interval: float, burst: float, cost: int = 1) -> float:
+        now = time.monotonic()
+        tat = self._get(key, now) + cost * interval
+        self._tat[key] = tat
+        return max(0.0, tat - burst * interval - now)
+
+    async def block(self, key: str, seconds: float, interval: float, burst: float) -> None:
+        now = time.monotonic()
+        self._tat[key] = max(self._get(key, now), now + seconds + (burst - 1) * interval)
+
+    async def close(self) -> None:
+        pass
+
+
+# Тот же GCRA в Redis; время — TIME сервера, чтобы процессы на разных машинах не спорили о часах
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local block = tonumber(ARGV[4])
+local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tat < now then tat = now end
+local wait = 0
+if block > 0 then
+  local blocked = now + block + (burst - 1) * interval
+  if blocked > tat then tat = blocked end
+else
+  tat = tat + cost * interval
+  wait = tat - burst * interval - now
+  if wait < 0 then wait = 0 end
+end
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Лимиты в Redis: бот, воркеры и HTTP API с одним токеном делят одни ведра."""
+
+    def __init__(self, url: Optional[str] = None, prefix: str = "hp:tg_rate", client=None):
+        if client is None:
+            import redis.asyncio as aioredis
+
+            client = aioredis.Redis.from_url(url, decode_responses=True)
+        self._redis = client
+        self.prefix = prefix
+        self._script = self._redis.register_script(_GCRA_LUA)
+
+    async def _call(self, key: str, interval: float, burst: float, cost: int, block: float) -> float:
+        return float(await self._script(keys=[f"{self.prefix}:{key}"], args=[interval, burst, cost, block]))
+
+    async def reserve(self, key: str, interval: float, burst: float, cost: int = 1) -> float:
+        return await self._call(key, interval, burst, cost, 0)
+
+    async def block(self, key: str, seconds: float, interval: float, burst: float) -> None:
+        await self._call(key, interval, burst, 0, max(seconds, 0.001))
+
+    async def close(self) -> None:
+        await self._redis.close()
+
+
+class _PriorityGate:
+    """
+    Очередь к общему лимиту с приоритетами: слот достаётся самому приоритетному из ждущих
+    на момент, когда слот освободился. Приоритеты действуют внутри процесса;
+    между процессами (RedisBuckets) — общий темп без приоритетов.
+    """
+
+    def __init__(self, limiter: "TelegramRateLimiter"):
+        self.limiter = limiter
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self._busy_until = 0.0
+
+    async def wait(self, priority: Priority) -> None:
+        idle = not self._heap and (self._pump is None or self._pump.done())
+        if idle and time.monotonic() >= self._busy_until:
+            # Никого нет — берём слот сами, без очереди; если пришлось ждать,
+            # следующие встают в очередь с приоритетами
+            wait = await self.limiter._reserve_global()
+            if wait > 0:
+                self._busy_until = time.monotonic() + wait
+                await asyncio.sleep(wait)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (int(priority), next(self._seq), fut))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._run())
+        await fut
+
+    async def _run(self) -> None:
+        while self._heap:
+            wait = await self.limiter._reserve_global()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            # Выбираем после ожидания: пока ждали, мог прийти кто-то важнее
+            while self._heap:
+                _, _, fut = heapq.heappop(self._heap)
+                if not fut.done():
+                    fut.set_result(None)
+                    break
+
+
+class TelegramRateLimiter:
+    """
+    Лимиты Bot API на отправку: ~30 сообщений/с на бота, ~20 в минуту в группу
+    или канал, ~1/с в личный чат. Сначала ждём очереди чата, потом — общей,
+    чтобы чат, упёршийся в свой лимит, не занимал общие слоты.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        group_per_minute: float = 20.0,
+        private_rate: float = 1.0,
+        store: Optional[Any] = None,
+    ):
+        self.global_rate = global_rate
+        self.group_per_minute = group_per_minute
+        self.private_rate = private_rate
+        self.store = store or LocalBuckets()
+        self._gate = _PriorityGate(self)
+
+    @classmethod
+    def from_config(cls, cfg: dict, bot_id: Optional[int] = None) -> "TelegramRateLimiter":
+        backend = (cfg.get("TG_RATE_BACKEND") or "local").lower()
+        if backend == "redis":
+            if not cfg.get("REDIS_URL"):
+                raise ValueError("❌ TG_RATE_BACKEND=redis требует REDIS_URL")
+            store = RedisBuckets(cfg["REDIS_URL"], prefix=f"hp:tg_rate:{bot_id or 0}")
+        elif backend == "local":
+            store = LocalBuckets()
+        else:
+            raise ValueError(f"❌ Неизвестный TG_RATE_BACKEND: {backend}")
+        return cls(
+            global_rate=cfg.get("TG_RATE_GLOBAL", 30.0),
+            group_per_minute=cfg.get("TG_RATE_GROUP_PER_MIN", 20.0),
+            private_rate=cfg.get("TG_RATE_PRIVATE", 1.0),
+            store=store,
+        )
+
+    def _chat_limits(self, chat_id: ChatId) -> Tuple[float, float]:
+        """(интервал, запас) для чата. Личные чаты — положительные id; группы, каналы и @username — нет."""
+        if isinstance(chat_id, int) and chat_id > 0:
+            return 1.0 / self.private_rate, max(1.0, self.private_rate)
+        return 60.0 / self.group_per_minute, self.group_per_minute
+
+    async def _reserve_global(self) -> float:
+        return await self.store.reserve("global", 1.0 / self.global_rate, self.global_rate)
+
+    async def acquire(self, chat_id: Optional[ChatId], cost: int = 1, per_chat: bool = True) -> float:
+        """Ждёт своей очереди на отправку в chat_id; возвращает, сколько прождали."""
+        t0 = time.monotonic()
+        if per_chat and chat_id is not None:
+            interval, burst = self._chat_limits(chat_id)
+            wait = await self.store.reserve(f"chat:{chat_id}", interval, burst, cost)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        for _ in range(cost):
+            await self._gate.wait(_priority.get())
+        waited = time.monotonic() - t0
+        TG_RATE_WAIT_SECONDS.observe(waited, priority=_priority.get().name.lower())
+        return waited
+
+    async def retry_after(self, chat_id: ChatId, seconds: float) -> None:
+        """429: до истечения retry_after в чат не пишем."""
+        interval, burst = self._chat_limits(chat_id)
+        await self.store.block(f"chat:{chat_id}", seconds, interval, burst)
+
+    async def close(self) -> None:
+        await self.store.close()
+
+
+def _one_shot(method: TelegramMethod) -> bool:
+    """В запросе файл, который нельзя прочитать второй раз (InputFile с reusable = False)."""
+    values = list(vars(method).values())
+    values += [getattr(m, "media", None) for m in getattr(method, "media", None) or () if not isinstance(m, str)]
+    return any(getattr(v, "reusable", True) is False for v in values)
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии aiogram: каждый запрос с chat_id проходит через TelegramRateLimiter,
+    на TelegramRetryAfter — блокируем чат и повторяем (до max_retries раз, если ждать
+    не дольше max_retry_after). Вызывающий код лимитов не видит вовсе — кроме запросов
+    с одноразовым телом (поток с CDN): их не повторяем, 429 уходит вызывающему.
+    """
+
+    def __init__(self, limiter: TelegramRateLimiter, max_retries: int = 3, max_retry_after: float = 60.0):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getUpdates, getMe, setWebhook… — не ограничиваем
+            return await make_request(bot, method)
+
+        per_chat = name in _MESSAGE_METHODS
+        # Альбом Telegram считает как столько сообщений, сколько в нём файлов
+        cost = (len(getattr(method, "media", None) or ()) or 1) if name == "sendMediaGroup" else 1
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.limiter.acquire(chat_id, cost=cost, per_chat=per_chat)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                TG_RETRY_AFTER.inc(method=name)
+                give_up = attempt > self.max_retries or e.retry_after > self.max_retry_after or _one_shot(method)
+                if per_chat:
+                    # Остальные отправки в этот чат тоже подождут
+                    await self.limiter.retry_after(chat_id, e.retry_after)
+                elif not give_up:
+                    await asyncio.sleep(e.retry_after)
+                if give_up:
+                    raise
+                log.warning("tg_retry_after method=%s chat=%s retry_after=%s attempt=%s", name, chat_id, e.retry_after, attempt)
+
+
+def install_rate_limiter(bot: Bot, cfg: dict) -> TelegramRateLimiter:
+    """Вешает лимиты на все запросы bot; limiter нужно закрыть при остановке."""
+    limiter = TelegramRateLimiter.from_config(cfg, bot_id=bot.id)
+    bot.session.middleware(RateLimitMiddleware(limiter))
+    return limiter
@@ -0,0 +1,42 @@
+import os
+import posixpath
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+
+def create_bot(cfg: dict) -> Bot:
+    """Bot на api.telegram.org или на своём telegram-bot-api (TELEGRAM_API_URL)."""
+    if not cfg.get("TELEGRAM_API_URL"):
+        return Bot(token=cfg["BOT_TOKEN"])
+    api = TelegramAPIServer.from_base(cfg["TELEGRAM_API_URL"], is_local=cfg["TELEGRAM_API_LOCAL"])
+    return Bot(token=cfg["BOT_TOKEN"], session=AiohttpSession(api=api))
+
+
+class LocalFiles:
+    """
+    Загрузка «по пути» для telegram-bot-api с --local: вместо байтов отдаём file://-ссылку,
+    сервер сам читает файл с общего тома. Байты не идут через наш процесс, лимит — 2000 МБ.
+    server_dir — та же папка, как её видит сервер (если том смонтирован по другому пути).
+    """
+
+    def __init__(self, local_dir: str, server_dir: Optional[str] = None):
+        self.local_dir = os.path.abspath(local_dir)
+        self.server_dir = server_dir or self.local_dir
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> Optional["LocalFiles"]:
+        if not (cfg.get("TELEGRAM_API_URL") and cfg["TELEGRAM_API_LOCAL"]):
+            return None
+        return cls(cfg.get("DOWNLOAD_DIR", "./downloads"), cfg.get("TELEGRAM_API_FILES_DIR"))
+
+    def ref(self, path: str) -> Optional[str]:
+        """file://-ссылка для send_video; None — файл вне общей папки (например, в tmpfs), шлём байтами."""
+        path = os.path.abspath(path)
+        if os.path.commonpath([path, self.local_dir]) != self.local_dir:
+            return None
+        rel = os.path.relpath(path, self.local_dir).replace(os.sep, "/")
+        # Сервер берёт путь как есть, без URL-декодирования (имена у yt-dlp и так ASCII)
+        return "file://" + posixpath.join(self.server_dir, rel)
@@ -2,13 +2,26 @@ import asyncio
 import logging
 import textwrap
 import traceback
-from typing import Optional
+from collections import OrderedDict, deque
+from typing import Deque, Optional
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.utils.metrics import TG_LOG_MESSAGES, TG_LOG_RECORDS_DROPPED
+from app.utils.rate_limit import Priority, send_priority
 
 TG_MAX = 4096
 
 
 class TelegramLogHandler(logging.Handler):
+    """
+    Логи в Telegram через ограниченную очередь и одну задачу-отправителя в event loop.
+    Записи за batch_window секунд склеиваются в одно сообщение (до 4096 символов),
+    одинаковые — схлопываются в «×N». Между сообщениями не меньше min_interval,
+    на 429 ждём retry_after. При переполнении очереди записи отбрасываются,
+    а в следующем сообщении пишем, сколько пропущено.
+    """
+
     def __init__(
         self,
         bot: Bot,
@@ -17,6 +30,9 @@ class TelegramLogHandler(logging.Handler):
         loop: Optional[asyncio.AbstractEventLoop] = None,
         level: int = logging.INFO,
         disable_notification: bool = True,
+        batch_window: float = 2.0,
+        min_interval: float = 3.0,
+        max_queue: int = 200,
     ):
         super().__init__(level=level)
         self.bot = bot
@@ -24,38 +40,122 @@ class TelegramLogHandler(logging.Handler):
         self.thread_id = thread_id
         self.loop = loop or asyncio.get_event_loop()
         self.disable_notification = disable_notification
+        self.batch_window = batch_window
+        self.min_interval = min_interval
+
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_queue)
+        self._sender: Optional[asyncio.Task] = None
+        self._dropped = 0
+
+    def _render(self, record: logging.LogRecord) -> str:
+        # Только сам message, без "INFO:" и времени; traceback — отдельным блоком ниже
+        # (Formatter.format дописал бы его ещё раз)
+        base = record.getMessage()
+        block = ""
+        if record.exc_info:
+            tb_text = "".join(traceback.format_exception(*record.exc_info)).replace("`", "'")
+            block = textwrap.shorten(tb_text, width=TG_MAX - 100, placeholder="…")
 
-        # Показываем только сам message, без "INFO:" и времени
-        self.setFormatter(logging.Formatter("%(message)s"))
+        if block:
+            rest = TG_MAX - len(block) - 2
+            text = textwrap.shorten(base, width=max(80, rest), placeholder="…")
+            return f"{text}\n{block}"
+        return textwrap.shorten(base, width=TG_MAX, placeholder="…")
 
     def emit(self, record: logging.LogRecord) -> None:
+        # Вызывается из потока QueueListener (install_telegram_log_handler): traceback и обрезка
+        # текста — там, а не в event loop; в очередь отправителя кладём через loop
         try:
-            base = self.format(record)
-            block = ""
-            if record.exc_info:
-                tb_text = "".join(traceback.format_exception(*record.exc_info)).replace("`", "'")
-                block = textwrap.shorten(tb_text, width=TG_MAX - 100, placeholder="…")
-
-            text = base
-            if block:
-                rest = TG_MAX - len(block) - 2
-                text = textwrap.shorten(text, width=max(80, rest), placeholder="…")
-                text = f"{text}\n{block}"
-            else:
-                text = textwrap.shorten(text, width=TG_MAX, placeholder="…")
-
-            kwargs = dict(
-                chat_id=self.chat_id,
-                text=text,
-                # БЕЗ parse_mode, чтобы ничего не ломалось из-за Markdown
-                disable_notification=self.disable_notification,
-            )
-            if self.thread_id is not None:
-                kwargs["message_thread_id"] = self.thread_id
-
-            asyncio.run_coroutine_threadsafe(
-                self.bot.send_message(**kwargs),
-                self.loop,
-            )
+            text = self._render(record)
         except Exception:
-            self.handleError(record)
\ No newline at end of file
+            self.handleError(record)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._enqueue, text)
+        except RuntimeError:
+            pass  # loop уже закрыт — бот останавливается
+
+    def _enqueue(self, text: str) -> None:
+        try:
+            self._queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self._dropped += 1
+            TG_LOG_RECORDS_DROPPED.inc()
+        if self._sender is None or self._sender.done():
+            self._sender = self.loop.create_task(self._send_loop())
+
+    def _collect(self, pending: Deque[str]) -> str:
+        """Набирает одно сообщение: схлопывает повторы, режет по TG_MAX; остаток — в pending."""
+        counts: "OrderedDict[str, int]" = OrderedDict()
+        while pending:
+            text = pending.popleft()
+            counts[text] = counts.get(text, 0) + 1
+
+        parts = []
+        if self._dropped:
+            parts.append(f"⚠️ Пропущено записей лога: {self._dropped} (очередь переполнена)")
+            self._dropped = 0
+        size = sum(len(p) + 2 for p in parts)
+        for text, n in counts.items():
+            part = f"{text}\n×{n}" if n > 1 else text
+            if parts and size + len(part) > TG_MAX:
+                pending.extend([text] * n)
+                continue
+            parts.append(part)
+            size += len(part) + 2
+        return "\n\n".join(parts)[:TG_MAX]
+
+    async def _send(self, text: str) -> None:
+        kwargs = dict(
+            chat_id=self.chat_id,
+            text=text,
+            # БЕЗ parse_mode, чтобы ничего не ломалось из-за Markdown
+            disable_notification=self.disable_notification,
+        )
+        if self.thread_id is not None:
+            kwargs["message_thread_id"] = self.thread_id
+
+        for _ in range(3):
+            try:
+                # Логи уступают общий лимит видео и ответам пользователям
+                with send_priority(Priority.LOG):
+                    await self.bot.send_message(**kwargs)
+                TG_LOG_MESSAGES.inc(result="sent")
+                return
+            except TelegramRetryAfter as e:
+                TG_LOG_MESSAGES.inc(result="retry_after")
+                await asyncio.sleep(e.retry_after)
+            except Exception:
+                # Логировать ошибку отправки логов некуда — сообщение теряем
+                break
+        TG_LOG_MESSAGES.inc(result="failed")
+
+    async def _send_loop(self) -> None:
+        pending: Deque[str] = deque()
+        while True:
+            if not pending:
+                pending.append(await self._queue.get())
+            # Окно склейки: ждём, пока подтянутся соседние записи
+            await asyncio.sleep(self.batch_window)
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+
+            await self._send(self._collect(pending))
+            await asyncio.sleep(self.min_interval)
+
+def install_telegram_log_handler(bot: Bot, cfg: dict, loop: asyncio.AbstractEventLoop) -> None:
+    """Логи в Telegram (LOG_CHAT_ID): уведомления (extra["notify"]=True) и ошибки (ERROR+)."""
+    if not cfg.get("LOG_CHAT_ID"):
+        return
+    from app.utils.logger import NotifyOrErrorFilter, add_background_handler
+
+    tg = TelegramLogHandler(
+        bot=bot,
+        chat_id=int(cfg["LOG_CHAT_ID"]),
+        thread_id=cfg.get("LOG_THREAD_ID"),
+        loop=loop,
+        level=logging.INFO,
+        disable_notification=True,
+    )
+    tg.addFilter(NotifyOrErrorFilter())
+    add_background_handler(tg)
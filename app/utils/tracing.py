@@ -0,0 +1,201 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+log = logging.getLogger("hidden_protocol.trace")
+
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("hp_span", default=None)
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+class Span:
+    """
+    Отрезок времени внутри обработки одного сообщения. Вложенность — через contextvars:
+    span(...) внутри другого span(...) (в т.ч. в задачах, созданных внутри) становится его потомком.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent", "start_ns", "end_ns", "attrs", "children", "error")
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attrs: Dict[str, Any] = {k: v for k, v in attrs.items() if v is not None}
+        self.children: List[Span] = []
+        self.error: Optional[str] = None
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+    def set(self, **attrs) -> None:
+        self.attrs.update({k: v for k, v in attrs.items() if v is not None})
+
+    def add_child(self, name: str, start_ns: int, duration: float, **attrs) -> "Span":
+        """Этап, измеренный в другом потоке/процессе (yt-dlp): время известно только по факту."""
+        child = Span(name, self.trace_id, self, **attrs)
+        child.start_ns = start_ns
+        child.end_ns = start_ns + int(duration * 1e9)
+        return child
+
+    def render(self) -> str:
+        """Компактное дерево: handle_url 41.20s [download 35.10s [extract 3.10s, ...], upload 5.80s]."""
+        text = f"{self.name} {self.duration:.2f}s"
+        if self.error:
+            text += " !"
+        if self.children:
+            text += " [" + ", ".join(c.render() for c in self.children) + "]"
+        return text
+
+
+class span:
+    """with span("upload", source="file"): ... — дочерний отрезок текущего; без трассы — ничего не делает."""
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span: Optional[Span] = None
+        self._token = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current.get()
+        if parent is None:
+            return None
+        self.span = Span(self.name, parent.trace_id, parent, **self.attrs)
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.span is None:
+            return
+        self.span.end_ns = time.time_ns()
+        if exc is not None:
+            self.span.error = f"{type(exc).__name__}: {exc}"
+        _current.reset(self._token)
+
+
+class trace(span):
+    """Корневой отрезок одного сообщения; по выходу дерево уходит в лог и экспортёр."""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, **attrs):
+        super().__init__(name, **attrs)
+        self.trace_id = trace_id or new_trace_id()
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.name, self.trace_id, None, **self.attrs)
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        super().__exit__(exc_type, exc, tb)
+        tracer.finish(self.span)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    s = _current.get()
+    return s.trace_id if s else None
+
+
+class Tracer:
+    """
+    Куда уходят законченные трассы: строка в лог всегда, плюс (опционально)
+    OTLP/JSON — в файл (одна ExportTraceServiceRequest на строку) или POST на коллектор.
+    """
+
+    def __init__(self):
+        self.export_file: Optional[str] = None
+        self.otlp_endpoint: Optional[str] = None
+        self.service_name = "hidden-protocol"
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def configure(self, cfg: dict, service_name: str = "hidden-protocol") -> None:
+        self.export_file = cfg.get("TRACE_EXPORT_FILE") or None
+        self.otlp_endpoint = cfg.get("TRACE_OTLP_ENDPOINT") or None
+        self.service_name = service_name
+
+    def finish(self, root: Span) -> None:
+        log.info("trace id=%s %s %s", root.trace_id, root.render(), _fmt_attrs(root.attrs))
+        if not (self.export_file or self.otlp_endpoint):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        payload = self._otlp(root)
+        if self.export_file:
+            loop.run_in_executor(None, self._append, payload)
+        if self.otlp_endpoint:
+            loop.create_task(self._post(payload))
+
+    def _append(self, payload: dict) -> None:
+        try:
+            with open(self.export_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        except Exception as e:
+            log.warning("trace_export_file_fail path=%s err=%s", self.export_file, e)
+
+    async def _post(self, payload: dict) -> None:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+        try:
+            async with self._session.post(self.otlp_endpoint, json=payload) as resp:
+                if resp.status >= 300:
+                    log.warning("trace_export_http_fail status=%s", resp.status)
+        except Exception as e:
+            log.warning("trace_export_http_fail err=%s", e)
+
+    def _otlp(self, root: Span) -> dict:
+        spans = []
+        stack = [root]
+        while stack:
+            s = stack.pop()
+            stack.extend(s.children)
+            item = {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns or time.time_ns()),
+                "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in s.attrs.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {},
+            }
+            if s.parent is not None:
+                item["parentSpanId"] = s.parent.span_id
+            spans.append(item)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "hidden_protocol"}, "spans": spans}],
+            }]
+        }
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+def _fmt_attrs(attrs: Dict[str, Any]) -> str:
+    return " ".join(f"{k}={v}" for k, v in attrs.items())
+
+
+tracer = Tracer()
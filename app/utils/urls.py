@@ -1,19 +1,70 @@
+import asyncio
+import logging
 import re
-from urllib.parse import urlparse
-from typing import Optional
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
 
 URL_RE = re.compile(r"https?://\S+", re.IGNORECASE)
 
+log = logging.getLogger("hidden_protocol.urls")
+
 # Хосты, которые принимаем
 _TIKTOK_HOSTS = {"tiktok.com", "www.tiktok.com", "vm.tiktok.com", "vt.tiktok.com"}
 _INSTAGRAM_HOSTS = {"instagram.com", "www.instagram.com"}
 
+# Короткие ссылки TikTok: ID видно только после редиректа
+_TIKTOK_SHORT_HOSTS = {"vm.tiktok.com", "vt.tiktok.com"}
+
+# ID видео в пути ссылки
+_TIKTOK_ID_RE = re.compile(r"/video/(\d+)")
+_INSTAGRAM_ID_RE = re.compile(r"^/reels?/([\w-]+)")
+
+# Трекинговые параметры, которые не влияют на видео
+_TRACKING_PARAMS = {
+    "igsh", "igshid", "is_from_webapp", "is_copy_url", "sender_device", "sender_web_id",
+    "web_id", "share_app_id", "share_item_id", "share_link_id", "social_sharing",
+    "source", "tt_from", "u_code", "timestamp", "user_id", "_r", "_t", "_d", "checksum",
+    "sec_uid", "preview_pb", "language", "refer", "referer", "enter_method", "utm_source",
+}
+
+
 def first_url(text: Optional[str]) -> Optional[str]:
     if not text:
         return None
     m = URL_RE.search(text)
     return m.group(0) if m else None
 
+
+def entity_urls(text: Optional[str], entities: Optional[Sequence[Any]]) -> List[str]:
+    """
+    Все ссылки сообщения по разметке Telegram (url и text_link) в порядке появления,
+    без повторов. Текст заново не сканируем: Telegram уже нашёл ссылки сам.
+    Смещения entities — в UTF-16 (эмодзи занимают две единицы).
+    """
+    if not text or not entities:
+        return []
+    encoded: Optional[bytes] = None
+    urls: List[str] = []
+    for e in entities:
+        if e.type == "text_link" and e.url:
+            url = e.url
+        elif e.type == "url":
+            if encoded is None:
+                encoded = text.encode("utf-16-le")
+            url = encoded[e.offset * 2 : (e.offset + e.length) * 2].decode("utf-16-le")
+            # Telegram размечает и ссылки без схемы: tiktok.com/@user/video/1
+            if "://" not in url:
+                url = "https://" + url
+        else:
+            continue
+        if url not in urls:
+            urls.append(url)
+    return urls
+
 def is_allowed_url(url: str) -> bool:
     """
     Разрешаем:
@@ -35,3 +86,147 @@ def is_allowed_url(url: str) -> bool:
         return False
     except Exception:
         return False
+
+
+def is_short_url(url: str) -> bool:
+    """vm./vt.tiktok.com/XYZ и tiktok.com/t/XYZ — ID только после редиректа."""
+    try:
+        p = urlparse(url)
+        host = p.netloc.lower()
+        return host in _TIKTOK_SHORT_HOSTS or (host in _TIKTOK_HOSTS and p.path.startswith("/t/"))
+    except Exception:
+        return False
+
+
+def url_platform(url: str) -> Optional[str]:
+    """"tiktok" / "instagram" по хосту (в том числе для коротких ссылок), иначе None."""
+    try:
+        host = urlparse(url).netloc.lower()
+    except Exception:
+        return None
+    if host in _TIKTOK_HOSTS:
+        return "tiktok"
+    if host in _INSTAGRAM_HOSTS:
+        return "instagram"
+    return None
+
+
+def normalize_url(url: str) -> str:
+    """
+    Приводит ссылку к стабильному виду:
+      - хост в нижнем регистре, tiktok.com/instagram.com → www.*
+      - без #фрагмента и трекинговых параметров (igsh, is_from_webapp, utm_* …)
+      - у ссылок с ID видео query убирается целиком
+    """
+    try:
+        p = urlparse(url.strip())
+        host = p.netloc.lower()
+        if host in ("tiktok.com", "instagram.com"):
+            host = "www." + host
+
+        if video_key(url):
+            query = ""
+        else:
+            query = urlencode([
+                (k, v) for k, v in parse_qsl(p.query, keep_blank_values=True)
+                if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith("utm_")
+            ])
+        return urlunparse(("https", host, p.path, "", query, ""))
+    except Exception:
+        return url
+
+
+def video_key(url: str) -> Optional[Tuple[str, str]]:
+    """
+    Возвращает (platform, video_id) для ссылок, где ID виден прямо в пути:
+      - tiktok.com/@user/video/<digits>  → ("tiktok", "<digits>")
+      - instagram.com/reel/<shortcode>   → ("instagram", "<shortcode>")
+    Короткие ссылки (vm./vt.tiktok.com) без редиректа не разобрать — None.
+    """
+    try:
+        p = urlparse(url)
+        host = p.netloc.lower()
+
+        if host in _TIKTOK_HOSTS:
+            m = _TIKTOK_ID_RE.search(p.path)
+            return ("tiktok", m.group(1)) if m else None
+
+        if host in _INSTAGRAM_HOSTS:
+            m = _INSTAGRAM_ID_RE.match(p.path)
+            return ("instagram", m.group(1)) if m else None
+
+        return None
+    except Exception:
+        return None
+
+
+class ShortLinkResolver:
+    """
+    Разворачивает короткие ссылки TikTok один раз и помнит результат (TTL).
+    Один пул соединений aiohttp на всё приложение; параллельные запросы
+    одной и той же ссылки ждут один редирект.
+    """
+
+    _HEADERS = {
+        "User-Agent": (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+            "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+        ),
+    }
+
+    def __init__(self, ttl: float = 86400, max_size: int = 4096, timeout: float = 5.0):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.timeout = timeout
+        self._cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._pending: Dict[str, "asyncio.Task[str]"] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self._HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def resolve(self, url: str) -> str:
+        """Каноническая ссылка: короткие — через редирект, остальные — normalize_url."""
+        if not is_short_url(url):
+            return normalize_url(url)
+
+        key = normalize_url(url)
+        hit = self._cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            return hit[1]
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._follow(key))
+            self._pending[key] = task
+            task.add_done_callback(lambda _t, k=key: self._pending.pop(k, None))
+        return await asyncio.shield(task)
+
+    async def _follow(self, url: str) -> str:
+        t0 = time.monotonic()
+        try:
+            async with self._get_session().head(url, allow_redirects=True, max_redirects=5) as resp:
+                final = str(resp.url)
+        except Exception as e:
+            # Не смогли — отдаём как есть, yt-dlp справится сам
+            log.warning("shortlink_resolve_fail url=%s err=%s", url, e)
+            return url
+
+        resolved = normalize_url(final) if is_allowed_url(final) else url
+        self._cache[url] = (time.monotonic() + self.ttl, resolved)
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        log.debug("shortlink_resolved url=%s -> %s in %.2fs", url, resolved, time.monotonic() - t0)
+        return resolved
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
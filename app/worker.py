@@ -0,0 +1,142 @@
+import asyncio
+import contextlib
+
+from app.config import Config
+from handlers.video import VideoRouter
+from app.services.download_video import DownloadVideo
+from app.services.file_id_cache import FileIdCache
+from app.services.job_queue import RedisJobQueue, job_view, send_callback
+from app.services.upstream_health import backoff
+from app.utils.logger import setup_logger
+from app.utils.metrics import start_metrics_server, stop_metrics_server
+from app.utils.rate_limit import install_rate_limiter
+from app.utils.telegram_api import LocalFiles, create_bot
+from app.utils.tg_log_handler import install_telegram_log_handler
+from app.utils.tracing import tracer
+from app.utils.urls import ShortLinkResolver
+
+
+class RunDownloadWorker:
+    """
+    Воркер очереди заданий (JOB_QUEUE_BACKEND=redis): берёт задания, которые поставил бот,
+    качает и отправляет видео. Таких процессов может быть сколько угодно и на разных машинах.
+    """
+
+    def __init__(self):
+        self.cfg = Config().get_config()
+        self.log = setup_logger(self.cfg.get("LOG_LEVEL", "INFO"), self.cfg["LOG_FORMAT"], self.cfg["LOG_BACKUP_DAYS"])
+
+        self.queue = RedisJobQueue.from_config(self.cfg)
+        if self.queue is None:
+            raise ValueError("❌ Воркер требует JOB_QUEUE_BACKEND=redis")
+
+        tracer.configure(self.cfg, service_name="hidden-protocol-worker")
+
+        self.bot = create_bot(self.cfg)
+        # С TG_RATE_BACKEND=redis лимиты общие с ботом и другими воркерами
+        self.rate_limiter = install_rate_limiter(self.bot, self.cfg)
+        self.downloader = DownloadVideo.from_config(self.cfg)
+        self.resolver = ShortLinkResolver(ttl=self.cfg["SHORTLINK_CACHE_TTL"])
+        # Та же логика доставки, что у бота без очереди
+        self.video = VideoRouter(
+            downloader=self.downloader,
+            file_ids=FileIdCache.from_config(self.cfg),
+            resolver=self.resolver,
+            local_files=LocalFiles.from_config(self.cfg),
+        )
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            with contextlib.suppress(Exception):
+                await self.queue.extend(job_id)
+
+    async def _consume(self, idx: int) -> None:
+        # Сбой одной итерации (Redis недоступен, ошибка в коде) не должен гасить потребителя:
+        # пишем в лог и ждём с нарастающей паузой, пока не пройдёт
+        failures = 0
+        while True:
+            try:
+                await self._consume_one(idx)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = backoff(failures, 1.0, 30.0)
+                self.log.exception("worker_loop_fail worker=%s err=%s retry_in=%.1fs", idx, e, delay)
+                await asyncio.sleep(delay)
+
+    async def _consume_one(self, idx: int) -> None:
+        item = await self.queue.reserve(timeout=5)
+        if item is None:
+            return
+
+        job_id, job, attempts = item
+        self.log.info("job_start worker=%s id=%s attempt=%s url=%s", idx, job_id, attempts, job["url"])
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id))
+        try:
+            result = await self.video.deliver(self.bot, job, final=attempts >= self.queue.max_attempts)
+        except Exception as e:
+            # Временный сбой: deliver сам решил, что повтор поможет
+            self.log.warning("job_retry worker=%s id=%s attempt=%s err=%s", idx, job_id, attempts, e)
+            try:
+                # Автомат платформы разомкнут — раньше его cooldown повтор не поможет
+                await self.queue.nack(job_id, attempts, delay=getattr(e, "retry_in", 0.0))
+            except Exception as nack_err:
+                # Аренда истечёт, и requeue_expired вернёт задание в очередь
+                self.log.warning("job_nack_fail id=%s err=%s", job_id, nack_err)
+            return
+        finally:
+            heartbeat.cancel()
+
+        try:
+            await self.queue.ack(job_id, result)
+        except Exception as e:
+            # Видео уже у пользователя; после истечения аренды задание может выполниться повторно
+            self.log.warning("job_ack_fail id=%s err=%s", job_id, e)
+            return
+
+        # Задания из POST /jobs: итог — на callback клиента
+        if job.get("callback_url"):
+            try:
+                record = await self.queue.get(job_id)
+                if record is not None:
+                    await send_callback(job["callback_url"], job_view(job_id, record))
+            except Exception as e:
+                self.log.warning("job_callback_error id=%s url=%s err=%s", job_id, job["callback_url"], e)
+
+    async def run(self) -> None:
+        install_telegram_log_handler(self.bot, self.cfg, asyncio.get_running_loop())
+        try:
+            await self.downloader.warm_up()
+        except Exception as e:
+            # Без прогрева первая загрузка просто медленнее
+            self.log.warning("warm_up_fail err=%s", e)
+        metrics = await start_metrics_server(self.cfg["HOST"], self.cfg["METRICS_PORT"])
+
+        # Берём заданий не больше, чем готов выполнить пул загрузок
+        consumers = [asyncio.ensure_future(self._consume(i)) for i in range(self.downloader.scheduler.workers)]
+        self.log.info("✅Download worker started consumers=%s", len(consumers), extra={"notify": True})
+        try:
+            while True:
+                # Потребитель завершился только из-за ошибки вне цикла — перезапускаем на его месте
+                done, _ = await asyncio.wait(consumers, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    i = consumers.index(task)
+                    if not task.cancelled():
+                        self.log.error("worker_consumer_died worker=%s err=%r", i, task.exception())
+                    consumers[i] = asyncio.ensure_future(self._consume(i))
+        finally:
+            for task in consumers:
+                task.cancel()
+            await stop_metrics_server(metrics)
+            await self.downloader.close()
+            await self.resolver.close()
+            await tracer.close()
+            await self.queue.close()
+            await self.rate_limiter.close()
+            await self.bot.session.close()
+            self.log.info("Download worker stopped.")
+
+
+if __name__ == "__main__":
+    asyncio.run(RunDownloadWorker().run())
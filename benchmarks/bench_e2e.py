@@ -0,0 +1,341 @@
+"""
+Сквозной нагрузочный прогон бота без Telegram, TikTok и Instagram.
+
+В этом процессе поднимаются:
+  - заглушка Bot API (benchmarks/e2e/fake_bot_api.py): задержка, 429;
+  - «CDN» с фикстурой mp4 (benchmarks/e2e/fake_media.py);
+В отдельном процессе — настоящий RunHiddenProtocol в режиме polling
+(benchmarks/e2e/bot_entry.py), у которого подменены только адрес Bot API
+и экстрактор yt-dlp.
+
+Драйвер выдаёт апдейты в getUpdates по расписанию (синтетический поток
+или записанный JSONL) с ускорением --speed и считает:
+  - сообщений со ссылкой в секунду (доставлено видео);
+  - p50/p95/p99 от появления апдейта до ответа на sendVideo;
+  - пиковую RSS процесса бота (VmHWM).
+
+Запуск:
+    python benchmarks/bench_e2e.py --messages 500 --rate 20 --speed 1
+    python benchmarks/bench_e2e.py --updates recorded.jsonl --speed 10
+    python benchmarks/bench_e2e.py --record stream.jsonl   # сохранить синтетический поток
+    python benchmarks/bench_e2e.py --env DOWNLOAD_WORKERS=8 --latency 0.1 --flood-rate 0.01
+    python benchmarks/bench_e2e.py --local-api   # как свой telegram-bot-api --local: видео путём к файлу
+
+Формат JSONL: {"at": <секунды от начала>, "update": {... Telegram Update без update_id ...}}.
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import random
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from aiohttp import web  # noqa: E402
+
+from benchmarks.e2e.fake_bot_api import FakeBotAPI  # noqa: E402
+from benchmarks.e2e.fake_media import MEDIA_URL_ENV, FakeCDN, make_fixture  # noqa: E402
+
+GROUP_BASE = -1001000000000
+
+_WORDS = "привет ну да лол смотри это кто идёт завтра ok nice го вечером".split()
+
+
+def synthetic_stream(messages: int, rate: float, groups: int, url_ratio: float, dup_ratio: float, seed: int) -> List[dict]:
+    """Пуассоновский поток: чаты из ALLOWED_GROUP_IDS и немного ЛС, часть сообщений — ссылки TikTok."""
+    rng = random.Random(seed)
+    at = 0.0
+    seen: List[str] = []
+    stream = []
+    for i in range(messages):
+        at += rng.expovariate(rate)
+        private = rng.random() < 0.1
+        user_id = rng.randrange(1, 5000)
+        chat = (
+            {"id": user_id, "type": "private", "first_name": f"u{user_id}"}
+            if private
+            else {"id": GROUP_BASE - rng.randrange(groups), "type": "supergroup", "title": "bench"}
+        )
+        if rng.random() < url_ratio:
+            if seen and rng.random() < dup_ratio:
+                url = rng.choice(seen)
+            else:
+                url = f"https://www.tiktok.com/@user{user_id}/video/{7_300_000_000_000_000_000 + i}"
+                seen.append(url)
+            text = url if rng.random() < 0.7 else f"{url} {' '.join(rng.choices(_WORDS, k=3))}"
+        else:
+            text = " ".join(rng.choices(_WORDS, k=rng.randint(2, 30)))
+        stream.append({
+            "at": round(at, 4),
+            "update": {
+                "message": {
+                    "message_id": i + 1,
+                    "date": int(time.time()),
+                    "chat": chat,
+                    "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "username": f"u{user_id}"},
+                    "text": text,
+                }
+            },
+        })
+    return stream
+
+
+def load_stream(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    for item in items:
+        item["update"].pop("update_id", None)
+    return sorted(items, key=lambda x: x["at"])
+
+
+def _expects_video(update: dict, allowed: set) -> Optional[str]:
+    """URL, на который бот должен ответить видео (TikTok в ЛС или в разрешённой группе)."""
+    msg = update.get("message") or {}
+    text = msg.get("text") or ""
+    chat = msg.get("chat") or {}
+    if chat.get("type") != "private" and chat.get("id") not in allowed:
+        return None
+    for word in text.split():
+        if word.startswith(("http://", "https://")):
+            return word if "tiktok.com/" in word else None
+    return None
+
+
+def _proc_status(pid: int, field: str) -> Optional[int]:
+    """VmHWM/VmRSS в КБ из /proc (только Linux)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def _start(app: web.Application) -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def run(args) -> dict:
+    stream = (
+        load_stream(args.updates)
+        if args.updates
+        else synthetic_stream(args.messages, args.rate, args.groups, args.url_ratio, args.dup_ratio, args.seed)
+    )
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as f:
+            for item in stream:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    allowed = {
+        (item["update"].get("message") or {}).get("chat", {}).get("id")
+        for item in stream
+    } - {None}
+    allowed = {c for c in allowed if c < 0}
+
+    tmp = pathlib.Path(tempfile.mkdtemp(prefix="hp-e2e-"))
+    fixture = pathlib.Path(args.fixture) if args.fixture else make_fixture(tmp / "fixture.mp4", args.video_kb)
+
+    api = FakeBotAPI(
+        latency=args.latency,
+        jitter=args.jitter,
+        flood_rate=args.flood_rate,
+        chat_limit=args.chat_limit,
+        retry_after=args.retry_after,
+        local=args.local_api,
+    )
+    cdn = FakeCDN(fixture, latency=args.cdn_latency)
+    api_runner, api_url = await _start(api.app())
+    cdn_runner, cdn_url = await _start(cdn.app())
+
+    env = dict(os.environ)
+    env.update({
+        # Явные значения, чтобы .env разработчика не попал в прогон
+        "TOKEN": "123456:bench",
+        "API_KEY_JWT": "bench",
+        "BOT_MODE": "polling",
+        "ALLOWED_GROUP_IDS": ",".join(str(c) for c in sorted(allowed)),
+        "TOPIC_CHAT_ID": "",
+        "TOPIC_THREAD_ID": "",
+        "LOG_CHAT_ID": "",
+        "LOG_LEVEL": args.log_level,
+        "METRICS_PORT": "0",
+        "DOWNLOAD_DIR": str(tmp / "downloads"),
+        "DOWNLOAD_EXECUTOR": "thread",
+        "JOB_QUEUE_BACKEND": "local",
+        "FILE_ID_CACHE_BACKEND": "memory",
+        "TRACE_EXPORT_FILE": "",
+        "TRACE_OTLP_ENDPOINT": "",
+        # Бот ходит в заглушку как в свой сервер Bot API
+        "TELEGRAM_API_URL": api_url,
+        "TELEGRAM_API_LOCAL": "true" if args.local_api else "false",
+        "TELEGRAM_API_FILES_DIR": "",
+        MEDIA_URL_ENV: cdn_url,
+        "PYTHONPATH": str(ROOT) + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    for pair in args.env:
+        key, _, value = pair.partition("=")
+        env[key] = value
+
+    t_spawn = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.e2e.bot_entry"],
+        cwd=tmp,
+        env=env,
+        stdout=None if args.bot_output else subprocess.DEVNULL,
+        stderr=None if args.bot_output else subprocess.DEVNULL,
+    )
+    try:
+        await asyncio.wait_for(api.polling_started.wait(), args.startup_timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        raise SystemExit(f"бот не начал polling за {args.startup_timeout}s (--bot-output покажет почему)")
+    startup = api.first_poll_at - t_spawn
+    rss_idle = _proc_status(proc.pid, "VmRSS")
+
+    # --- Воспроизведение ---
+    pending: Dict[str, Deque[float]] = defaultdict(deque)
+    expected = 0
+    t0 = time.monotonic()
+    for item in stream:
+        delay = t0 + item["at"] / args.speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        url = _expects_video(item["update"], allowed)
+        if url:
+            pending[url].append(time.monotonic())
+            expected += 1
+        api.push_update(item["update"])
+    replay_done = time.monotonic()
+
+    # --- Ждём ответов ---
+    deadline = replay_done + args.drain_timeout
+    while len(api.videos) + len(api.errors) < expected and time.monotonic() < deadline:
+        api.delivered.clear()
+        try:
+            await asyncio.wait_for(api.delivered.wait(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            break
+    t_end = time.monotonic()
+    rss_peak = _proc_status(proc.pid, "VmHWM")
+
+    latencies = []
+    for v in api.videos:
+        queue = pending.get(v["url"])
+        if queue:
+            latencies.append(v["at"] - queue.popleft())
+
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    await api_runner.cleanup()
+    await cdn_runner.cleanup()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    last = max((v["at"] for v in api.videos), default=t_end)
+    wall = max(1e-9, last - t0)
+    return {
+        "updates": len(stream),
+        "expected_videos": expected,
+        "videos": len(api.videos),
+        "errors": len(api.errors),
+        "lost": max(0, expected - len(api.videos) - len(api.errors)),
+        "flood_429": api.flood_429,
+        "startup_s": startup,
+        "replay_s": replay_done - t0,
+        "wall_s": wall,
+        "videos_per_s": len(api.videos) / wall,
+        "updates_per_s": len(stream) / max(1e-9, replay_done - t0),
+        "p50_s": _pct(latencies, 0.50),
+        "p95_s": _pct(latencies, 0.95),
+        "p99_s": _pct(latencies, 0.99),
+        "mean_s": statistics.fmean(latencies) if latencies else float("nan"),
+        "rss_idle_mb": rss_idle / 1024 if rss_idle else None,
+        "rss_peak_mb": rss_peak / 1024 if rss_peak else None,
+        "upload_mb": api.upload_bytes / 1024 ** 2,
+        "local_mb": api.local_bytes / 1024 ** 2,
+        "cdn_requests": cdn.requests,
+        "calls": dict(api.calls),
+    }
+
+
+def _print(r: dict) -> None:
+    mb = lambda v: f"{v:.1f} MB" if v is not None else "n/a"  # noqa: E731
+    print(f"updates          {r['updates']} ({r['updates_per_s']:.1f}/s за {r['replay_s']:.1f}s)")
+    print(f"videos           {r['videos']}/{r['expected_videos']}  errors={r['errors']} lost={r['lost']} 429={r['flood_429']}")
+    print(f"throughput       {r['videos_per_s']:.2f} videos/s")
+    print(f"latency          p50={r['p50_s']:.3f}s p95={r['p95_s']:.3f}s p99={r['p99_s']:.3f}s mean={r['mean_s']:.3f}s")
+    print(f"bot RSS          idle={mb(r['rss_idle_mb'])} peak={mb(r['rss_peak_mb'])}")
+    print(f"startup          {r['startup_s']:.2f}s до первого getUpdates")
+    print(f"upload           {r['upload_mb']:.1f} MB через HTTP, {r['local_mb']:.1f} MB по пути, CDN запросов {r['cdn_requests']}")
+    print("api calls        " + " ".join(f"{k}={v}" for k, v in sorted(r["calls"].items())))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = parser.add_argument_group("поток апдейтов")
+    src.add_argument("--updates", help="записанный поток (JSONL) вместо синтетического")
+    src.add_argument("--record", help="сохранить поток в JSONL")
+    src.add_argument("--messages", type=int, default=300)
+    src.add_argument("--rate", type=float, default=10.0, help="сообщений в секунду при --speed 1")
+    src.add_argument("--speed", type=float, default=1.0, help="ускорение воспроизведения, N×")
+    src.add_argument("--groups", type=int, default=5)
+    src.add_argument("--url-ratio", type=float, default=0.3, help="доля сообщений со ссылкой TikTok")
+    src.add_argument("--dup-ratio", type=float, default=0.1, help="доля повторных ссылок (file_id из кэша)")
+    src.add_argument("--seed", type=int, default=1)
+
+    fake = parser.add_argument_group("заглушки")
+    fake.add_argument("--latency", type=float, default=0.02, help="задержка ответа Bot API, с")
+    fake.add_argument("--jitter", type=float, default=0.01)
+    fake.add_argument("--flood-rate", type=float, default=0.0, help="вероятность 429 на send*")
+    fake.add_argument("--chat-limit", type=int, default=0, help="send* в чат за минуту до 429; 0 — без лимита")
+    fake.add_argument("--retry-after", type=int, default=1)
+    fake.add_argument("--local-api", action="store_true", help="Bot API в режиме --local: видео отдаётся путём file://")
+    fake.add_argument("--fixture", help="mp4 для CDN; по умолчанию — синтетический файл")
+    fake.add_argument("--video-kb", type=int, default=2048)
+    fake.add_argument("--cdn-latency", type=float, default=0.05)
+
+    bot = parser.add_argument_group("бот")
+    bot.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="переменные для бота")
+    bot.add_argument("--log-level", default="WARNING")
+    bot.add_argument("--bot-output", action="store_true", help="не глушить stdout/stderr бота")
+    bot.add_argument("--startup-timeout", type=float, default=60)
+    bot.add_argument("--drain-timeout", type=float, default=120, help="сколько ждать ответов после потока")
+
+    parser.add_argument("--json", help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    _print(result)
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps(dict(result, args=vars(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Сравнение DOWNLOAD_EXECUTOR=thread и DOWNLOAD_EXECUTOR=process.
+
+Сеть не нужна: вместо yt-dlp запускаем синтетическую «экстракцию» —
+тот же чистый Python, что делают экстракторы (js_to_json, json.loads,
+traverse_obj, регулярки по HTML). Параллельно в event loop тикает таймер
+раз в 10 мс, его опоздания и есть «подвисания» бота под нагрузкой.
+
+Запуск:
+    python benchmarks/bench_executor.py [--jobs 1 4 16] [--workers 4]
+"""
+import argparse
+import asyncio
+import json
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from app.services.download_scheduler import DownloadScheduler  # noqa: E402
+from app.services.download_video import create_process_executor  # noqa: E402
+
+TICK = 0.010
+
+
+def _fake_page(n_items: int) -> str:
+    items = ",".join(
+        "{id:'%d',desc:'clip %d',stats:{playCount:%d,diggCount:%d},"
+        "video:{playAddr:'https://v16.example.com/%d.mp4',width:1080,height:1920}}" % (i, i, i * 7, i * 3, i)
+        for i in range(n_items)
+    )
+    script = "window.__DATA__ = {ItemModule:[%s]};" % items
+    return "<html><head>" + "<meta name='x' content='y'>" * 200 + "</head><body><script>" + script + "</script></body></html>"
+
+
+def fake_extract(n_items: int = 1500) -> int:
+    """Примерно то, что делает экстрактор TikTok/Instagram на одну ссылку."""
+    import re
+
+    from yt_dlp.utils import js_to_json, traverse_obj
+
+    html = _fake_page(n_items)
+    m = re.search(r"window\.__DATA__\s*=\s*({.+?});</script>", html, re.S)
+    data = json.loads(js_to_json(m.group(1)))
+    urls = traverse_obj(data, ("ItemModule", ..., "video", "playAddr"))
+    return len(urls)
+
+
+async def _ticker(lags: list, stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    expected = loop.time() + TICK
+    while not stop.is_set():
+        await asyncio.sleep(TICK)
+        now = loop.time()
+        lags.append(max(0.0, now - expected))
+        expected = now + TICK
+
+
+async def run_case(mode: str, jobs: int, workers: int) -> dict:
+    executor = create_process_executor(workers) if mode == "process" else None
+    scheduler = DownloadScheduler(workers=workers, max_queue=jobs + workers, executor=executor)
+    # Прогрев: процессы стартуют и импортируют yt_dlp до замера
+    await asyncio.gather(*(scheduler.submit(fake_extract, 10) for _ in range(workers)))
+
+    lags: list = []
+    stop = asyncio.Event()
+    ticker = asyncio.ensure_future(_ticker(lags, stop))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(scheduler.submit(fake_extract, chat_id=i, user_id=i) for i in range(jobs)))
+    wall = time.perf_counter() - t0
+    stop.set()
+    await ticker
+    await scheduler.close()
+
+    lags_ms = sorted(x * 1000 for x in lags) or [0.0]
+    return {
+        "mode": mode,
+        "jobs": jobs,
+        "wall_s": wall,
+        "jobs_per_s": jobs / wall if wall else 0.0,
+        "lag_p50_ms": statistics.median(lags_ms),
+        "lag_p95_ms": lags_ms[int(len(lags_ms) * 0.95) - 1] if len(lags_ms) > 1 else lags_ms[0],
+        "lag_max_ms": lags_ms[-1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="вывести результаты в JSON")
+    args = parser.parse_args()
+
+    results = []
+    for jobs in args.jobs:
+        for mode in ("thread", "process"):
+            results.append(asyncio.run(run_case(mode, jobs, args.workers)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<8} {'jobs':>4} {'wall,s':>8} {'jobs/s':>8} {'lag p50':>9} {'lag p95':>9} {'lag max':>9}")
+    for r in results:
+        print(
+            f"{r['mode']:<8} {r['jobs']:>4} {r['wall_s']:>8.2f} {r['jobs_per_s']:>8.2f} "
+            f"{r['lag_p50_ms']:>7.1f}ms {r['lag_p95_ms']:>7.1f}ms {r['lag_max_ms']:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
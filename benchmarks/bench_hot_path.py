@@ -0,0 +1,291 @@
+"""
+Микробенчмарки CPU-части, которая выполняется на каждое сообщение, — без сети и Telegram.
+
+Кейсы:
+  first_url        — поиск ссылки в тексте
+  is_allowed_url   — проверка хоста/пути
+  url_filter       — F.text.regexp(URL_PATTERN), фильтр роутера (работает на КАЖДОМ тексте в группах)
+  resolve_route    — VideoRouter._resolve_route
+  build_caption    — подпись к видео
+  tg_log_render    — TelegramLogHandler._render (textwrap.shorten длинных traceback)
+  get_config       — Config.get_config
+
+Корпус — синтетический, но похожий на живые группы: короткий трёп, длинные
+сообщения без ссылок, ссылки TikTok/Instagram с трекинг-параметрами, чужие ссылки.
+Генератор с фиксированным seed, так что корпус одинаков между версиями.
+
+Результаты сохраняются в benchmarks/results/<имя>.json и сравниваются с базой:
+    python benchmarks/bench_hot_path.py --save baseline
+    python benchmarks/bench_hot_path.py --compare baseline [--threshold 1.25]
+С --compare код выхода 1, если какой-то кейс медленнее базы больше чем в threshold раз.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import pathlib
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Sequence
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from aiogram import F  # noqa: E402
+from aiogram.types import Chat, Message  # noqa: E402
+
+from app.utils.tg_log_handler import TelegramLogHandler  # noqa: E402
+from app.utils.urls import first_url, is_allowed_url  # noqa: E402
+from handlers.video import URL_PATTERN, VideoRouter, build_caption  # noqa: E402
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+_WORDS = (
+    "привет всем кто завтра идёт на встречу я опоздаю минут на десять "
+    "ну такое себе честно говоря лол согласен скинь потом фотки "
+    "ok guys see you tomorrow lol this is fine deadline moved again "
+    "кстати кто-нибудь видел новый выпуск там было смешно ахаха"
+).split()
+
+_TRACKING = "is_from_webapp=1&sender_device=pc&web_id=7300000000000000000&_r=1&_t=ZS-8abcDEF"
+
+
+def _chatter(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _tiktok(rng: random.Random) -> str:
+    vid = rng.randrange(7_000_000_000_000_000_000, 7_400_000_000_000_000_000)
+    return rng.choice((
+        f"https://www.tiktok.com/@user{rng.randrange(1000)}/video/{vid}?{_TRACKING}",
+        f"https://vm.tiktok.com/ZM{rng.randrange(10**6, 10**7)}/",
+        f"https://vt.tiktok.com/ZS{rng.randrange(10**6, 10**7)}/",
+    ))
+
+
+def _instagram(rng: random.Random) -> str:
+    code = "".join(rng.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJ0123456789_-") for _ in range(11))
+    return f"https://www.instagram.com/reel/{code}/?igsh=MWZ{rng.randrange(10**8)}"
+
+
+def _foreign(rng: random.Random) -> str:
+    return rng.choice((
+        f"https://www.youtube.com/watch?v={rng.randrange(10**10)}",
+        f"https://www.instagram.com/p/C{rng.randrange(10**8)}/",
+        "https://example.com/some/long/path?with=query&and=more",
+    ))
+
+
+def build_corpus(size: int, seed: int = 42) -> List[str]:
+    """
+    Доли примерно как в живой группе: большинство сообщений без ссылок
+    (в т.ч. длинные простыни), остальное — ссылки, часто с текстом вокруг.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        r = rng.random()
+        if r < 0.45:
+            text = _chatter(rng, rng.randint(2, 15))
+        elif r < 0.60:
+            text = _chatter(rng, rng.randint(200, 700))  # простыня без ссылок
+        elif r < 0.80:
+            text = _tiktok(rng)
+            if rng.random() < 0.5:
+                text = f"{text} {_chatter(rng, rng.randint(1, 8))}"
+        elif r < 0.90:
+            text = f"{_chatter(rng, rng.randint(0, 6))} {_instagram(rng)}".strip()
+        elif r < 0.95:
+            text = f"{_chatter(rng, rng.randint(100, 400))} {_tiktok(rng)}"  # ссылка в конце длинного текста
+        else:
+            text = f"{_chatter(rng, rng.randint(0, 10))} {_foreign(rng)}".strip()
+        corpus.append(text)
+    return corpus
+
+
+def _message(text: str, chat_id: int = -1001234567890) -> Message:
+    return Message(
+        message_id=1,
+        date=datetime.datetime(2024, 1, 1),
+        chat=Chat(id=chat_id, type="supergroup"),
+        text=text,
+    )
+
+
+def _nested_error(depth: int) -> BaseException:
+    def dive(n: int) -> None:
+        if n == 0:
+            raise RuntimeError("yt-dlp: ERROR: [TikTok] 7300000000000000000: Unable to extract " + "x" * 300)
+        dive(n - 1)
+
+    try:
+        dive(depth)
+    except RuntimeError as e:
+        try:
+            raise ValueError("download failed") from e
+        except ValueError as outer:
+            return outer
+
+
+def _log_records(count: int) -> List[logging.LogRecord]:
+    err = _nested_error(60)
+    exc_info = (type(err), err, err.__traceback__)
+    records = []
+    for i in range(count):
+        long_tail = " ".join(_WORDS) * (1 + i % 8)
+        records.append(logging.LogRecord(
+            "hidden_protocol.video", logging.ERROR, __file__, 0,
+            "download_fail user=%s url=%s err=%s", (i, f"https://vm.tiktok.com/ZM{i}/", long_tail),
+            exc_info if i % 2 == 0 else None,
+        ))
+    return records
+
+
+def _cases(corpus_size: int) -> Dict[str, tuple]:
+    """Имя → (функция от одного входа, список входов)."""
+    corpus = build_corpus(corpus_size)
+    urls = [u for u in (first_url(t) for t in corpus) if u]
+
+    url_filter = F.text.regexp(URL_PATTERN)
+    messages = [_message(t) for t in corpus]
+
+    router = VideoRouter(None, topic_chat_id=-1001234567890, topic_thread_id=7)
+    rng = random.Random(7)
+    routes = [
+        dict(
+            is_private=rng.random() < 0.2,
+            chat_id=rng.choice((-1001234567890, -100999, 555)),
+            thread_id=rng.choice((None, None, 3, 7)),
+            comment_lower=rng.choice(("", "", "disable", "смешно")),
+        )
+        for _ in range(corpus_size)
+    ]
+
+    captions = [("@user%d" % i, u, _chatter(rng, rng.choice((0, 3, 300)))) for i, u in enumerate(urls)]
+
+    loop = asyncio.new_event_loop()
+    handler = TelegramLogHandler(None, chat_id=0, loop=loop)
+    records = _log_records(64)
+
+    for key, value in (("TOKEN", "bench"), ("API_KEY_JWT", "bench")):
+        os.environ.setdefault(key, value)
+    from app.config import Config
+    config = Config()
+
+    return {
+        "first_url": (first_url, corpus),
+        "is_allowed_url": (is_allowed_url, urls),
+        "url_filter": (url_filter.resolve, messages),
+        "resolve_route": (lambda kw: router._resolve_route(**kw), routes),
+        "build_caption": (lambda args: build_caption(*args), captions),
+        "tg_log_render": (handler._render, records),
+        "get_config": (lambda _: config.get_config(), [None] * 50),
+    }
+
+
+def measure(fn: Callable, inputs: Sequence, repeat: int, min_time: float) -> dict:
+    """Проходы по всем входам; число проходов подбирается, чтобы замер длился не меньше min_time."""
+    loops = 1
+    while True:
+        t0 = time.perf_counter_ns()
+        for _ in range(loops):
+            for x in inputs:
+                fn(x)
+        if (time.perf_counter_ns() - t0) / 1e9 >= min_time / repeat or loops >= 1 << 16:
+            break
+        loops *= 2
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        for _ in range(loops):
+            for x in inputs:
+                fn(x)
+        samples.append((time.perf_counter_ns() - t0) / (loops * len(inputs)))
+    return {
+        "inputs": len(inputs),
+        "min_ns": min(samples),
+        "median_ns": statistics.median(samples),
+        "stdev_ns": statistics.pstdev(samples),
+    }
+
+
+def _git_rev() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def compare(current: dict, base: dict, threshold: float) -> bool:
+    """Печатает таблицу относительно базы; True — есть регрессия."""
+    regressed = False
+    print(f"\n{'case':<16} {'base':>10} {'now':>10} {'ratio':>7}")
+    for name, r in current["results"].items():
+        b = base["results"].get(name)
+        if not b:
+            print(f"{name:<16} {'—':>10} {r['min_ns']:>8.0f}ns {'new':>7}")
+            continue
+        ratio = r["min_ns"] / b["min_ns"] if b["min_ns"] else float("inf")
+        mark = ""
+        if ratio > threshold:
+            mark, regressed = "  REGRESSION", True
+        print(f"{name:<16} {b['min_ns']:>8.0f}ns {r['min_ns']:>8.0f}ns {ratio:>6.2f}x{mark}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=int, default=2000, help="сообщений в корпусе")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=1.0, help="секунд на кейс")
+    parser.add_argument("--only", nargs="*", help="только эти кейсы")
+    parser.add_argument("--save", metavar="NAME", help="сохранить в benchmarks/results/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="сравнить с benchmarks/results/NAME.json")
+    parser.add_argument("--threshold", type=float, default=1.25, help="допустимое замедление, раз")
+    args = parser.parse_args()
+
+    cases = _cases(args.corpus)
+    if args.only:
+        cases = {k: v for k, v in cases.items() if k in args.only}
+
+    results = {}
+    print(f"{'case':<16} {'inputs':>6} {'min':>10} {'median':>10} {'stdev':>9}")
+    for name, (fn, inputs) in cases.items():
+        r = measure(fn, inputs, args.repeat, args.min_time)
+        results[name] = r
+        print(f"{name:<16} {r['inputs']:>6} {r['min_ns']:>8.0f}ns {r['median_ns']:>8.0f}ns {r['stdev_ns']:>7.0f}ns")
+
+    current = {
+        "rev": _git_rev(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "corpus": args.corpus,
+        "results": results,
+    }
+
+    if args.save:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"{args.save}.json"
+        path.write_text(json.dumps(current, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\nsaved: {path.relative_to(ROOT)}")
+
+    if args.compare:
+        base = json.loads((RESULTS_DIR / f"{args.compare}.json").read_text(encoding="utf-8"))
+        if base.get("corpus") != args.corpus or base.get("python") != current["python"]:
+            print(f"\n⚠️ база снята на corpus={base.get('corpus')} python={base.get('python')} — сравнение грубое")
+        if compare(current, base, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
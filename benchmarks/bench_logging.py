@@ -0,0 +1,138 @@
+"""
+Сколько стоит один вызов логгера для потока, который логирует (в боте — event loop).
+
+direct — как было: StreamHandler + RotatingFileHandler прямо на логгере,
+         форматирование и запись на диск в вызывающем потоке.
+queue  — как сейчас: QueueHandler кладёт запись в очередь, форматирование
+         и I/O делает фоновый QueueListener.
+
+Записи:
+info   — строка прогресса yt-dlp из горячего пути.
+error  — log.exception с traceback; вдобавок подключён TelegramLogHandler
+         (в direct — на логгере, в queue — в потоке listener, как в боте).
+         Самый дорогой путь: traceback.format_exception и обрезка под 4096 символов.
+
+Запуск:
+    python benchmarks/bench_logging.py [--calls 20000]
+"""
+import asyncio
+import argparse
+import io
+import logging
+import pathlib
+import queue
+import statistics
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from app.utils.logger import DailyRotatingFileHandler, TZFormatter, _DeferredQueueHandler  # noqa: E402
+from app.utils.tg_log_handler import TelegramLogHandler  # noqa: E402
+
+FMT = TZFormatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+
+def _handlers(tmp: pathlib.Path, mode: str) -> list:
+    # Консоль подменяем буфером: терминал в замер не входит, а форматирование — входит
+    ch = logging.StreamHandler(io.StringIO())
+    if mode == "direct":
+        fh = RotatingFileHandler(tmp / "direct.log", maxBytes=2_000_000, backupCount=5, encoding="utf-8")
+    else:
+        fh = DailyRotatingFileHandler(str(tmp / "queue.log"))
+    for h in (ch, fh):
+        h.setFormatter(FMT)
+    return [ch, fh]
+
+
+def _failure() -> BaseException:
+    """Исключение с traceback в несколько кадров, как из yt-dlp."""
+    def fetch(depth: int) -> None:
+        if depth:
+            fetch(depth - 1)
+        raise ConnectionError("[Errno 104] Connection reset by peer")
+
+    try:
+        fetch(8)
+    except ConnectionError as e:
+        return e
+
+
+def run_case(mode: str, record: str, calls: int, tmp: pathlib.Path) -> dict:
+    log = logging.getLogger(f"bench.{mode}.{record}")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    handlers = _handlers(tmp, mode)
+    loop = None
+    if record == "error":
+        # Отправитель не запущен: замеряем только путь до очереди TelegramLogHandler
+        loop = asyncio.new_event_loop()
+        handlers.append(TelegramLogHandler(bot=None, chat_id=1, loop=loop, max_queue=calls))
+    listener = None
+    if mode == "direct":
+        for h in handlers:
+            log.addHandler(h)
+    else:
+        q = queue.SimpleQueue()
+        listener = QueueListener(q, *handlers)
+        listener.start()
+        log.addHandler(_DeferredQueueHandler(q))
+
+    exc = _failure()
+    samples = []
+    for i in range(calls):
+        t0 = time.perf_counter_ns()
+        if record == "error":
+            log.error("send_fail chat=%s url=%s err=%s", -100123, "https://www.tiktok.com/@u/video/1", exc, exc_info=exc)
+        else:
+            # Типичная строка из горячего пути: прогресс yt-dlp
+            log.info(
+                "yt-dlp: downloading url=%s progress=%.1f%% bytes=%s/%s speed=%.1fkB/s eta=%ss",
+                "https://www.tiktok.com/@u/video/7300000000000000000", i % 100, i * 1024, 10_000_000, 512.0, 3,
+            )
+        samples.append(time.perf_counter_ns() - t0)
+
+    if listener:
+        listener.stop()
+    for h in handlers:
+        h.close()
+    log.handlers.clear()
+    if loop is not None:
+        loop.close()
+
+    us = sorted(x / 1000 for x in samples)
+    return {
+        "mode": mode,
+        "record": record,
+        "calls": calls,
+        "p50_us": statistics.median(us),
+        "p99_us": us[int(len(us) * 0.99) - 1],
+        "max_us": us[-1],
+        "total_ms": sum(us) / 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [
+            run_case(mode, record, args.calls, pathlib.Path(tmp))
+            for record in ("info", "error")
+            for mode in ("direct", "queue")
+        ]
+
+    print(f"{'mode':<8} {'record':<7} {'calls':>6} {'p50':>9} {'p99':>9} {'max':>10} {'total':>9}")
+    for r in results:
+        print(
+            f"{r['mode']:<8} {r['record']:<7} {r['calls']:>6} {r['p50_us']:>7.1f}us {r['p99_us']:>7.1f}us "
+            f"{r['max_us']:>8.1f}us {r['total_ms']:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Холодный старт: сколько стоят импорты и когда бот начинает отвечать.
+
+Импорты (`python -X importtime`, отдельный процесс на каждый замер):
+  bot       — import app.main (процесс polling-бота)
+  http_api  — import app.http_api (процесс HTTP API)
+Печатается сумма, самые тяжёлые пакеты верхнего уровня и проверка, что лишнего
+не подгружено: в бот — yt_dlp, fastapi, uvicorn; в HTTP API — yt_dlp.
+
+Запуск бота (benchmarks/e2e/bot_entry.py против заглушек Bot API и CDN, как в bench_e2e):
+  first_poll   — от запуска процесса до первого getUpdates
+  first_video  — до sendVideo на ссылку, которая ждала в очереди с самого старта
+                 (сюда входят импорт yt-dlp и прогрев)
+
+Для CI — как у bench_hot_path:
+    python benchmarks/bench_startup.py --save startup
+    python benchmarks/bench_startup.py --compare startup [--threshold 1.3]
+С --compare код выхода 1, если замер медленнее базы больше чем в threshold раз
+или в процесс попал запрещённый модуль (без --compare — тоже 1).
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import platform
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from aiohttp import web  # noqa: E402
+
+from benchmarks.e2e.fake_bot_api import FakeBotAPI  # noqa: E402
+from benchmarks.e2e.fake_media import MEDIA_URL_ENV, FakeCDN, make_fixture  # noqa: E402
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+# Модуль → что в его процессе появляться не должно
+TARGETS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "bot": ("app.main", ("yt_dlp", "fastapi", "uvicorn")),
+    "http_api": ("app.http_api", ("yt_dlp",)),
+}
+
+_CHILD = """
+import json, sys
+import {module}
+print(json.dumps(sorted({{m.split(".")[0] for m in sys.modules}})))
+"""
+
+
+def _env(tmp: pathlib.Path, api_url: str = "", cdn_url: str = "") -> dict:
+    env = dict(os.environ)
+    env.update({
+        # Явные значения, чтобы .env разработчика не попал в прогон
+        "TOKEN": "123456:bench",
+        "API_KEY_JWT": "bench",
+        "BOT_MODE": "polling",
+        "ALLOWED_GROUP_IDS": "",
+        "TOPIC_CHAT_ID": "",
+        "TOPIC_THREAD_ID": "",
+        "LOG_CHAT_ID": "",
+        "LOG_LEVEL": "WARNING",
+        "METRICS_PORT": "0",
+        "DOWNLOAD_DIR": str(tmp / "downloads"),
+        "DOWNLOAD_EXECUTOR": "thread",
+        "JOB_QUEUE_BACKEND": "local",
+        "FILE_ID_CACHE_BACKEND": "memory",
+        "TRACE_EXPORT_FILE": "",
+        "TRACE_OTLP_ENDPOINT": "",
+        "TELEGRAM_API_URL": api_url,
+        "TELEGRAM_API_LOCAL": "false",
+        "TELEGRAM_API_FILES_DIR": "",
+        MEDIA_URL_ENV: cdn_url,
+        "PYTHONPATH": str(ROOT) + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    return env
+
+
+def parse_importtime(stderr: str) -> Tuple[int, Dict[str, int]]:
+    """(сумма self, мкс; self по пакетам верхнего уровня)."""
+    total = 0
+    by_pkg: Dict[str, int] = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _cumulative, name = line[len("import time:"):].split("|", 2)
+        us = int(self_us)
+        total += us
+        by_pkg[name.strip().split(".")[0]] += us
+    return total, dict(by_pkg)
+
+
+def measure_imports(module: str, tmp: pathlib.Path, repeat: int) -> dict:
+    """Лучший из repeat замеров (меньше всего шума от диска и соседей)."""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _CHILD.format(module=module)],
+            cwd=tmp, env=_env(tmp), capture_output=True, text=True, timeout=120,
+        )
+        wall = time.perf_counter() - t0
+        if out.returncode != 0:
+            raise SystemExit(f"import {module} упал:\n{out.stderr[-2000:]}")
+        total, by_pkg = parse_importtime(out.stderr)
+        if best is None or total < best["import_us"]:
+            best = {
+                "import_us": total,
+                "wall_s": wall,
+                "packages": by_pkg,
+                "loaded": json.loads(out.stdout.strip().splitlines()[-1]),
+            }
+    return best
+
+
+async def _start(app: web.Application) -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def measure_boot(tmp: pathlib.Path, timeout: float) -> dict:
+    """Один запуск бота: ссылка уже ждёт в getUpdates, засекаем первый опрос и первое видео."""
+    api = FakeBotAPI()
+    cdn = FakeCDN(make_fixture(tmp / "fixture.mp4", 256))
+    api_runner, api_url = await _start(api.app())
+    cdn_runner, cdn_url = await _start(cdn.app())
+    api.push_update({
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private", "first_name": "u1"},
+            "from": {"id": 1, "is_bot": False, "first_name": "u1", "username": "u1"},
+            "text": "https://www.tiktok.com/@user1/video/7300000000000000001",
+        }
+    })
+
+    t_spawn = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.e2e.bot_entry"],
+        cwd=tmp, env=_env(tmp, api_url, cdn_url),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        await asyncio.wait_for(api.polling_started.wait(), timeout)
+        while not (api.videos or api.errors):
+            api.delivered.clear()
+            await asyncio.wait_for(api.delivered.wait(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        raise SystemExit(f"бот не ответил за {timeout}s:\n{proc.stderr.read().decode()[-2000:]}")
+    finally:
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        await api_runner.cleanup()
+        await cdn_runner.cleanup()
+
+    if not api.videos:
+        raise SystemExit(f"бот ответил ошибкой вместо видео: {api.errors[0]['text']}")
+    return {
+        "first_poll_s": api.first_poll_at - t_spawn,
+        "first_video_s": api.videos[0]["at"] - t_spawn,
+    }
+
+
+def _git_rev() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def compare(current: dict, base: dict, threshold: float) -> bool:
+    """Печатает таблицу относительно базы; True — есть регрессия."""
+    rows = [(f"import {n}", r["import_us"] / 1e6, base["imports"].get(n, {}).get("import_us", 0) / 1e6)
+            for n, r in current["imports"].items()]
+    rows += [(k, v, base["boot"].get(k, 0.0)) for k, v in current["boot"].items()]
+    regressed = False
+    print(f"\n{'metric':<16} {'base':>9} {'now':>9} {'ratio':>7}")
+    for name, now, b in rows:
+        if not b:
+            print(f"{name:<16} {'—':>9} {now:>8.3f}s {'new':>7}")
+            continue
+        ratio = now / b
+        mark = ""
+        if ratio > threshold:
+            mark, regressed = "  REGRESSION", True
+        print(f"{name:<16} {b:>8.3f}s {now:>8.3f}s {ratio:>6.2f}x{mark}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="замеров импорта на модуль (берётся лучший)")
+    parser.add_argument("--runs", type=int, default=3, help="запусков бота (берётся медиана)")
+    parser.add_argument("--top", type=int, default=8, help="сколько пакетов показать")
+    parser.add_argument("--timeout", type=float, default=60.0, help="секунд на запуск бота")
+    parser.add_argument("--save", metavar="NAME", help="сохранить в benchmarks/results/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="сравнить с benchmarks/results/NAME.json")
+    parser.add_argument("--threshold", type=float, default=1.3, help="допустимое замедление, раз")
+    args = parser.parse_args()
+
+    tmp = pathlib.Path(tempfile.mkdtemp(prefix="hp-startup-"))
+    try:
+        imports = {}
+        leaked = []
+        for name, (module, forbidden) in TARGETS.items():
+            r = measure_imports(module, tmp, args.repeat)
+            bad = sorted(set(forbidden) & set(r.pop("loaded")))
+            leaked += [f"{name}: {m}" for m in bad]
+            imports[name] = r
+            top = sorted(r["packages"].items(), key=lambda kv: kv[1], reverse=True)[: args.top]
+            print(f"import {module:<14} {r['import_us'] / 1e6:.3f}s (процесс {r['wall_s']:.2f}s)"
+                  + (f"  ЛИШНЕЕ: {', '.join(bad)}" if bad else ""))
+            for pkg, us in top:
+                print(f"    {pkg:<20} {us / 1e3:>8.1f} ms")
+
+        boots: List[dict] = []
+        for _ in range(args.runs):
+            boots.append(asyncio.run(measure_boot(tmp, args.timeout)))
+        boot = {k: statistics.median(b[k] for b in boots) for k in boots[0]}
+        print(f"first getUpdates {boot['first_poll_s']:.2f}s после запуска процесса")
+        print(f"first sendVideo  {boot['first_video_s']:.2f}s (импорт yt-dlp и прогрев включены)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for pkg in imports.values():
+        # В файл — только заметные пакеты, чтобы база не разрасталась
+        pkg["packages"] = {k: v for k, v in pkg["packages"].items() if v >= 1000}
+    current = {
+        "rev": _git_rev(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "imports": imports,
+        "boot": boot,
+    }
+
+    if args.save:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"{args.save}.json"
+        path.write_text(json.dumps(current, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\nsaved: {path.relative_to(ROOT)}")
+
+    failed = False
+    if leaked:
+        print("\n⚠️ подгружено лишнее: " + "; ".join(leaked))
+        failed = True
+    if args.compare:
+        base = json.loads((RESULTS_DIR / f"{args.compare}.json").read_text(encoding="utf-8"))
+        if base.get("python") != current["python"]:
+            print(f"\n⚠️ база снята на python={base.get('python')} — сравнение грубое")
+        failed = compare(current, base, args.threshold) or failed
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
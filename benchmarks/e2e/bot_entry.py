@@ -0,0 +1,30 @@
+"""
+Запуск настоящего RunHiddenProtocol против заглушек (вызывается из bench_e2e.py
+отдельным процессом, чтобы пиковая память и CPU считались только для бота).
+
+Подменяются ровно две вещи: адрес Bot API (TELEGRAM_API_URL — драйвер указывает
+на заглушку, как на свой сервер Bot API) и набор экстракторов yt-dlp.
+"""
+import asyncio
+
+from app.main import RunHiddenProtocol
+from app.services import download_video
+
+
+def _fake_extractors() -> list:
+    # Импорт здесь: yt-dlp, как и у настоящего бота, грузится только при первой загрузке
+    from benchmarks.e2e.fake_media import FakeTikTokIE
+
+    return [FakeTikTokIE]
+
+
+def main() -> None:
+    # Только потоки: в процессы пула подмена экстрактора не доедет
+    download_video._ydl_extractors = _fake_extractors
+
+    app = RunHiddenProtocol()
+    asyncio.run(app.run_bot())
+
+
+if __name__ == "__main__":
+    main()
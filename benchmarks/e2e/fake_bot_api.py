@@ -0,0 +1,218 @@
+"""
+Локальный заменитель Telegram Bot API для нагрузочного прогона.
+
+Реализует то, что дёргает бот: getMe, deleteWebhook, getUpdates (long polling),
+sendVideo, sendMediaGroup, sendChatAction, deleteMessage, sendMessage; остальное отвечает true.
+Задержка ответа настраивается, 429 — случайно (flood_rate) и/или по лимиту
+сообщений в чат в минуту, как у настоящего Telegram.
+
+local=True — как telegram-bot-api с --local: видео можно передать путём file://...,
+сервер читает файл с диска сам. Без local такие ссылки отклоняются, как на api.telegram.org.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+
+from aiohttp import web
+
+_METHOD_RE = re.compile(r"^/bot(?P<token>[^/]+)/(?P<method>\w+)$")
+_CAPTION_URL_RE = re.compile(r"https?://\S+")
+
+# Методы, на которые Telegram отвечает 429 при флуде
+_SEND_METHODS = {"sendvideo", "sendmessage", "sendmediagroup", "senddocument"}
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        flood_rate: float = 0.0,
+        chat_limit: int = 0,
+        retry_after: int = 1,
+        seed: int = 1,
+        local: bool = False,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.chat_limit = chat_limit  # сообщений в чат за 60 с; 0 — без лимита
+        self.retry_after = retry_after
+        self.local = local
+        self._rng = random.Random(seed)
+
+        self._updates: List[dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(10_000_000)
+        self._new_updates = asyncio.Event()
+        self._chat_sends: Dict[int, Deque[float]] = defaultdict(deque)
+
+        # Для отчёта драйвера
+        self.polling_started = asyncio.Event()
+        self.first_poll_at: Optional[float] = None
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.flood_429 = 0
+        self.upload_bytes = 0  # пришло multipart-ом через HTTP
+        self.local_bytes = 0  # прочитано с диска по file:// (local=True)
+        self.videos: List[dict] = []  # {"at", "chat_id", "url"}
+        self.errors: List[dict] = []  # {"at", "chat_id", "text"}
+        self.delivered = asyncio.Event()  # дёргается на каждое видео/ошибку
+
+    # --- Лента апдейтов ---
+
+    def push_update(self, update: dict) -> int:
+        update = dict(update, update_id=next(self._update_ids))
+        self._updates.append(update)
+        self._new_updates.set()
+        return update["update_id"]
+
+    async def _get_updates(self, data: dict) -> list:
+        if self.first_poll_at is None:
+            self.first_poll_at = time.monotonic()
+            self.polling_started.set()
+        offset = int(data.get("offset") or 0)
+        limit = int(data.get("limit") or 100)
+        timeout = float(data.get("timeout") or 0)
+        # Подтверждённые (< offset) больше не нужны
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    # --- HTTP ---
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=2 * 1024 ** 3)
+        app.router.add_post("/{tail:.*}", self._handle)
+        app.router.add_get("/{tail:.*}", self._handle)
+        return app
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        m = _METHOD_RE.match(request.path)
+        if not m:
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+        method = m.group("method")
+        key = method.lower()
+        self.calls[method] += 1
+
+        data = {}
+        if request.can_read_body:
+            form = await request.post()
+            for k, v in form.items():
+                if isinstance(v, web.FileField):
+                    size = len(v.file.read())
+                    self.upload_bytes += size
+                    data[k] = f"<file {size}b>"
+                else:
+                    data[k] = v
+        data.update(request.query)
+
+        if key == "getupdates":
+            return self._ok(await self._get_updates(data))
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._rng.random() * self.jitter)
+
+        if key in _SEND_METHODS and self._flooded(int(data.get("chat_id", 0))):
+            self.flood_429 += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+
+        if key == "getme":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"})
+        if key == "sendvideo":
+            error = self._check_media(data.get("video"))
+            if error:
+                return self._bad_request(error)
+            return self._ok(self._send_video(data))
+        if key == "sendmediagroup":
+            media = json.loads(data.get("media") or "[]")
+            error = next((e for e in map(self._check_media, (i.get("media") for i in media)) if e), None)
+            if error:
+                return self._bad_request(error)
+            return self._ok([self._send_video(dict(data, caption=i.get("caption"))) for i in media])
+        if key == "sendmessage":
+            return self._ok(self._send_message(data))
+        return self._ok(True)
+
+    def _flooded(self, chat_id: int) -> bool:
+        if self.flood_rate and self._rng.random() < self.flood_rate:
+            return True
+        if not self.chat_limit:
+            return False
+        now = time.monotonic()
+        sends = self._chat_sends[chat_id]
+        while sends and sends[0] < now - 60:
+            sends.popleft()
+        if len(sends) >= self.chat_limit:
+            return True
+        sends.append(now)
+        return False
+
+    def _check_media(self, media: Optional[str]) -> Optional[str]:
+        """Ошибка Bot API для значения video/media или None; file:// читаем, если local."""
+        if not media or not media.startswith("file://"):
+            return None
+        if not self.local:
+            return "Bad Request: wrong remote file identifier specified: Wrong character in the string"
+        path = media[len("file://"):]
+        try:
+            self.local_bytes += os.path.getsize(path)
+        except OSError:
+            return "Bad Request: file not found"
+        return None
+
+    def _message(self, chat_id: int, **extra) -> dict:
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+        if chat_id < 0:
+            chat["title"] = "bench"
+        return {"message_id": next(self._message_ids), "date": int(time.time()), "chat": chat, **extra}
+
+    def _send_video(self, data: dict) -> dict:
+        chat_id = int(data["chat_id"])
+        caption = data.get("caption") or ""
+        m = _CAPTION_URL_RE.search(caption)
+        self.videos.append({"at": time.monotonic(), "chat_id": chat_id, "url": m.group(0) if m else None})
+        self.delivered.set()
+        file_id = "BAAC" + "%016x" % self._rng.getrandbits(64)
+        video = {
+            "file_id": file_id,
+            "file_unique_id": file_id[-12:],
+            "width": 720,
+            "height": 1280,
+            "duration": 10,
+        }
+        return self._message(chat_id, video=video, caption=caption)
+
+    def _send_message(self, data: dict) -> dict:
+        chat_id = int(data["chat_id"])
+        text = data.get("text") or ""
+        self.errors.append({"at": time.monotonic(), "chat_id": chat_id, "text": text})
+        self.delivered.set()
+        return self._message(chat_id, text=text)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _bad_request(description: str) -> web.Response:
+        return web.json_response({"ok": False, "error_code": 400, "description": description}, status=400)
@@ -0,0 +1,67 @@
+"""
+Заменители TikTok для нагрузочного прогона: локальный «CDN» с фикстурой mp4
+и экстрактор yt-dlp, который отдаёт ссылку на неё вместо похода на tiktok.com.
+"""
+import asyncio
+import os
+import pathlib
+import struct
+from typing import Optional
+
+from aiohttp import web
+from yt_dlp.extractor.common import InfoExtractor
+
+MEDIA_URL_ENV = "HP_BENCH_MEDIA_URL"
+
+
+def make_fixture(path: pathlib.Path, size_kb: int) -> pathlib.Path:
+    """Файл с заголовком ftyp и случайным телом: yt-dlp и Telegram-заглушке содержимое не важно."""
+    ftyp = struct.pack(">I4s4sI", 24, b"ftyp", b"isom", 0x200) + b"isommp42"
+    path.write_bytes(ftyp + os.urandom(max(0, size_kb * 1024 - len(ftyp))))
+    return path
+
+
+class FakeCDN:
+    """GET /v/<id>.mp4 → фикстура (Range поддерживает FileResponse)."""
+
+    def __init__(self, fixture: pathlib.Path, latency: float = 0.0):
+        self.fixture = fixture
+        self.latency = latency
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v/{name}", self._handle)
+        return app
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.FileResponse(self.fixture, headers={"Content-Type": "video/mp4"})
+
+
+class FakeTikTokIE(InfoExtractor):
+    """Понимает www.tiktok.com/@user/video/<id>; platform в метриках и кэше — как у настоящего, "tiktok"."""
+
+    IE_NAME = "tiktok"
+    _VALID_URL = r"https?://(?:www\.)?tiktok\.com/@[\w.-]+/video/(?P<id>\d+)"
+
+    @classmethod
+    def ie_key(cls) -> str:
+        return "TikTok"
+
+    def _real_extract(self, url: str) -> dict:
+        video_id = self._match_id(url)
+        base: Optional[str] = os.environ.get(MEDIA_URL_ENV)
+        return {
+            "id": video_id,
+            "title": f"bench {video_id}",
+            "url": f"{base}/v/{video_id}.mp4",
+            "ext": "mp4",
+            "vcodec": "h264",
+            "acodec": "aac",
+            "width": 720,
+            "height": 1280,
+            "duration": 10,
+        }
@@ -1,14 +1,24 @@
-import os
+import asyncio
 import logging
 import contextlib
-from typing import Optional, Set, Tuple
+import os
+import time
+from typing import List, Optional, Set, Tuple
 
-from aiogram import Router, F
+from aiogram import Bot, Router, F
 from aiogram.enums import ChatType, ChatAction
-from aiogram.types import Message, FSInputFile
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.types import BufferedInputFile, InputMediaVideo, Message, FSInputFile
 
-from app.services.download_video import DownloadVideo
-from app.utils.urls import first_url, is_allowed_url
+from app.services.download_scheduler import DownloadQueueFull
+from app.services.download_video import DownloadVideo, VideoTooLarge
+from app.services.file_id_cache import FileIdCache
+from app.services.upstream_health import TRANSIENT_REASONS, DownloadFailed
+from app.services.job_queue import RedisJobQueue
+from app.utils.tracing import current_span, span, trace
+from app.utils.telegram_api import LocalFiles
+from app.utils.metrics import JOBS_SUBMITTED, UPLOAD_BYTES, UPLOAD_SECONDS, VIDEO_ERRORS, VIDEO_REQUESTS
+from app.utils.urls import ShortLinkResolver, entity_urls, first_url, is_allowed_url, normalize_url, video_key
 
 
 def _type_str(t) -> str:
@@ -24,8 +34,94 @@ def _is_group(chat) -> bool:
 
 log = logging.getLogger("hidden_protocol.video")
 
+
+def build_caption(username: str, url: str, comment: str) -> str:
+    """Подпись к видео (не длиннее лимита Telegram в 1024 символа)."""
+    if comment and comment.lower() != "disable":
+        caption = (
+            f"🎬 Отправлено пользователем: {username}\n"
+            f"🌐 Ссылка: {url}\n"
+            f"✍️ Комментарий: {comment}"
+        )
+    else:
+        caption = (
+            f"🎬 Отправлено пользователем: {username}\n"
+            f"🌐 Ссылка: {url}"
+        )
+    return caption[:1024]
+
 URL_PATTERN = r"https?://\S+"
 
+# Больше в один альбом (sendMediaGroup) Telegram не принимает
+MEDIA_GROUP_MAX = 10
+
+
+def _video_kwargs(meta: dict) -> dict:
+    """
+    Метаданные для send_video/InputMediaVideo из результата загрузки или probe:
+    с размерами, длительностью и supports_streaming клиент играет, не дожидаясь всего файла.
+    """
+    kwargs = {"supports_streaming": True}
+    for key in ("duration", "width", "height"):
+        if meta.get(key):
+            kwargs[key] = meta[key]
+    if meta.get("thumbnail"):
+        kwargs["thumbnail"] = BufferedInputFile(meta["thumbnail"], filename="thumb.jpg")
+    return kwargs
+
+
+_PLATFORM_NAMES = {"tiktok": "TikTok", "instagram": "Instagram"}
+
+_ERROR_MESSAGES = {
+    "queue_full": "⚠️ Сейчас слишком много загрузок. Попробуй через пару минут.",
+    "too_large": "⚠️ Видео слишком большое для отправки в Telegram.",
+    "restricted": "⚠️ Видео недоступно из-за возрастных или региональных ограничений.",
+    "not_found": "⚠️ Видео не найдено или было удалено.",
+    "unsupported": "⚠️ Формат ссылки не поддерживается.",
+    "timeout": "⚠️ Не удалось подключиться к {platform} (таймаут соединения). Попробуй позже.",
+    # network | rate_limited | upstream | unavailable (автомат платформы разомкнут)
+    "upstream": "⚠️ Не удалось подключиться к {platform}. Попробуй позже.",
+    "other": "⚠️ Не удалось скачать или отправить видео. Возможно, сервис недоступен.",
+}
+
+
+def _error_reason(e: Exception) -> Tuple[str, str]:
+    """Категория ошибки для метрик и текст для пользователя (категории — из DownloadFailed.reason)."""
+    if isinstance(e, DownloadQueueFull):
+        reason = "queue_full"
+    elif isinstance(e, VideoTooLarge):
+        # Отсекли по метаданным — повтор не поможет
+        reason = "too_large"
+    elif isinstance(e, DownloadFailed):
+        reason = e.reason
+    else:
+        # Ошибки отправки в Telegram и прочее не из загрузки
+        reason = "other"
+    template = _ERROR_MESSAGES.get(reason) or _ERROR_MESSAGES["upstream"]
+    platform = _PLATFORM_NAMES.get(getattr(e, "platform", None) or "", "сервису")
+    return reason, template.format(platform=platform)
+
+
+def _deletes_source(job: dict) -> bool:
+    """Удалять ли исходное сообщение после отправки: у заданий API его нет, пост с медиа оставляем."""
+    return job.get("message_id") is not None and job.get("delete_source", True)
+
+
+# Сбои Telegram, которые проходят сами: сеть, 5xx, флуд-контроль
+_TRANSIENT_TG_ERRORS = (TelegramNetworkError, TelegramServerError, TelegramRetryAfter)
+
+
+def _retryable(e: Exception) -> bool:
+    """
+    Есть ли смысл повторять задание из очереди: только временные сбои платформы и Telegram
+    и переполненная очередь. Остальное (TelegramBadRequest, «видео нет», ошибки в коде)
+    повтор не лечит — пользователь получает ответ сразу, задание закрывается.
+    """
+    if isinstance(e, _TRANSIENT_TG_ERRORS):
+        return True
+    reason = _error_reason(e)[0]
+    return reason in TRANSIENT_REASONS or reason == "queue_full"
+
 class VideoRouter:
     def __init__(
         self,
@@ -33,9 +129,18 @@ class VideoRouter:
         allowed_group_ids: Set[int] = frozenset(),
         topic_chat_id: Optional[int] = None,
         topic_thread_id: Optional[int] = None,
+        file_ids: Optional[FileIdCache] = None,
+        resolver: Optional[ShortLinkResolver] = None,
+        job_queue: Optional[RedisJobQueue] = None,
+        local_files: Optional[LocalFiles] = None,
     ):
         self.router = Router()
         self.downloader = downloader
+        self.file_ids = file_ids
+        self.resolver = resolver
+        self.job_queue = job_queue
+        # Свой telegram-bot-api с --local: файлы с диска отдаём путём, а не байтами
+        self.local_files = local_files
         self.allowed_group_ids = allowed_group_ids
         self.topic_chat_id = topic_chat_id
         self.topic_thread_id = topic_thread_id
@@ -43,6 +148,8 @@ class VideoRouter:
 
     def _register(self) -> None:
         self.router.message.register(self.handle_url, F.text.regexp(URL_PATTERN))
+        # Ссылки в подписи к фото/видео
+        self.router.message.register(self.handle_url, F.caption.regexp(URL_PATTERN))
 
     def _resolve_route(
         self,
@@ -84,27 +191,41 @@ class VideoRouter:
         return chat_id, None, ("private_echo" if is_private else "group_same_chat")
 
     async def handle_url(self, m: Message):
-        url = first_url(m.text)
+        raw_text = m.text or m.caption or ""
+        entities = m.entities if m.text else m.caption_entities
+        # Все ссылки по разметке Telegram; сообщение без разметки — первая ссылка из текста
+        found = entity_urls(raw_text, entities) if entities is not None else [u for u in (first_url(raw_text),) if u]
         user = m.from_user
         user_id = user.id if user else None
         chat_id = m.chat.id
         chat_type = _type_str(m.chat.type)
 
-        if not url:
+        if not found:
             log.debug("skip_no_url user=%s chat=%s type=%s", user_id, chat_id, chat_type)
             return False
 
         # --- Проверка домена / пути ---
-        if not is_allowed_url(url):
-            log.info(
-                "deny_url_not_allowed user=%s chat=%s type=%s url=%s reason=not_in_allowed_list",
-                user_id,
-                chat_id,
-                chat_type,
-                url,
-                extra={"notify": False},
-            )
+        urls: List[str] = []
+        seen: Set[str] = set()
+        for u in found:
+            if not is_allowed_url(u):
+                log.info(
+                    "deny_url_not_allowed user=%s chat=%s type=%s url=%s reason=not_in_allowed_list",
+                    user_id,
+                    chat_id,
+                    chat_type,
+                    u,
+                    extra={"notify": False},
+                )
+                continue
+            # Одно видео с разными трекинговыми параметрами — один раз
+            norm = normalize_url(u)
+            if norm not in seen:
+                seen.add(norm)
+                urls.append(u)
+        if not urls:
             return False
+        url = " ".join(urls)  # для логов
 
         is_private = _is_private(m.chat)
         is_group = _is_group(m.chat)
@@ -129,9 +250,11 @@ class VideoRouter:
         else:
             username = "unknown"
 
-        # Комментарий = текст без URL
-        raw_text = m.text or ""
-        comment = raw_text.replace(url, "").strip()
+        # Комментарий = текст без URL (Telegram размечает и ссылки без схемы)
+        comment = raw_text
+        for u in found:
+            comment = comment.replace(u, "") if u in comment else comment.replace(u.split("://", 1)[1], "")
+        comment = comment.strip()
         comment_lower = comment.lower()
 
         # --- Роутинг ---
@@ -142,95 +265,271 @@ class VideoRouter:
             comment_lower=comment_lower,
         )
 
-        # --- Подпись к видео ---
-        if comment and comment_lower != "disable":
-            caption = (
-                f"🎬 Отправлено пользователем: {username}\n"
-                f"🌐 Ссылка: {url}\n"
-                f"✍️ Комментарий: {comment}"
-            )
-        else:
-            caption = (
-                f"🎬 Отправлено пользователем: {username}\n"
-                f"🌐 Ссылка: {url}"
-            )
-        caption = caption[:1024]
-
-        # --- Индикация "загружаем видео" ---
-        chat_action_kwargs = {}
-        if target_thread_id is not None:
-            chat_action_kwargs["message_thread_id"] = target_thread_id
-
-        try:
-            await m.bot.send_chat_action(
-                target_chat_id,
-                ChatAction.UPLOAD_VIDEO,
-                **chat_action_kwargs,
-            )
-        except Exception as e:
-            log.exception(
-                "chat_action_fail user=%s chat=%s type=%s url=%s target_chat=%s target_thread=%s err=%s",
-                user_id,
-                chat_id,
-                chat_type,
-                url,
-                target_chat_id,
-                target_thread_id,
-                e,
-                extra={"notify": True},
-            )
-            return
-
-        log.info(
-            "route user=%s chat=%s type=%s url=%s -> target_chat=%s target_thread=%s note=%s",
-            user_id,
-            chat_id,
-            chat_type,
-            url,
-            target_chat_id,
-            target_thread_id,
-            route_note,
-        )
-
-        filepath: Optional[str] = None
-        try:
-            log.info(
-                "download_start user=%s chat=%s type=%s url=%s",
-                user_id,
-                chat_id,
-                chat_type,
-                url,
-            )
-            res = await self.downloader.download(url)
-            filepath = res["filepath"]
-
-            send_kwargs = {
-                "chat_id": target_chat_id,
-                "video": FSInputFile(filepath),
-                "caption": caption,
-                "disable_notification": True,
-            }
+        # Одна трасса на сообщение: от chat_action до удаления исходника (или постановки в очередь)
+        with trace("handle_url", chat=chat_id, user=user_id, message=m.message_id, route=route_note) as root:
+            # --- Индикация "загружаем видео" ---
+            chat_action_kwargs = {}
             if target_thread_id is not None:
-                send_kwargs["message_thread_id"] = target_thread_id
-
-            await m.bot.send_video(**send_kwargs)
+                chat_action_kwargs["message_thread_id"] = target_thread_id
+
+            try:
+                with span("chat_action"):
+                    await m.bot.send_chat_action(
+                        target_chat_id,
+                        ChatAction.UPLOAD_VIDEO,
+                        **chat_action_kwargs,
+                    )
+            except Exception as e:
+                log.exception(
+                    "chat_action_fail user=%s chat=%s type=%s url=%s target_chat=%s target_thread=%s err=%s",
+                    user_id,
+                    chat_id,
+                    chat_type,
+                    url,
+                    target_chat_id,
+                    target_thread_id,
+                    e,
+                    extra={"notify": True},
+                )
+                return
 
             log.info(
-                "download_ok user=%s chat=%s type=%s url=%s file=%s sent_to=%s thread=%s",
+                "route user=%s chat=%s type=%s url=%s -> target_chat=%s target_thread=%s note=%s",
                 user_id,
                 chat_id,
                 chat_type,
                 url,
-                filepath,
                 target_chat_id,
                 target_thread_id,
+                route_note,
             )
 
+            # Несколько ссылок — альбомом; больше MEDIA_GROUP_MAX — несколькими альбомами
+            jobs = []
+            for i in range(0, len(urls), MEDIA_GROUP_MAX):
+                chunk = urls[i : i + MEDIA_GROUP_MAX]
+                send_kwargs = {
+                    "chat_id": target_chat_id,
+                    "caption": build_caption(username, chunk[0], comment),
+                    "disable_notification": True,
+                }
+                if target_thread_id is not None:
+                    send_kwargs["message_thread_id"] = target_thread_id
+
+                job = {
+                    "url": chunk[0],
+                    "chat_id": chat_id,
+                    "chat_type": chat_type,
+                    "user_id": user_id,
+                    "message_id": m.message_id,
+                    # Ссылка в подписи к фото/видео: сам пост пользователя не удаляем
+                    "delete_source": m.text is not None,
+                    # Куда отвечать об ошибке — как m.answer(): в тот же тред форума
+                    "reply_thread_id": m.message_thread_id if m.is_topic_message else None,
+                    "send_kwargs": send_kwargs,
+                    # Воркер очереди продолжит ту же трассу
+                    "trace_id": root.trace_id,
+                    "origin": "bot",  # или "api" — POST /jobs
+                }
+                if len(chunk) > 1:
+                    # Подпись у каждого видео альбома своя — со своей ссылкой
+                    job["album"] = [{"url": u, "caption": build_caption(username, u, comment)} for u in chunk]
+                jobs.append(job)
+            JOBS_SUBMITTED.inc(len(jobs), origin="bot")
+
+            if self.job_queue is not None:
+                # Загрузку и отправку сделает воркер (python -m app.worker)
+                for job in jobs:
+                    job_url = " ".join(a["url"] for a in job.get("album", ())) or job["url"]
+                    try:
+                        with span("enqueue"):
+                            job_id = await self.job_queue.enqueue(job)
+                    except Exception as e:
+                        log.exception(
+                            "job_enqueue_fail user=%s chat=%s url=%s err=%s",
+                            user_id,
+                            chat_id,
+                            job_url,
+                            e,
+                            extra={"notify": True},
+                        )
+                        with contextlib.suppress(Exception):
+                            await m.answer("⚠️ Не удалось поставить видео в очередь. Попробуй позже.")
+                        return
+                    log.info("job_enqueued user=%s chat=%s url=%s job=%s", user_id, chat_id, job_url, job_id)
+                return
+
+            await asyncio.gather(*(self.deliver(m.bot, job) for job in jobs))
+
+    async def deliver(self, bot: Bot, job: dict, *, final: bool = True) -> dict:
+        """
+        Скачивает и отправляет видео по заданию из handle_url или POST /jobs (в боте, воркере или API).
+        final=False — ошибку не сообщаем пользователю, а пробрасываем: задание повторят.
+        Возвращает итог: {"ok", "message_id" | "error"/"reason", "source", "timings"};
+        у альбома ещё "message_ids" и "failed" — [{"url", "reason", "error"}].
+        """
+        impl = self._deliver_album if len(job.get("album") or ()) > 1 else self._deliver
+        if current_span() is not None:
+            with span("deliver"):
+                return await impl(bot, job, final=final)
+        # Воркер очереди: своя корневая трасса с тем же id, что у бота
+        with trace("deliver", trace_id=job.get("trace_id"), chat=job["chat_id"], message=job["message_id"]):
+            return await impl(bot, job, final=final)
+
+    async def _remember_file_id(self, cache_key: Optional[Tuple[str, str]], meta: dict, sent: Message) -> None:
+        if not self.file_ids or not sent.video:
+            return
+        # Кладём под ключом из ссылки и под каноническим ID от yt-dlp
+        keys = {cache_key} if cache_key else set()
+        if meta.get("platform") and meta.get("id"):
+            keys.add((meta["platform"], str(meta["id"])))
+        for key in keys:
+            await self.file_ids.set(key, sent.video.file_id)
+
+    async def _deliver(self, bot: Bot, job: dict, *, final: bool = True) -> dict:
+        url = job["url"]
+        user_id = job["user_id"]
+        chat_id = job["chat_id"]
+        chat_type = job["chat_type"]
+        send_kwargs = job["send_kwargs"]
+        target_chat_id = send_kwargs["chat_id"]
+        target_thread_id = send_kwargs.get("message_thread_id")
+
+        res: Optional[dict] = None
+        t_start = time.monotonic()
+        timings = {}
+        try:
+            # Каноническая ссылка: без трекинга, короткие TikTok — уже развёрнуты
+            with span("resolve"):
+                video_url = await self.resolver.resolve(url) if self.resolver else url
+            timings["resolve"] = time.monotonic() - t_start
+            cache_key = video_key(video_url)
+
+            # --- Повтор: видео уже загружали в Telegram, шлём по file_id ---
+            sent = None
+            with span("file_id_lookup"):
+                file_id = await self.file_ids.get(cache_key) if (self.file_ids and cache_key) else None
+            if file_id:
+                try:
+                    t0 = time.monotonic()
+                    with span("upload", source="file_id"):
+                        sent = await bot.send_video(video=file_id, **send_kwargs)
+                    timings["upload"] = time.monotonic() - t0
+                    source = "file_id"
+                    UPLOAD_SECONDS.observe(timings["upload"], platform=cache_key[0], source=source)
+                    log.info(
+                        "cache_hit user=%s chat=%s type=%s url=%s key=%s:%s sent_to=%s thread=%s",
+                        user_id,
+                        chat_id,
+                        chat_type,
+                        url,
+                        *cache_key,
+                        target_chat_id,
+                        target_thread_id,
+                    )
+                except TelegramBadRequest as e:
+                    # file_id протух или недоступен — забываем и качаем заново
+                    log.warning("cache_stale key=%s:%s err=%s", *cache_key, e)
+                    await self.file_ids.delete(cache_key)
+
+            meta: Optional[dict] = None
+            if sent is None and self.downloader.streaming:
+                # --- Поток: CDN → Telegram без файла на диске (если формат не требует склейки) ---
+                meta = await self.downloader.probe_stream(video_url, chat_id=chat_id, user_id=user_id)
+                if meta["streamable"]:
+                    stream = self.downloader.open_stream(meta)
+                    try:
+                        t0 = time.monotonic()
+                        with span("upload", source="stream"):
+                            sent = await bot.send_video(video=stream, **_video_kwargs(meta), **send_kwargs)
+                    except Exception as e:
+                        # Обрыв CDN или отказ Telegram — пробуем обычным путём через диск
+                        log.warning(
+                            "stream_fail user=%s chat=%s url=%s bytes=%s err=%s",
+                            user_id,
+                            chat_id,
+                            url,
+                            stream.bytes_read,
+                            e,
+                        )
+                    else:
+                        timings["upload"] = time.monotonic() - t0
+                        source = "stream"
+                        UPLOAD_SECONDS.observe(timings["upload"], platform=meta["platform"], source=source)
+                        UPLOAD_BYTES.inc(stream.bytes_read, source="stream")
+                        log.info(
+                            "stream_ok user=%s chat=%s type=%s url=%s bytes=%s sent_to=%s thread=%s",
+                            user_id,
+                            chat_id,
+                            chat_type,
+                            url,
+                            stream.bytes_read,
+                            target_chat_id,
+                            target_thread_id,
+                        )
+
+            if sent is None:
+                log.info(
+                    "download_start user=%s chat=%s type=%s url=%s resolved=%s",
+                    user_id,
+                    chat_id,
+                    chat_type,
+                    url,
+                    video_url,
+                )
+                t0 = time.monotonic()
+                # После probe_stream страница уже разобрана — второй экстракции не делаем
+                res = await self.downloader.download(
+                    video_url, chat_id=chat_id, user_id=user_id, info=meta and meta.get("info")
+                )
+                timings["download"] = time.monotonic() - t0
+                meta = res
+                filepath = res["filepath"]
+                if res.get("data") is not None:
+                    # Маленький файл остался в памяти — без чтения с диска
+                    video = BufferedInputFile(res["data"], filename=os.path.basename(filepath))
+                    source, size = "memory", res["staged_bytes"]
+                elif self.local_files and self.local_files.ref(filepath):
+                    # Сервер Bot API прочитает файл с общего тома сам
+                    video = self.local_files.ref(filepath)
+                    source, size = "local", res.get("filesize") or 0
+                else:
+                    video = FSInputFile(filepath)
+                    source, size = "file", res.get("filesize") or 0
+
+                t0 = time.monotonic()
+                with span("upload", source=source, bytes=size):
+                    sent = await bot.send_video(video=video, **_video_kwargs(res), **send_kwargs)
+                timings["upload"] = time.monotonic() - t0
+                UPLOAD_SECONDS.observe(timings["upload"], platform=res["platform"], source=source)
+                UPLOAD_BYTES.inc(size, source=source)
+
+                log.info(
+                    "download_ok user=%s chat=%s type=%s url=%s file=%s sent_to=%s thread=%s",
+                    user_id,
+                    chat_id,
+                    chat_type,
+                    url,
+                    filepath,
+                    target_chat_id,
+                    target_thread_id,
+                )
+
+            if meta is not None:
+                await self._remember_file_id(cache_key, meta, sent)
+
             # if not is_private:
-            with contextlib.suppress(Exception):
-                await m.delete()
+            VIDEO_REQUESTS.inc(result="ok")
+            if _deletes_source(job):
+                with contextlib.suppress(Exception), span("delete"):
+                    await bot.delete_message(chat_id, job["message_id"])
+            timings["total"] = time.monotonic() - t_start
+            return {"ok": True, "message_id": sent.message_id, "source": source, "timings": timings}
 
         except Exception as e:
+            if not final and _retryable(e):
+                log.warning("send_retry user=%s chat=%s url=%s err=%s", user_id, chat_id, url, e)
+                raise
             log.exception(
                 "send_fail user=%s chat=%s type=%s url=%s target_chat=%s thread=%s err=%s",
                 user_id,
@@ -242,24 +541,182 @@ class VideoRouter:
                 e,
                 extra={"notify": True},
             )
-            err = str(e).lower()
-
-            if "unavailable for certain audiences" in err or "may be inappropriate" in err:
-                msg = "⚠️ Видео недоступно из-за возрастных или региональных ограничений."
-            elif "timed out" in err and "instagram.com" in err:
-                msg = "⚠️ Не удалось подключиться к Instagram (таймаут соединения). Попробуй позже."
-            elif "404" in err:
-                msg = "⚠️ Видео не найдено или было удалено."
-            elif "unsupported url" in err or "no suitable format" in err:
-                msg = "⚠️ Формат ссылки не поддерживается."
-            else:
-                msg = "⚠️ Не удалось скачать или отправить видео. Возможно, сервис недоступен."
+            reason, msg = _error_reason(e)
+            VIDEO_ERRORS.inc(reason=reason)
+            VIDEO_REQUESTS.inc(result="error")
 
-            with contextlib.suppress(Exception):
-                await m.answer(msg)
+            # Задания из HTTP API (без исходного сообщения) узнают об ошибке из статуса
+            if job.get("message_id") is not None:
+                with contextlib.suppress(Exception):
+                    await bot.send_message(chat_id, msg, message_thread_id=job["reply_thread_id"])
+            timings["total"] = time.monotonic() - t_start
+            return {"ok": False, "error": msg, "reason": reason, "timings": timings}
 
         finally:
-            if filepath:
-                with contextlib.suppress(Exception):
-                    os.remove(filepath)
-                    log.debug("file_cleanup path=%s", filepath)
+            # Файл удаляется, когда его отпустит последний потребитель
+            if res is not None:
+                self.downloader.release(res)
+
+    async def _album_item(self, spec: dict, *, chat_id: int, user_id: Optional[int], use_cache: bool = True) -> dict:
+        """
+        Одно видео альбома ({"url", "caption"} из job["album"]): file_id из кэша или загрузка
+        через общий пул. Ошибка не пробрасывается, а кладётся в "error" — остальные видео не ждут.
+        """
+        url = spec["url"]
+        item = {"url": url, "caption": spec["caption"], "key": None, "res": None}
+        try:
+            video_url = await self.resolver.resolve(url) if self.resolver else url
+            item["key"] = video_key(video_url)
+            file_id = await self.file_ids.get(item["key"]) if (use_cache and self.file_ids and item["key"]) else None
+            if file_id:
+                # Метаданные Telegram уже знает по file_id
+                item.update(media=file_id, source="file_id", size=0, extra={})
+                return item
+
+            res = await self.downloader.download(video_url, chat_id=chat_id, user_id=user_id)
+            item["res"] = res
+            if res.get("data") is not None:
+                media = BufferedInputFile(res["data"], filename=os.path.basename(res["filepath"]))
+                item.update(media=media, source="memory", size=res["staged_bytes"])
+            elif self.local_files and self.local_files.ref(res["filepath"]):
+                item.update(media=self.local_files.ref(res["filepath"]), source="local", size=res.get("filesize") or 0)
+            else:
+                item.update(media=FSInputFile(res["filepath"]), source="file", size=res.get("filesize") or 0)
+            item["extra"] = _video_kwargs(res)
+        except Exception as e:
+            item["error"] = e
+        return item
+
+    @staticmethod
+    async def _send_album(bot: Bot, items: List[dict], send_kwargs: dict) -> List[Message]:
+        kwargs = {k: v for k, v in send_kwargs.items() if k != "caption"}
+        if len(items) == 1:
+            # Альбом из одного видео Telegram не примет
+            item = items[0]
+            return [await bot.send_video(video=item["media"], caption=item["caption"], **item["extra"], **kwargs)]
+        media = [InputMediaVideo(media=i["media"], caption=i["caption"], **i["extra"]) for i in items]
+        return await bot.send_media_group(media=media, **kwargs)
+
+    async def _deliver_album(self, bot: Bot, job: dict, *, final: bool = True) -> dict:
+        """
+        Несколько ссылок одного сообщения: видео качаются параллельно и уходят одним альбомом,
+        так что сообщение готово примерно за время самого долгого видео. Что не вышло —
+        одним ответом со списком ссылок.
+        """
+        user_id = job["user_id"]
+        chat_id = job["chat_id"]
+        send_kwargs = job["send_kwargs"]
+        t_start = time.monotonic()
+        timings = {}
+
+        with span("fetch", items=len(job["album"])):
+            items = list(await asyncio.gather(
+                *(self._album_item(spec, chat_id=chat_id, user_id=user_id) for spec in job["album"])
+            ))
+        timings["download"] = time.monotonic() - t_start
+
+        sent: List[Message] = []
+        try:
+            ready = [i for i in items if "error" not in i]
+            if ready:
+                t0 = time.monotonic()
+                try:
+                    with span("upload", source="album", items=len(ready)):
+                        sent = await self._send_album(bot, ready, send_kwargs)
+                except TelegramBadRequest as e:
+                    stale = [n for n, i in enumerate(items) if i.get("source") == "file_id"]
+                    if not stale:
+                        raise
+                    # Какой-то file_id протух — Telegram не скажет какой; эти видео качаем заново
+                    log.warning("cache_stale album chat=%s items=%s err=%s", chat_id, len(stale), e)
+                    for n in stale:
+                        await self.file_ids.delete(items[n]["key"])
+                    fresh = await asyncio.gather(*(
+                        self._album_item(job["album"][n], chat_id=chat_id, user_id=user_id, use_cache=False)
+                        for n in stale
+                    ))
+                    for n, item in zip(stale, fresh):
+                        items[n] = item
+                    ready = [i for i in items if "error" not in i]
+                    with span("upload", source="album", items=len(ready)):
+                        sent = await self._send_album(bot, ready, send_kwargs) if ready else []
+                timings["upload"] = time.monotonic() - t0
+        except Exception as e:
+            # Альбом не ушёл целиком — ошибка у всех, кто был готов
+            for i in items:
+                i.setdefault("error", e)
+            ready = []
+
+        try:
+            failed = [i for i in items if "error" in i]
+            if not sent and not final and any(_retryable(i["error"]) for i in failed):
+                log.warning("send_retry user=%s chat=%s url=%s err=%s", user_id, chat_id, job["url"], failed[0]["error"])
+                raise failed[0]["error"]
+
+            if sent:
+                platform = next((i["key"][0] for i in ready if i["key"]), None)
+                UPLOAD_SECONDS.observe(timings["upload"], platform=platform, source="album")
+                UPLOAD_BYTES.inc(sum(i["size"] for i in ready), source="album")
+                for item, message in zip(ready, sent):
+                    if item["source"] != "file_id":
+                        await self._remember_file_id(item["key"], item["res"], message)
+                VIDEO_REQUESTS.inc(len(sent), result="ok")
+                log.info(
+                    "album_ok user=%s chat=%s items=%s failed=%s sent_to=%s thread=%s",
+                    user_id,
+                    chat_id,
+                    len(sent),
+                    len(failed),
+                    send_kwargs["chat_id"],
+                    send_kwargs.get("message_thread_id"),
+                )
+
+            report = []
+            for i in failed:
+                reason, msg = _error_reason(i["error"])
+                i["reason"], i["message"] = reason, msg
+                VIDEO_ERRORS.inc(reason=reason)
+                VIDEO_REQUESTS.inc(result="error")
+                log.error(
+                    "send_fail user=%s chat=%s url=%s reason=%s err=%s",
+                    user_id,
+                    chat_id,
+                    i["url"],
+                    reason,
+                    i["error"],
+                    exc_info=i["error"],
+                    extra={"notify": True},
+                )
+                report.append(f"• {i['url']} — {msg.removeprefix('⚠️ ')}")
+
+            if job.get("message_id") is not None:
+                if failed:
+                    text = f"⚠️ Не удалось отправить {len(failed)} из {len(items)} видео:\n" + "\n".join(report)
+                    with contextlib.suppress(Exception):
+                        await bot.send_message(
+                            chat_id,
+                            text[:4096],
+                            message_thread_id=job["reply_thread_id"],
+                            disable_web_page_preview=True,
+                        )
+                if sent and _deletes_source(job):
+                    # Ссылки, что не удались, остались в ответе выше
+                    with contextlib.suppress(Exception), span("delete"):
+                        await bot.delete_message(chat_id, job["message_id"])
+
+            timings["total"] = time.monotonic() - t_start
+            result = {
+                "ok": bool(sent),
+                "message_id": sent[0].message_id if sent else None,
+                "message_ids": [s.message_id for s in sent],
+                "source": "album",
+                "failed": [{"url": i["url"], "reason": i["reason"], "error": i["message"]} for i in failed],
+                "timings": timings,
+            }
+            if not sent:
+                result.update(error=failed[0]["message"], reason=failed[0]["reason"])
+            return result
+        finally:
+            for i in items:
+                if i.get("res") is not None:
+                    self.downloader.release(i["res"])
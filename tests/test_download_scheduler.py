@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.download_scheduler import DownloadQueueFull, DownloadScheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _occupy(scheduler: DownloadScheduler, release: threading.Event) -> asyncio.Future:
+    """Занимает единственный воркер, пока не выставят release."""
+    task = asyncio.ensure_future(scheduler.submit(release.wait, chat_id="busy"))
+    while scheduler.stats()["running"] < 1:
+        await asyncio.sleep(0.01)
+    return task
+
+
+def test_round_robin_between_chats_and_users():
+    async def main():
+        scheduler = DownloadScheduler(workers=1)
+        release = threading.Event()
+        busy = await _occupy(scheduler, release)
+
+        order = []
+        jobs = [
+            (1, "a", "a1"), (1, "a", "a2"), (1, "a", "a3"),
+            (1, "b", "b1"),
+            (2, "c", "c1"),
+        ]
+        tasks = [
+            asyncio.ensure_future(scheduler.submit(order.append, name, chat_id=chat, user_id=user))
+            for chat, user, name in jobs
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 5
+
+        release.set()
+        await asyncio.gather(busy, *tasks)
+        # Чат за чатом, внутри чата — пользователь за пользователем
+        assert order == ["a1", "c1", "b1", "a2", "a3"]
+        await scheduler.close()
+
+    run(main())
+
+
+def test_queue_full():
+    async def main():
+        scheduler = DownloadScheduler(workers=1, max_queue=2)
+        release = threading.Event()
+        busy = await _occupy(scheduler, release)
+
+        queued = [asyncio.ensure_future(scheduler.submit(lambda: "ok", chat_id=1)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(DownloadQueueFull):
+            await scheduler.submit(lambda: "late", chat_id=2)
+
+        release.set()
+        assert await asyncio.gather(*queued) == ["ok", "ok"]
+        await busy
+        # Очередь освободилась — снова принимаем
+        assert await scheduler.submit(lambda: "again", chat_id=2) == "again"
+        await scheduler.close()
+
+    run(main())
+
+
+def test_cancelled_job_skipped():
+    async def main():
+        scheduler = DownloadScheduler(workers=1)
+        release = threading.Event()
+        busy = await _occupy(scheduler, release)
+
+        ran = []
+        cancelled = asyncio.ensure_future(scheduler.submit(ran.append, "cancelled", chat_id=1))
+        kept = asyncio.ensure_future(scheduler.submit(ran.append, "kept", chat_id=1))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        release.set()
+        await asyncio.gather(busy, kept)
+        assert ran == ["kept"]
+        assert scheduler.stats()["queued"] == 0
+        await scheduler.close()
+
+    run(main())
+
+
+def test_error_propagates():
+    async def main():
+        scheduler = DownloadScheduler(workers=2)
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            await scheduler.submit(fail)
+        assert await scheduler.submit(lambda: 42) == 42
+        await scheduler.close()
+
+    run(main())
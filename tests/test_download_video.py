@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from app.services.download_video import DownloadVideo
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class _FakeDownload:
+    """Подмена DownloadVideo._download: ждёт gate, пишет файл и считает вызовы."""
+
+    def __init__(self, tmp_path, fail: bool = False):
+        self.tmp_path = tmp_path
+        self.fail = fail
+        self.calls = 0
+        self.gate = asyncio.Event()
+
+    async def __call__(self, url, on_progress=None, *, chat_id=None, user_id=None, info=None):
+        self.calls += 1
+        await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("boom")
+        path = self.tmp_path / f"{url.rsplit('/', 1)[-1]}.mp4"
+        path.write_bytes(b"video")
+        return {"filepath": str(path), "platform": "tiktok"}
+
+
+def _downloader(tmp_path, fake: _FakeDownload) -> DownloadVideo:
+    d = DownloadVideo(download_dir=str(tmp_path / "downloads"))
+    d._download = fake
+    return d
+
+
+URL = "https://www.tiktok.com/@u/video/1"
+
+
+def test_concurrent_calls_share_one_download(tmp_path):
+    async def main():
+        fake = _FakeDownload(tmp_path)
+        d = _downloader(tmp_path, fake)
+        # Та же ссылка с трекингом и без — один ключ
+        calls = [asyncio.ensure_future(d.download(u)) for u in (URL, URL + "?is_from_webapp=1", URL)]
+        await asyncio.sleep(0)
+        fake.gate.set()
+        results = await asyncio.gather(*calls)
+
+        assert fake.calls == 1
+        assert {r["filepath"] for r in results} == {str(tmp_path / "1.mp4")}
+        assert {r["key"] for r in results} == {"tiktok:1"}
+        assert d._inflight["tiktok:1"].refs == 3
+        await d.close()
+
+    run(main())
+
+
+def test_file_removed_after_last_release(tmp_path):
+    async def main():
+        fake = _FakeDownload(tmp_path)
+        d = _downloader(tmp_path, fake)
+        fake.gate.set()
+        first, second = await asyncio.gather(d.download(URL), d.download(URL))
+        path = tmp_path / "1.mp4"
+
+        d.release(first)
+        assert path.exists()
+        # Пока файл держат, новый вызов получает его же без загрузки
+        third = await d.download(URL)
+        assert fake.calls == 1
+        d.release(second)
+        d.release(third)
+        assert not path.exists()
+        assert d._inflight == {}
+
+        # После освобождения — новая загрузка
+        d.release(await d.download(URL))
+        assert fake.calls == 2
+        await d.close()
+
+    run(main())
+
+
+def test_failed_download_not_shared_later(tmp_path):
+    async def main():
+        fake = _FakeDownload(tmp_path, fail=True)
+        d = _downloader(tmp_path, fake)
+        calls = [asyncio.ensure_future(d.download(URL)) for _ in range(2)]
+        await asyncio.sleep(0)
+        fake.gate.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert fake.calls == 1
+        assert d._inflight == {}
+
+        fake.fail = False
+        d.release(await d.download(URL))
+        assert fake.calls == 2
+        await d.close()
+
+    run(main())
+
+
+def test_cancelled_waiter_does_not_cancel_download(tmp_path):
+    async def main():
+        fake = _FakeDownload(tmp_path)
+        d = _downloader(tmp_path, fake)
+        impatient = asyncio.ensure_future(d.download(URL))
+        patient = asyncio.ensure_future(d.download(URL))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        assert d._inflight["tiktok:1"].refs == 1
+
+        fake.gate.set()
+        res = await patient
+        assert (tmp_path / "1.mp4").exists()
+        d.release(res)
+        assert not (tmp_path / "1.mp4").exists()
+        await d.close()
+
+    run(main())
+
+
+def test_all_waiters_cancelled_file_cleaned(tmp_path):
+    async def main():
+        fake = _FakeDownload(tmp_path)
+        d = _downloader(tmp_path, fake)
+        call = asyncio.ensure_future(d.download(URL))
+        await asyncio.sleep(0)
+        call.cancel()
+        fake.gate.set()
+        # Загрузка доходит до конца, но файл никому не нужен — удаляется сразу
+        await asyncio.sleep(0.01)
+        assert d._inflight == {}
+        assert not (tmp_path / "1.mp4").exists()
+        await d.close()
+
+    run(main())
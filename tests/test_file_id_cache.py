@@ -0,0 +1,75 @@
+import asyncio
+
+from app.services.file_id_cache import FileIdCache, SQLiteFileIdStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class _BrokenStore:
+    async def get(self, key):
+        raise ConnectionError("down")
+
+    async def set(self, key, file_id):
+        raise ConnectionError("down")
+
+    async def delete(self, key):
+        raise ConnectionError("down")
+
+
+def test_lru_eviction():
+    async def main():
+        cache = FileIdCache(max_size=2)
+        await cache.set(("tiktok", "1"), "f1")
+        await cache.set(("tiktok", "2"), "f2")
+        # Обращение освежает запись — вытеснится «2», а не «1»
+        assert await cache.get(("tiktok", "1")) == "f1"
+        await cache.set(("tiktok", "3"), "f3")
+        assert await cache.get(("tiktok", "2")) is None
+        assert await cache.get(("tiktok", "1")) == "f1"
+        assert await cache.get(("tiktok", "3")) == "f3"
+
+    run(main())
+
+
+def test_delete():
+    async def main():
+        cache = FileIdCache()
+        await cache.set(("instagram", "Cabc"), "f1")
+        await cache.delete(("instagram", "Cabc"))
+        assert await cache.get(("instagram", "Cabc")) is None
+
+    run(main())
+
+
+def test_sqlite_survives_restart(tmp_path):
+    async def main():
+        path = str(tmp_path / "cache" / "file_ids.sqlite3")
+        await FileIdCache(store=SQLiteFileIdStore(path)).set(("tiktok", "1"), "f1")
+
+        # Новый процесс: LRU пуст, file_id — из SQLite и дальше из памяти
+        cache = FileIdCache(store=SQLiteFileIdStore(path))
+        assert await cache.get(("tiktok", "1")) == "f1"
+        assert cache._lru == {"tiktok:1": "f1"}
+
+        await cache.delete(("tiktok", "1"))
+        assert await FileIdCache(store=SQLiteFileIdStore(path)).get(("tiktok", "1")) is None
+
+    run(main())
+
+
+def test_store_errors_do_not_break_cache():
+    async def main():
+        cache = FileIdCache(store=_BrokenStore())
+        await cache.set(("tiktok", "1"), "f1")
+        assert await cache.get(("tiktok", "1")) == "f1"
+        assert await cache.get(("tiktok", "2")) is None
+        await cache.delete(("tiktok", "1"))
+
+    run(main())
+
+
+def test_from_config_memory():
+    cache = FileIdCache.from_config({"FILE_ID_CACHE_BACKEND": "memory", "FILE_ID_CACHE_SIZE": 5})
+    assert cache.store is None and cache.max_size == 5
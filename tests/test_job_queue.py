@@ -0,0 +1,177 @@
+import asyncio
+import time
+
+import fakeredis.aioredis
+import pytest
+
+from app.services.job_queue import RedisJobQueue
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _queue(**kwargs) -> RedisJobQueue:
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return RedisJobQueue(client=client, **kwargs)
+
+
+def test_reserve_ack():
+    async def main():
+        q = await _queue()
+        job_id = await q.enqueue({"url": "https://www.tiktok.com/@u/video/1"})
+        assert (await q.get(job_id))["status"] == "queued"
+
+        got_id, payload, attempts = await q.reserve(timeout=1)
+        assert (got_id, payload["url"], attempts) == (job_id, "https://www.tiktok.com/@u/video/1", 1)
+        assert (await q.get(job_id))["status"] == "running"
+        assert await q.stats() == {"ready": 0, "processing": 1, "delayed": 0, "dead": 0}
+
+        await q.ack(job_id, {"ok": True, "message_id": 7})
+        record = await q.get(job_id)
+        assert record["status"] == "done"
+        assert record["result"]["message_id"] == 7
+        assert await q.stats() == {"ready": 0, "processing": 0, "delayed": 0, "dead": 0}
+        assert await q._redis.zscore(q._leases, job_id) is None
+        await q.close()
+
+    run(main())
+
+
+def test_ack_failed_result():
+    async def main():
+        q = await _queue()
+        job_id = await q.enqueue({"url": "u"})
+        await q.reserve(timeout=1)
+        await q.ack(job_id, {"ok": False, "error": "nope"})
+        assert (await q.get(job_id))["status"] == "failed"
+        await q.close()
+
+    run(main())
+
+
+def test_reserve_empty_returns_none():
+    async def main():
+        q = await _queue()
+        assert await q.reserve(timeout=1) is None
+        await q.close()
+
+    run(main())
+
+
+def test_nack_delays_retry_then_dead():
+    async def main():
+        q = await _queue(max_attempts=2, retry_base=0.2, retry_max=0.2)
+        job_id = await q.enqueue({"url": "u"})
+
+        _, _, attempts = await q.reserve(timeout=1)
+        await q.nack(job_id, attempts)
+        assert (await q.get(job_id))["status"] == "queued"
+        assert await q.stats() == {"ready": 0, "processing": 0, "delayed": 1, "dead": 0}
+        # Пауза не прошла — повтор не берётся
+        assert await q.reserve(timeout=1) is None
+
+        await asyncio.sleep(0.2)
+        _, _, attempts = await q.reserve(timeout=1)
+        assert attempts == 2
+        await q.nack(job_id, attempts)
+        assert (await q.get(job_id))["status"] == "failed"
+        assert await q.stats() == {"ready": 0, "processing": 0, "delayed": 0, "dead": 1}
+        assert await q._redis.lrange(q._dead, 0, -1) == [job_id]
+        await q.close()
+
+    run(main())
+
+
+def test_nack_delay_not_shorter_than_requested():
+    async def main():
+        q = await _queue(retry_base=0.01, retry_max=0.01)
+        job_id = await q.enqueue({"url": "u"})
+        _, _, attempts = await q.reserve(timeout=1)
+        # Автомат платформы разомкнут ещё на минуту
+        await q.nack(job_id, attempts, delay=60)
+        retry_at = await q._redis.zscore(q._delayed, job_id)
+        assert retry_at - time.time() > 59
+        assert await q.promote_delayed() == 0
+        await q.close()
+
+    run(main())
+
+
+def test_backoff_grows_with_attempts():
+    async def main():
+        q = await _queue(max_attempts=10, retry_base=10, retry_max=40)
+        waits = []
+        for attempts in (1, 2, 3, 4):
+            job_id = await q.enqueue({"url": "u"})
+            await q.nack(job_id, attempts)
+            waits.append(await q._redis.zscore(q._delayed, job_id) - time.time())
+        # backoff: половина паузы фиксирована, половина — случайна
+        assert 5 - 1 < waits[0] <= 10
+        assert 10 - 1 < waits[1] <= 20
+        assert 20 - 1 < waits[2] <= 40
+        assert 20 - 1 < waits[3] <= 40
+        await q.close()
+
+    run(main())
+
+
+def test_expired_lease_requeued():
+    async def main():
+        q = await _queue(max_attempts=3)
+        job_id = await q.enqueue({"url": "u"})
+        await q.reserve(timeout=1)
+
+        # Живая аренда — задание остаётся у воркера
+        assert await q.requeue_expired() == 0
+        # Воркер упал и не продлил аренду
+        await q._redis.zadd(q._leases, {job_id: 0})
+        assert await q.requeue_expired() == 1
+        assert (await q.get(job_id))["status"] == "queued"
+
+        got_id, _, attempts = await q.reserve(timeout=1)
+        assert (got_id, attempts) == (job_id, 2)
+        await q.close()
+
+    run(main())
+
+
+def test_expired_lease_dead_after_max_attempts():
+    async def main():
+        q = await _queue(max_attempts=1)
+        job_id = await q.enqueue({"url": "u"})
+        await q.reserve(timeout=1)
+        await q._redis.zadd(q._leases, {job_id: 0})
+
+        assert await q.requeue_expired() == 1
+        assert (await q.get(job_id))["status"] == "failed"
+        assert await q.stats() == {"ready": 0, "processing": 0, "delayed": 0, "dead": 1}
+        await q.close()
+
+    run(main())
+
+
+def test_missing_lease_gets_full_term():
+    async def main():
+        q = await _queue(visibility_timeout=600)
+        job_id = await q.enqueue({"url": "u"})
+        await q.reserve(timeout=1)
+        # Воркер упал между BRPOPLPUSH и ZADD
+        await q._redis.zrem(q._leases, job_id)
+
+        assert await q.requeue_expired() == 0
+        assert await q._redis.zscore(q._leases, job_id) is not None
+        assert await q.stats() == {"ready": 0, "processing": 1, "delayed": 0, "dead": 0}
+        await q.close()
+
+    run(main())
+
+
+@pytest.mark.parametrize("backend", [None, "local"])
+def test_from_config_local(backend):
+    assert RedisJobQueue.from_config({"JOB_QUEUE_BACKEND": backend}) is None
+
+
+def test_from_config_requires_url():
+    with pytest.raises(ValueError):
+        RedisJobQueue.from_config({"JOB_QUEUE_BACKEND": "redis"})
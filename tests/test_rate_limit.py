@@ -0,0 +1,205 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage, SendVideo
+
+from app.services.stream_upload import StreamInputFile
+from app.utils.rate_limit import LocalBuckets, Priority, RateLimitMiddleware, TelegramRateLimiter, send_priority
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_burst_then_interval():
+    async def main():
+        b = LocalBuckets()
+        # burst=3: три отправки сразу, дальше — по одной на интервал
+        waits = [await b.reserve("chat:1", interval=1.0, burst=3) for _ in range(5)]
+        assert waits[:3] == [0.0, 0.0, 0.0]
+        assert waits[3] == pytest.approx(1.0, abs=0.05)
+        assert waits[4] == pytest.approx(2.0, abs=0.05)
+
+    run(main())
+
+
+def test_keys_independent():
+    async def main():
+        b = LocalBuckets()
+        assert await b.reserve("chat:1", interval=1.0, burst=1) == 0.0
+        assert await b.reserve("chat:1", interval=1.0, burst=1) == pytest.approx(1.0, abs=0.05)
+        assert await b.reserve("chat:2", interval=1.0, burst=1) == 0.0
+
+    run(main())
+
+
+def test_cost():
+    async def main():
+        b = LocalBuckets()
+        # Альбом из 4 видео занимает 4 токена
+        assert await b.reserve("chat:1", interval=0.5, burst=5, cost=4) == 0.0
+        assert await b.reserve("chat:1", interval=0.5, burst=5) == 0.0
+        assert await b.reserve("chat:1", interval=0.5, burst=5) == pytest.approx(0.5, abs=0.05)
+
+    run(main())
+
+
+def test_block_after_retry_after():
+    async def main():
+        b = LocalBuckets()
+        await b.block("chat:1", seconds=10, interval=1.0, burst=3)
+        assert await b.reserve("chat:1", interval=1.0, burst=3) == pytest.approx(10.0, abs=0.05)
+
+    run(main())
+
+
+def test_block_does_not_shorten_debt():
+    async def main():
+        b = LocalBuckets()
+        for _ in range(20):
+            await b.reserve("chat:1", interval=1.0, burst=1)
+        await b.block("chat:1", seconds=1, interval=1.0, burst=1)
+        assert await b.reserve("chat:1", interval=1.0, burst=1) == pytest.approx(20.0, abs=0.05)
+
+    run(main())
+
+
+def test_max_keys_evicts_oldest():
+    async def main():
+        b = LocalBuckets(max_keys=2)
+        for key in ("a", "b", "c"):
+            await b.reserve(key, interval=10.0, burst=1)
+        assert list(b._tat) == ["b", "c"]
+        # «a» забыт — снова без ожидания
+        assert await b.reserve("a", interval=10.0, burst=1) == 0.0
+        assert await b.reserve("c", interval=10.0, burst=1) == pytest.approx(10.0, abs=0.05)
+
+    run(main())
+
+
+class _FixedWait:
+    """Общий лимит, где каждый слот ждёт wait секунд: очередь к гейту собирается гарантированно."""
+
+    def __init__(self, wait: float):
+        self.wait = wait
+
+    async def reserve(self, key, interval, burst, cost=1):
+        return self.wait if key == "global" else 0.0
+
+    async def block(self, key, seconds, interval, burst):
+        pass
+
+    async def close(self):
+        pass
+
+
+def test_priority_gate_order():
+    async def main():
+        limiter = TelegramRateLimiter(store=_FixedWait(0.02))
+        order = []
+
+        async def send(name, priority):
+            with send_priority(priority):
+                await limiter.acquire(None, per_chat=False)
+            order.append(name)
+
+        # Первый берёт слот без очереди, остальные ждут и выходят по приоритету, а не по приходу
+        await asyncio.gather(
+            send("first", Priority.LOG),
+            send("log", Priority.LOG),
+            send("bulk", Priority.BULK),
+            send("user", Priority.USER),
+            send("user2", Priority.USER),
+        )
+        assert order == ["first", "user", "user2", "bulk", "log"]
+
+    run(main())
+
+
+def test_chat_limits():
+    limiter = TelegramRateLimiter(global_rate=30, group_per_minute=20, private_rate=1)
+    assert limiter._chat_limits(42) == (1.0, 1.0)
+    assert limiter._chat_limits(-100123) == (3.0, 20)
+    assert limiter._chat_limits("@channel") == (3.0, 20)
+
+
+class _Api:
+    """make_request: первые failures вызовов — 429 с retry_after, дальше — ответ."""
+
+    def __init__(self, failures: int, retry_after: int = 0):
+        self.failures = failures
+        self.retry_after = retry_after
+        self.calls = 0
+
+    async def __call__(self, bot, method):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_after)
+        return "ok"
+
+
+def _middleware(**kwargs) -> RateLimitMiddleware:
+    return RateLimitMiddleware(TelegramRateLimiter(global_rate=1000, private_rate=1000), **kwargs)
+
+
+def test_middleware_retries_after_429():
+    async def main():
+        api = _Api(failures=2)
+        assert await _middleware()(api, None, SendMessage(chat_id=1, text="hi")) == "ok"
+        assert api.calls == 3
+
+    run(main())
+
+
+def test_middleware_gives_up_after_max_retries():
+    async def main():
+        api = _Api(failures=10)
+        with pytest.raises(TelegramRetryAfter):
+            await _middleware(max_retries=2)(api, None, SendMessage(chat_id=1, text="hi"))
+        assert api.calls == 3
+
+    run(main())
+
+
+def test_middleware_long_retry_after_not_waited():
+    async def main():
+        api = _Api(failures=1, retry_after=3600)
+        with pytest.raises(TelegramRetryAfter):
+            await _middleware(max_retry_after=60)(api, None, SendMessage(chat_id=1, text="hi"))
+        assert api.calls == 1
+
+    run(main())
+
+
+def test_middleware_blocks_chat_after_429():
+    async def main():
+        mw = _middleware(max_retry_after=60)
+        with pytest.raises(TelegramRetryAfter):
+            await mw(_Api(failures=1, retry_after=3600), None, SendMessage(chat_id=1, text="hi"))
+        # Остальные отправки в этот чат ждут retry_after, в другие — нет
+        assert await mw.limiter.store.reserve("chat:1", 0.001, 1000) > 3000
+        assert await mw.limiter.store.reserve("chat:2", 0.001, 1000) == 0.0
+
+    run(main())
+
+
+def test_middleware_one_shot_not_replayed():
+    async def main():
+        api = _Api(failures=1)
+        video = StreamInputFile("https://cdn.example/v.mp4", session=None, filename="v.mp4")
+        with pytest.raises(TelegramRetryAfter):
+            await _middleware()(api, None, SendVideo(chat_id=1, video=video))
+        assert api.calls == 1
+
+    run(main())
+
+
+def test_middleware_skips_methods_without_chat():
+    async def main():
+        api = _Api(failures=0)
+        mw = _middleware()
+        assert await mw(api, None, GetMe()) == "ok"
+        assert mw.limiter.store._tat == {}
+
+    run(main())
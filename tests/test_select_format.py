@@ -0,0 +1,77 @@
+import pytest
+
+from app.services.download_video import VideoTooLarge, _select_format
+
+MB = 1024 * 1024
+
+
+def _fmt(format_id: str, height=None, size=None, vcodec="avc1.64001F", acodec="mp4a.40.2", ext="mp4", **extra) -> dict:
+    return {
+        "format_id": format_id, "height": height, "filesize": size,
+        "vcodec": vcodec, "acodec": acodec, "ext": ext, "protocol": "https", **extra,
+    }
+
+
+def test_best_fitting_muxed():
+    info = {"formats": [_fmt("360", 360, 5 * MB), _fmt("720", 720, 20 * MB), _fmt("1080", 1080, 80 * MB)]}
+    assert _select_format(info, 50 * MB, can_merge=False) == {"format": "720", "size": 20 * MB, "merge": False, "height": 720}
+
+
+def test_too_large():
+    info = {"formats": [_fmt("720", 720, 60 * MB), _fmt("1080", 1080, 90 * MB)]}
+    with pytest.raises(VideoTooLarge):
+        _select_format(info, 50 * MB, can_merge=False)
+
+
+def test_known_size_preferred_over_unknown():
+    info = {"formats": [_fmt("1080", 1080), _fmt("720", 720, 20 * MB)]}
+    assert _select_format(info, 50 * MB, can_merge=False)["format"] == "720"
+
+
+def test_unknown_size_allowed():
+    info = {"formats": [_fmt("1080", 1080)]}
+    assert _select_format(info, 50 * MB, can_merge=False) == {"format": "1080", "size": None, "merge": False, "height": 1080}
+
+
+def test_size_from_bitrate():
+    # 8000 кбит/с × 60 с ≈ 57 МБ — не влезает; 2000 кбит/с ≈ 14 МБ
+    info = {"duration": 60, "formats": [_fmt("hi", 1080, tbr=8000), _fmt("lo", 540, tbr=2000)]}
+    choice = _select_format(info, 50 * MB, can_merge=False)
+    assert choice["format"] == "lo"
+    assert choice["size"] == 2000 * 1000 / 8 * 60
+
+
+def test_h264_and_muxed_preferred_at_same_height():
+    info = {
+        "formats": [
+            _fmt("hevc", 720, 10 * MB, vcodec="hvc1"),
+            _fmt("h264", 720, 12 * MB),
+            _fmt("v720", 720, 8 * MB, acodec="none"),
+            _fmt("a", None, 1 * MB, vcodec="none"),
+        ]
+    }
+    assert _select_format(info, 50 * MB, can_merge=True)["format"] == "h264"
+
+
+def test_merge_when_higher():
+    info = {
+        "formats": [
+            _fmt("360", 360, 5 * MB),
+            _fmt("v1080", 1080, 30 * MB, acodec="none"),
+            _fmt("a_hi", None, 25 * MB, vcodec="none", abr=320),
+            _fmt("a_lo", None, 2 * MB, vcodec="none", abr=64),
+        ]
+    }
+    # Лучший звук не влезает в пару — берётся тот, что влезает
+    assert _select_format(info, 50 * MB, can_merge=True) == {
+        "format": "v1080+a_lo", "size": 32 * MB, "merge": True, "height": 1080,
+    }
+    # Без ffmpeg склейки нет
+    assert _select_format(info, 50 * MB, can_merge=False)["format"] == "360"
+
+
+def test_no_candidates():
+    assert _select_format({"formats": []}, 50 * MB, can_merge=True) is None
+    # mhtml (раскадровки) не рассматриваются
+    info = {"formats": [_fmt("sb0", 90, 1 * MB, protocol="mhtml")]}
+    assert _select_format(info, 50 * MB, can_merge=True) is None
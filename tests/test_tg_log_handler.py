@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import List
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app.utils.tg_log_handler import TG_MAX, TelegramLogHandler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class _Bot:
+    def __init__(self, retry_after: int = 0):
+        self.retry_after = retry_after
+        self.sent: List[dict] = []
+
+    async def send_message(self, **kwargs):
+        if self.retry_after:
+            retry_after, self.retry_after = self.retry_after, 0
+            raise TelegramRetryAfter(method=SendMessage(chat_id=1, text=""), message="flood", retry_after=retry_after)
+        self.sent.append(kwargs)
+
+
+def _logger(handler: TelegramLogHandler) -> logging.Logger:
+    log = logging.getLogger(f"test.tg.{id(handler)}")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+    return log
+
+
+def _handler(bot: _Bot, **kwargs) -> TelegramLogHandler:
+    kwargs.setdefault("batch_window", 0.02)
+    kwargs.setdefault("min_interval", 0.01)
+    return TelegramLogHandler(bot=bot, chat_id=1, thread_id=7, loop=asyncio.get_running_loop(), **kwargs)
+
+
+async def _drain(handler: TelegramLogHandler, bot: _Bot, messages: int = 1) -> None:
+    for _ in range(200):
+        if len(bot.sent) >= messages and handler._queue.empty():
+            break
+        await asyncio.sleep(0.01)
+    handler._sender.cancel()
+
+
+def test_records_batched_and_repeats_collapsed():
+    async def main():
+        bot = _Bot()
+        handler = _handler(bot)
+        log = _logger(handler)
+        for _ in range(3):
+            log.info("circuit_open platform=%s", "tiktok")
+        log.info("job_retry id=%s", 1)
+        await _drain(handler, bot)
+
+        assert len(bot.sent) == 1
+        assert bot.sent[0]["text"] == "circuit_open platform=tiktok\n×3\n\njob_retry id=1"
+        assert bot.sent[0]["message_thread_id"] == 7
+        assert bot.sent[0]["disable_notification"] is True
+
+    run(main())
+
+
+def test_dropped_records_reported():
+    async def main():
+        bot = _Bot()
+        handler = _handler(bot, max_queue=2)
+        log = _logger(handler)
+        for i in range(5):
+            log.error("send_fail n=%s", i)
+        # Записи доходят до очереди через call_soon_threadsafe
+        await asyncio.sleep(0)
+        assert handler._dropped == 3
+        await _drain(handler, bot)
+
+        text = bot.sent[0]["text"]
+        assert text.startswith("⚠️ Пропущено записей лога: 3")
+        assert "send_fail n=0" in text and "send_fail n=1" in text
+        assert handler._dropped == 0
+
+    run(main())
+
+
+def test_long_batch_split():
+    async def main():
+        bot = _Bot()
+        handler = _handler(bot)
+        log = _logger(handler)
+        for i in range(3):
+            log.info("%s %s", i, "x" * 3000)
+        await _drain(handler, bot, messages=3)
+
+        assert len(bot.sent) == 3
+        assert all(len(m["text"]) <= TG_MAX for m in bot.sent)
+
+    run(main())
+
+
+def test_traceback_included_and_shortened():
+    async def main():
+        bot = _Bot()
+        handler = _handler(bot)
+        log = _logger(handler)
+        try:
+            raise ValueError("boom " * 2000)
+        except ValueError:
+            log.exception("send_fail url=%s", "https://www.tiktok.com/@u/video/1")
+        await _drain(handler, bot)
+
+        text = bot.sent[0]["text"]
+        assert text.startswith("send_fail url=https://www.tiktok.com/@u/video/1\n")
+        assert "ValueError" in text
+        assert len(text) <= TG_MAX
+
+    run(main())
+
+
+def test_retry_after_respected():
+    async def main():
+        bot = _Bot(retry_after=1)
+        handler = _handler(bot)
+        log = _logger(handler)
+        log.error("send_fail")
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        await _drain(handler, bot)
+
+        assert [m["text"] for m in bot.sent] == ["send_fail"]
+        assert loop.time() - t0 >= 1
+
+    run(main())
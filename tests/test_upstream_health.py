@@ -0,0 +1,172 @@
+import pickle
+import time
+
+import pytest
+from yt_dlp.utils import DownloadError, ExtractorError, GeoRestrictedError, UnsupportedError
+
+from app.services.upstream_health import (
+    CircuitBreaker,
+    DownloadFailed,
+    PlatformUnavailable,
+    UpstreamHealth,
+    backoff,
+    classify,
+)
+
+
+def _named(name: str, *bases: type) -> type:
+    # classify смотрит на имена классов: urllib3/aiohttp для проверки не нужны
+    return type(name, bases or (Exception,), {})
+
+
+ConnectTimeoutError = _named("ConnectTimeoutError", TimeoutError)
+NewConnectionError = _named("NewConnectionError", ConnectTimeoutError)
+NameResolutionError = _named("NameResolutionError", NewConnectionError)
+ReadTimeoutError = _named("ReadTimeoutError")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP Error {status}")
+        self.status = status
+
+
+def _wrapped(cause: BaseException) -> DownloadError:
+    """Как yt-dlp: ExtractorError с cause внутри DownloadError с exc_info."""
+    try:
+        raise ExtractorError("Unable to download webpage", cause=cause)
+    except ExtractorError as e:
+        import sys
+
+        return DownloadError(f"ERROR: {e}", sys.exc_info())
+
+
+@pytest.mark.parametrize(
+    "exc, reason",
+    [
+        (NewConnectionError("refused"), "network"),
+        (NameResolutionError("dns"), "network"),
+        (ConnectionResetError(), "network"),
+        (ConnectTimeoutError("slow"), "timeout"),
+        (ReadTimeoutError("slow"), "timeout"),
+        (TimeoutError(), "timeout"),
+        (HTTPError(404), "not_found"),
+        (HTTPError(429), "rate_limited"),
+        (HTTPError(503), "upstream"),
+        (GeoRestrictedError("geo"), "restricted"),
+        (UnsupportedError("https://example.com"), "unsupported"),
+        (ValueError("boom"), "other"),
+    ],
+)
+def test_classify_types(exc, reason):
+    assert classify(exc) == reason
+
+
+@pytest.mark.parametrize(
+    "text, reason",
+    [
+        ("ERROR: [TikTok] 1: Unable to download webpage: HTTP Error 404: Not Found", "not_found"),
+        ("ERROR: HTTP Error 429: Too Many Requests", "rate_limited"),
+        ("ERROR: HTTP Error 502: Bad Gateway", "upstream"),
+        ("ERROR: This video may be inappropriate for some users", "restricted"),
+        ("ERROR: Requested format is not available", "unsupported"),
+        ("ERROR: Read timed out.", "timeout"),
+        ("ERROR: [Errno 104] Connection reset by peer", "network"),
+        ("ERROR: something odd", "other"),
+    ],
+)
+def test_classify_text(text, reason):
+    assert classify(DownloadError(text)) == reason
+
+
+def test_classify_walks_cause_chain():
+    assert classify(_wrapped(NameResolutionError("dns"))) == "network"
+    assert classify(_wrapped(HTTPError(410))) == "not_found"
+
+
+def test_classify_specific_beats_generic():
+    # 404 в тексте и таймаут в причине: «видео нет» важнее
+    e = DownloadError("ERROR: HTTP Error 404: Not Found")
+    e.__cause__ = TimeoutError()
+    assert classify(e) == "not_found"
+
+
+def test_classify_download_failed_keeps_reason():
+    assert classify(DownloadFailed("too_large", "big")) == "too_large"
+    assert classify(PlatformUnavailable("tiktok", 5)) == "unavailable"
+
+
+def test_errors_pickle():
+    e = pickle.loads(pickle.dumps(DownloadFailed("timeout", "slow", "tiktok")))
+    assert (e.reason, str(e), e.platform, e.transient) == ("timeout", "slow", "tiktok", True)
+    e = pickle.loads(pickle.dumps(PlatformUnavailable("instagram", 12.0)))
+    assert (e.reason, e.platform, e.retry_in) == ("unavailable", "instagram", 12.0)
+
+
+def test_platform_unavailable_message():
+    assert "circuit open for 12s" in str(PlatformUnavailable("tiktok", 12.0))
+    assert "probe in flight" in str(PlatformUnavailable("tiktok", 0))
+
+
+def test_backoff_bounds():
+    for attempt in range(1, 8):
+        delay = min(10.0, 1.0 * 2 ** (attempt - 1))
+        assert delay / 2 <= backoff(attempt, 1.0, 10.0) <= delay
+
+
+def test_breaker_opens_after_threshold():
+    b = CircuitBreaker("test-open", threshold=3, cooldown=60)
+    for _ in range(2):
+        assert b.allow()
+        b.record_failure()
+    assert b.state == "closed"
+    b.record_failure()
+    assert b.state == "open"
+    assert not b.allow()
+    assert 0 < b.retry_in() <= 60
+
+
+def test_breaker_success_resets_failures():
+    b = CircuitBreaker("test-reset", threshold=2, cooldown=60)
+    b.record_failure()
+    b.record_success()
+    b.record_failure()
+    assert b.state == "closed"
+
+
+def test_breaker_half_open_single_probe():
+    b = CircuitBreaker("test-probe", threshold=1, cooldown=0.01)
+    b.record_failure()
+    assert b.state == "open"
+    time.sleep(0.02)
+
+    assert b.allow()
+    assert b.state == "half_open"
+    # Пока проба не закончилась, остальные задачи отклоняются
+    assert not b.allow()
+    assert b.retry_in() == 0
+
+    b.release()
+    assert b.allow()
+    b.record_success()
+    assert b.state == "closed"
+    assert b.allow() and b.allow()
+
+
+def test_breaker_half_open_failure_reopens():
+    b = CircuitBreaker("test-reopen", threshold=5, cooldown=0.01)
+    for _ in range(5):
+        b.record_failure()
+    time.sleep(0.02)
+    assert b.allow()
+    b.record_failure()
+    assert b.state == "open"
+
+
+def test_upstream_health_breaker_per_platform():
+    health = UpstreamHealth(threshold=1, cooldown=60)
+    assert health.breaker("tiktok") is health.breaker("tiktok")
+    assert health.breaker(None) is health.breaker("other")
+    health.breaker("tiktok").record_failure()
+    assert not health.breaker("tiktok").allow()
+    assert health.breaker("instagram").allow()
@@ -0,0 +1,90 @@
+import pytest
+from aiogram.types import MessageEntity
+
+from app.utils.urls import entity_urls, is_allowed_url, normalize_url, video_key
+
+
+def _entity(text: str, part: str, type_: str = "url", url=None) -> MessageEntity:
+    # Смещения Telegram — в UTF-16
+    start = text.index(part)
+    offset = len(text[:start].encode("utf-16-le")) // 2
+    length = len(part.encode("utf-16-le")) // 2
+    return MessageEntity(type=type_, offset=offset, length=length, url=url)
+
+
+def test_entity_urls_utf16_offsets():
+    text = "🔥🔥 смотри https://www.tiktok.com/@u/video/1 и 🎬 vm.tiktok.com/ZM123/"
+    entities = [
+        _entity(text, "https://www.tiktok.com/@u/video/1"),
+        _entity(text, "vm.tiktok.com/ZM123/"),
+    ]
+    assert entity_urls(text, entities) == [
+        "https://www.tiktok.com/@u/video/1",
+        "https://vm.tiktok.com/ZM123/",
+    ]
+
+
+def test_entity_urls_text_link_and_dedup():
+    text = "вот это и вот https://www.instagram.com/reel/Cabc/"
+    entities = [
+        _entity(text, "вот это", "text_link", url="https://www.instagram.com/reel/Cabc/"),
+        _entity(text, "и", "bold"),
+        _entity(text, "https://www.instagram.com/reel/Cabc/"),
+    ]
+    assert entity_urls(text, entities) == ["https://www.instagram.com/reel/Cabc/"]
+
+
+@pytest.mark.parametrize("text, entities", [(None, None), ("text", None), ("", []), ("text", [])])
+def test_entity_urls_empty(text, entities):
+    assert entity_urls(text, entities) == []
+
+
+@pytest.mark.parametrize(
+    "url, key",
+    [
+        ("https://www.tiktok.com/@user/video/7300000000000000001?is_from_webapp=1", ("tiktok", "7300000000000000001")),
+        ("https://tiktok.com/@user/video/42", ("tiktok", "42")),
+        ("https://www.instagram.com/reel/C1a-B_c/?igsh=xyz", ("instagram", "C1a-B_c")),
+        ("https://instagram.com/reels/C1aBc/", ("instagram", "C1aBc")),
+        ("https://vm.tiktok.com/ZM123/", None),
+        ("https://www.instagram.com/p/C1aBc/", None),
+        ("https://example.com/video/1", None),
+    ],
+)
+def test_video_key(url, key):
+    assert video_key(url) == key
+
+
+@pytest.mark.parametrize(
+    "url, normalized",
+    [
+        (
+            "https://TikTok.com/@user/video/42?is_from_webapp=1&sender_device=pc#comments",
+            "https://www.tiktok.com/@user/video/42",
+        ),
+        ("http://instagram.com/reel/Cabc/?igsh=xyz&foo=bar", "https://www.instagram.com/reel/Cabc/"),
+        ("https://vm.tiktok.com/ZM123/?utm_source=copy&_r=1&lang=en", "https://vm.tiktok.com/ZM123/?lang=en"),
+        ("  https://www.tiktok.com/t/ZT9/  ", "https://www.tiktok.com/t/ZT9/"),
+    ],
+)
+def test_normalize_url(url, normalized):
+    assert normalize_url(url) == normalized
+
+
+def test_normalize_url_idempotent():
+    url = normalize_url("https://vm.tiktok.com/ZM123/?utm_source=copy&lang=en")
+    assert normalize_url(url) == url
+
+
+@pytest.mark.parametrize(
+    "url, allowed",
+    [
+        ("https://www.tiktok.com/@u/video/1", True),
+        ("https://vt.tiktok.com/ZS1/", True),
+        ("https://www.instagram.com/reel/Cabc/", True),
+        ("https://www.instagram.com/p/Cabc/", False),
+        ("https://youtube.com/watch?v=1", False),
+    ],
+)
+def test_is_allowed_url(url, allowed):
+    assert is_allowed_url(url) is allowed
@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+from typing import List, Optional
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendVideo
+from aiogram.types import Message
+
+from app.services.file_id_cache import FileIdCache
+from app.services.upstream_health import DownloadFailed
+from handlers.video import VideoRouter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class _Bot:
+    """Заглушка Bot: запоминает отправки; file_id из bad_file_ids Telegram «не знает»."""
+
+    def __init__(self, bad_file_ids=()):
+        self.bad_file_ids = set(bad_file_ids)
+        self.videos: List[object] = []
+        self.albums: List[list] = []
+        self.texts: List[str] = []
+        self.deleted: List[int] = []
+        self._ids = itertools.count(100)
+
+    def _message(self, file_id: Optional[str] = None):
+        n = next(self._ids)
+        return SimpleNamespace(message_id=n, video=SimpleNamespace(file_id=file_id or f"file-{n}"))
+
+    async def send_video(self, video, **kwargs):
+        if isinstance(video, str) and video in self.bad_file_ids:
+            raise TelegramBadRequest(method=SendVideo(chat_id=kwargs["chat_id"], video=video), message="wrong file identifier")
+        self.videos.append(video)
+        return self._message(video if isinstance(video, str) else None)
+
+    async def send_media_group(self, media, **kwargs):
+        self.albums.append(media)
+        return [self._message() for _ in media]
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.texts.append(text)
+
+    async def delete_message(self, chat_id, message_id):
+        self.deleted.append(message_id)
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        pass
+
+
+class _Downloader:
+    """Заглушка DownloadVideo: видео из памяти; ссылки из failing падают с заданной ошибкой."""
+
+    streaming = False
+
+    def __init__(self, failing=None):
+        self.failing = failing or {}
+        self.downloads: List[str] = []
+        self.released: List[dict] = []
+
+    async def download(self, url, *, chat_id=None, user_id=None, info=None):
+        self.downloads.append(url)
+        if url in self.failing:
+            raise self.failing[url]
+        return {"filepath": "/tmp/v.mp4", "data": b"video", "staged_bytes": 5, "platform": "tiktok", "id": url[-1]}
+
+    def release(self, res: dict) -> None:
+        self.released.append(res)
+
+
+def _router(downloader=None, file_ids=None) -> VideoRouter:
+    return VideoRouter(downloader=downloader or _Downloader(), file_ids=file_ids)
+
+
+def _job(*urls: str, message_id: Optional[int] = 1) -> dict:
+    job = {
+        "url": urls[0],
+        "chat_id": 1,
+        "chat_type": "private",
+        "user_id": 1,
+        "message_id": message_id,
+        "reply_thread_id": None,
+        "send_kwargs": {"chat_id": 1, "caption": "c"},
+    }
+    if len(urls) > 1:
+        job["album"] = [{"url": u, "caption": f"c {u}"} for u in urls]
+    return job
+
+
+TT1 = "https://www.tiktok.com/@u/video/1"
+TT2 = "https://www.tiktok.com/@u/video/2"
+TT3 = "https://www.tiktok.com/@u/video/3"
+
+
+def test_cache_hit_skips_download():
+    async def main():
+        downloader, file_ids, bot = _Downloader(), FileIdCache(), _Bot()
+        await file_ids.set(("tiktok", "1"), "cached")
+        result = await _router(downloader, file_ids).deliver(bot, _job(TT1))
+        assert result["ok"] and result["source"] == "file_id"
+        assert bot.videos == ["cached"]
+        assert downloader.downloads == []
+
+    run(main())
+
+
+def test_stale_file_id_evicted_and_redownloaded():
+    async def main():
+        downloader, file_ids, bot = _Downloader(), FileIdCache(), _Bot(bad_file_ids={"stale"})
+        await file_ids.set(("tiktok", "1"), "stale")
+        result = await _router(downloader, file_ids).deliver(bot, _job(TT1))
+
+        assert result["ok"] and result["source"] == "memory"
+        assert downloader.downloads == [TT1]
+        # Протухший file_id заменён свежим от Telegram
+        assert await file_ids.get(("tiktok", "1")) == "file-100"
+        assert len(downloader.released) == 1
+
+    run(main())
+
+
+def test_album_partial_failure():
+    async def main():
+        downloader = _Downloader(failing={TT2: DownloadFailed("not_found", "gone", "tiktok")})
+        bot = _Bot()
+        result = await _router(downloader).deliver(bot, _job(TT1, TT2, TT3))
+
+        # Что скачалось — одним альбомом, с подписью у каждого видео
+        assert len(bot.albums) == 1
+        assert [m.caption for m in bot.albums[0]] == [f"c {TT1}", f"c {TT3}"]
+        assert result["ok"] and len(result["message_ids"]) == 2
+        assert result["failed"] == [{"url": TT2, "reason": "not_found", "error": "⚠️ Видео не найдено или было удалено."}]
+        # Неудачная ссылка — в ответе, исходное сообщение удалено
+        assert len(bot.texts) == 1
+        assert bot.texts[0].startswith("⚠️ Не удалось отправить 1 из 3 видео:")
+        assert TT2 in bot.texts[0]
+        assert bot.deleted == [1]
+        assert len(downloader.released) == 2
+
+    run(main())
+
+
+def test_album_single_survivor_sent_as_video():
+    async def main():
+        failing = {TT2: DownloadFailed("restricted", "geo", "tiktok")}
+        bot = _Bot()
+        result = await _router(_Downloader(failing)).deliver(bot, _job(TT1, TT2))
+        # Альбом из одного видео Telegram не примет
+        assert bot.albums == [] and len(bot.videos) == 1
+        assert result["ok"] and [f["reason"] for f in result["failed"]] == ["restricted"]
+
+    run(main())
+
+
+def test_album_all_failed():
+    async def main():
+        failing = {u: DownloadFailed("not_found", "gone", "tiktok") for u in (TT1, TT2)}
+        bot = _Bot()
+        result = await _router(_Downloader(failing)).deliver(bot, _job(TT1, TT2))
+        assert not result["ok"] and result["reason"] == "not_found"
+        assert bot.texts[0].startswith("⚠️ Не удалось отправить 2 из 2 видео:")
+        # Ничего не отправлено — сообщение со ссылками остаётся
+        assert bot.deleted == []
+
+    run(main())
+
+
+def test_album_transient_failure_retried_from_queue():
+    async def main():
+        failing = {u: DownloadFailed("timeout", "slow", "tiktok") for u in (TT1, TT2)}
+        bot = _Bot()
+        with pytest.raises(DownloadFailed):
+            await _router(_Downloader(failing)).deliver(bot, _job(TT1, TT2), final=False)
+        assert bot.texts == []
+
+    run(main())
+
+
+def test_album_stale_file_id_redownloaded():
+    async def main():
+        downloader, file_ids = _Downloader(), FileIdCache()
+        await file_ids.set(("tiktok", "1"), "stale")
+        bot = _Bot()
+        calls = []
+        send_media_group = bot.send_media_group
+
+        async def reject_stale(media, **kwargs):
+            calls.append([m.media for m in media])
+            if "stale" in calls[-1]:
+                raise TelegramBadRequest(method=SendVideo(chat_id=1, video="stale"), message="wrong file identifier")
+            return await send_media_group(media, **kwargs)
+
+        bot.send_media_group = reject_stale
+        result = await _router(downloader, file_ids).deliver(bot, _job(TT1, TT2))
+
+        assert result["ok"] and len(result["message_ids"]) == 2
+        assert sorted(downloader.downloads) == [TT1, TT2]
+        assert await file_ids.get(("tiktok", "1")) != "stale"
+
+    run(main())
+
+
+def test_caption_post_not_deleted():
+    async def main():
+        bot = _Bot()
+        job = dict(_job(TT1), delete_source=False)
+        assert (await _router().deliver(bot, job))["ok"]
+        album = dict(_job(TT1, TT2), delete_source=False)
+        assert (await _router().deliver(bot, album))["ok"]
+        assert bot.deleted == []
+
+    run(main())
+
+
+def _message(bot: _Bot, **content) -> Message:
+    m = Message.model_validate({
+        "message_id": 5,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "u", "username": "u"},
+        **content,
+    })
+    return m.as_(bot)
+
+
+def test_handle_url_deletes_text_message_only():
+    async def main():
+        bot = _Bot()
+        await _router().handle_url(_message(bot, text=TT1))
+        assert len(bot.videos) == 1 and bot.deleted == [5]
+
+        bot = _Bot()
+        photo = [{"file_id": "p", "file_unique_id": "p", "width": 1, "height": 1}]
+        await _router().handle_url(_message(bot, photo=photo, caption=TT1))
+        # Ссылка в подписи к фото: видео отправлено, пост пользователя на месте
+        assert len(bot.videos) == 1 and bot.deleted == []
+
+    run(main())